@@ -7,13 +7,14 @@ from ELDAmwl.errors.exceptions import BscCalParamsNotEqual
 from ELDAmwl.signals import Signals
 from ELDAmwl.tests.pickle_data import write_test_data
 from ELDAmwl.utils.constants import RBSC, NC_FILL_INT
-from ELDAmwl.utils.numerical import calc_rolling_means_sems, m_to_km, km_to_m
 from ELDAmwl.utils.numerical import find_minimum_window
+from ELDAmwl.utils.numerical import m_to_km, km_to_m
+from ELDAmwl.utils.numerical import rolling_means_sems
 
 from rayleigh_fit.rfit_SCC import r_fit
 
+import multiprocessing
 import numpy as np
-import pandas as pd
 import xarray as xr
 
 
@@ -142,80 +143,123 @@ class FindBscCalibrWindow(BaseOperation):
         return da
 
 
+def rayleigh_fit_time_slice(task):
+    """runs the Rayleigh fit of one time slice of a signal for all window widths
+
+    This is a module level function, so that it can be run in worker processes.
+
+    Args:
+        task (addict.Dict): with keys 'input_data' (input of r_fit), 'start_height' and
+            'top_height' (bottom and top of the search range [km]), and 'window_widths' [km]
+
+    Returns:
+        dict with window widths as keys and DataFrames with the valid fit results as values
+    """
+    fit_results = r_fit(task.input_data,
+                        lower_range_limit_r=task.start_height,
+                        upper_range_limit_r=task.top_height,
+                        windows=task.window_widths,
+                        rsem_min=0.1,
+                        extended_output=True)
+
+    # ==== generate test output ====
+    # res = r_fit(input_data,
+    #               lower_range_limit_r=start_height, upper_range_limit_r=top_height,
+    #               windows=self.window_widths, rsem_min=0.1)
+    # output for origin indeces
+    # res.fit_rangebin, res.fit_window_rangebins, int(res.fit_rangebin - res.fit_window_rangebins/2)+2, int(res.fit_rangebin + res.fit_window_rangebins /2)+2
+
+    result = {}
+    for w in task.window_widths:
+        df = fit_results.profiles[w]
+        result[w] = df[df.ALL == 1]
+        # ==== generate test output ====
+        # df[df.ALL == 1].to_csv('flags.csv')
+    return result
+
+
 class FindBscCalibrWindowWithRaylFit(FindBscCalibrWindow):
     """find bsc calibration windows with Rayleigh fit
 
+    The Rayleigh fits of all elastic channels and time slices are independent
+    of each other. If cfg.PARALLEL is True, they are run in a pool of cfg.NUM_CPU
+    worker processes. The results are collected in the order of the fits, therefore,
+    they do not depend on the execution mode.
     """
 
     name = 'FindBscCalibrWindowWithRaylFit'
     all_results = None
-    channels = []
-    bad_channels = []
-    window_widths = []
+    channels = None
+    bad_channels = None
+    window_widths = None
     window_width_default = None
     time_dim = 0
     elast_signals = None
 
-    def run_a_rayl_fit(self, sig):
-        channel_id = sig.channel_id_str
-
-        if channel_id not in self.all_results.keys():
-
-            # the Rayleigh fit routine expects as input:
-            #   * range axis in km
-            #   * background corrected signal (not range corrected)
-            #   * Rayleigh backscatter signal which is attenuated by molecular scattering and 1/r² dependency
-
-            range_axes = m_to_km(sig.range)
-            range_sqr = range_axes ** 2
-            range_res = (range_axes[:, 1] - range_axes[:, 0])
-
-            rayl_ext = sig.ds.mol_extinction
-            transm_up = sig.ds.mol_trasm_at_emission_wl
-            transm_down = sig.ds.mol_trasm_at_detection_wl
-            rayl_lr = sig.ds.mol_lidar_ratio
-            attn_rayl_bsc = rayl_ext * transm_up * transm_down / rayl_lr / range_sqr
-            signal = sig.data / range_sqr
-
-            # ==== generate test output ====
-            # (rayl_ext * transm_up * transm_down / rayl_lr)[0].to_dataframe(name='rayl_bsc').to_csv('dummy.csv')
-            # sig.data[0].to_dataframe(name='signal').to_csv('dummy.csv')
-
-            for t in range(sig.ds.dims['time']):
-                input_data = Dict({'r': range_axes.values[t],
-                                   'raylSig': attn_rayl_bsc.values[t],
-                                   'Signal': signal.values[t],
-                                   'rangebin': range_res.values[t],
-                                   })
-
-                start_height = m_to_km(self.calibration_params.cal_interval.min_height)
-                top_height = m_to_km(self.calibration_params.cal_interval.max_height)
-                self.window_width_default = m_to_km(self.calibration_params.window_width)
-
-                # if the required window width is not in the predefined list -> add it
-                self.window_widths = self.cfg.window_widths
-                if not self.window_width_default in self.window_widths:
-                    self.window_widths = self.window_widths.append(self.window_width_default)
-
-                fit_results = r_fit(input_data,
-                                    lower_range_limit_r=start_height,
-                                    upper_range_limit_r=top_height,
-                                    windows=self.window_widths,
-                                    rsem_min=0.1,
-                                    extended_output=True)
-
-                # ==== generate test output ====
-                # res = r_fit(input_data,
-                #               lower_range_limit_r=start_height, upper_range_limit_r=top_height,
-                #               windows=self.window_widths, rsem_min=0.1)
-                # output for origin indeces
-                # res.fit_rangebin, res.fit_window_rangebins, int(res.fit_rangebin - res.fit_window_rangebins/2)+2, int(res.fit_rangebin + res.fit_window_rangebins /2)+2
-
-                for w in self.window_widths:
-                    df = fit_results.profiles[w]
-                    self.all_results[w][channel_id][t] = df[df.ALL == 1]
-                    # ==== generate test output ====
-                    # df[df.ALL == 1].to_csv('flags.csv')
+    def rayl_fit_tasks(self, sig):
+        """prepares the Rayleigh fits of all time slices of a signal
+
+        Returns:
+            list with one task (addict.Dict) per time slice, see :func:`rayleigh_fit_time_slice`
+        """
+        # the Rayleigh fit routine expects as input:
+        #   * range axis in km
+        #   * background corrected signal (not range corrected)
+        #   * Rayleigh backscatter signal which is attenuated by molecular scattering and 1/r² dependency
+
+        range_axes = m_to_km(sig.range)
+        range_sqr = range_axes ** 2
+        range_res = (range_axes[:, 1] - range_axes[:, 0])
+
+        rayl_ext = sig.ds.mol_extinction
+        transm_up = sig.ds.mol_trasm_at_emission_wl
+        transm_down = sig.ds.mol_trasm_at_detection_wl
+        rayl_lr = sig.ds.mol_lidar_ratio
+        attn_rayl_bsc = rayl_ext * transm_up * transm_down / rayl_lr / range_sqr
+        signal = sig.data / range_sqr
+
+        # ==== generate test output ====
+        # (rayl_ext * transm_up * transm_down / rayl_lr)[0].to_dataframe(name='rayl_bsc').to_csv('dummy.csv')
+        # sig.data[0].to_dataframe(name='signal').to_csv('dummy.csv')
+
+        start_height = m_to_km(self.calibration_params.cal_interval.min_height)
+        top_height = m_to_km(self.calibration_params.cal_interval.max_height)
+        self.window_width_default = m_to_km(self.calibration_params.window_width)
+
+        # if the required window width is not in the predefined list -> add it
+        self.window_widths = list(self.cfg.window_widths)
+        if self.window_width_default not in self.window_widths:
+            self.window_widths.append(self.window_width_default)
+
+        tasks = []
+        for t in range(sig.ds.dims['time']):
+            input_data = Dict({'r': range_axes.values[t],
+                               'raylSig': attn_rayl_bsc.values[t],
+                               'Signal': signal.values[t],
+                               'rangebin': range_res.values[t],
+                               })
+            tasks.append(Dict({'input_data': input_data,
+                               'start_height': start_height,
+                               'top_height': top_height,
+                               'window_widths': self.window_widths}))
+        return tasks
+
+    def run_rayl_fits(self, tasks):
+        """runs the Rayleigh fits, in parallel if cfg.PARALLEL is True
+
+        Returns:
+            list with the results of :func:`rayleigh_fit_time_slice` in the order of the tasks
+        """
+        # worker processes of the batch mode or the service are daemons and cannot have a pool
+        if self.cfg.get('PARALLEL', False) and len(tasks) > 1 and not multiprocessing.current_process().daemon:
+            if 'fork' in multiprocessing.get_all_start_methods():
+                context = multiprocessing.get_context('fork')
+            else:
+                context = multiprocessing.get_context()
+            with context.Pool(min(self.cfg.NUM_CPU, len(tasks))) as pool:
+                return pool.map(rayleigh_fit_time_slice, tasks)
+
+        return [rayleigh_fit_time_slice(task) for task in tasks]
 
     def check_results_of_channel(self, channel):
         w = 0
@@ -231,70 +275,87 @@ class FindBscCalibrWindowWithRaylFit(FindBscCalibrWindow):
             self.bad_channels.append(channel)
 
     def find_best_compromise(self):
+        """finds for each time slice the calibration window which is valid for all channels
+
+        The first window width (default width first) with common valid ranges in all channels is used.
+        Within them, the range with the lowest mean of the combined flag 'Comb' is the best one.
+
+        Returns:
+            win_center_ranges, win_widths (np.array (time)): center ranges and widths [m] of the windows
+        """
         win_center_ranges = np.ones(self.time_dim) * np.nan
         win_widths = np.ones(self.time_dim) * np.nan
 
         # check if one channel has no results at all
         for channel in self.channels:
             self.check_results_of_channel(channel)
-        use_channels = list(set(self.channels).difference(set(self.bad_channels)))
-
-        first_chan = use_channels[0]
-
-        for t in range(self.time_dim):
-            # 1) try to find a common calibration for default window width
-            wwidth = self.window_width_default
-            valid_heights = set(self.all_results[wwidth][first_chan][t].range)
-            for channel in use_channels[1:]:
-                valid_heights.intersection_update(set(self.all_results[wwidth][channel][t].range))
-
-            if len(valid_heights) == 0:
-                self.logger.warning(f'could not find calibration for time slice {t} and window width {wwidth}')
-
-                # 2) if not successful, try all other window widths
-                w = 0
-                while (len(valid_heights) == 0) and w < len(self.window_widths):
-                    wwidth = self.window_widths[w]
-                    valid_heights = set(self.all_results[wwidth][first_chan][t].range)
-                    for channel in use_channels[1:]:
-                        valid_heights.intersection_update(set(self.all_results[wwidth][channel][t].range))
-                    w += 1
-
-            if len(valid_heights) == 0:
-                self.logger.warning(f'could not find any calibration for time slice {t}')
-            else:
-                # if overlapping calibration heights were found
-                # -> find the height bin with the lowest average value of rsem
-                valid_data = []
-                for channel in self.channels:
-                    df = self.all_results[wwidth][channel][t]
-                    valid_data.append(df[df['range'].isin(list(valid_heights))]['Comb'])
-                # ==== generate test output ====
-                # valid_data = {}
-                # for channel in self.channels:
-                #     df = self.all_results[wwidth][channel][t]
-                #     valid_data[channel] = df[df['range'].isin(list(valid_heights))]['Comb']
-                # valid_data['height'] = list(valid_heights)
-                # pd.DataFrame(valid_data).to_csv('/home/ina/workspace/temp/flags_comb.csv')
-
-                best_idx = pd.concat(valid_data, axis=1, keys=self.channels).mean(axis=1).idxmin()
-                win_center_ranges[t] = km_to_m(float(df[df.index == best_idx]['range']))
-                win_widths[t] = km_to_m(wwidth)
+        use_channels = [channel for channel in dict.fromkeys(self.channels) if channel not in self.bad_channels]
+
+        # window widths in the order in which they are tried
+        widths = [self.window_width_default] + list(self.window_widths)
+
+        # all ranges with valid fits
+        ranges = np.unique(np.concatenate(
+            [np.empty(0)] + [self.all_results[w][channel][t]['range'].values
+                             for w in widths for channel in use_channels for t in range(self.time_dim)]))
+
+        # comb[width, channel, time, range] = value of 'Comb', nan if there is no valid fit
+        comb = np.full((len(widths), len(use_channels), self.time_dim, ranges.size), np.nan)
+        for w_idx, w in enumerate(widths):
+            for c_idx, channel in enumerate(use_channels):
+                for t in range(self.time_dim):
+                    df = self.all_results[w][channel][t]
+                    comb[w_idx, c_idx, t, np.searchsorted(ranges, df['range'].values)] = df['Comb'].values
+
+        # ranges which have valid fits in all channels
+        common = np.all(~np.isnan(comb), axis=1)
+        has_common = np.any(common, axis=2)
+        found = np.any(has_common, axis=0)
+
+        for t in np.where(~has_common[0])[0]:
+            self.logger.warning(f'could not find calibration for time slice {t} and window width {widths[0]}')
+        for t in np.where(~found)[0]:
+            self.logger.warning(f'could not find any calibration for time slice {t}')
+
+        if np.any(found):
+            # the first window width with overlapping calibration ranges
+            # -> find the range bin with the lowest average value of Comb
+            ts = np.where(found)[0]
+            w_idx = np.argmax(has_common[:, ts], axis=0)
+            mean_comb = np.where(common[w_idx, ts], np.mean(comb[w_idx, :, ts], axis=1), np.inf)
+            best_idx = np.argmin(mean_comb, axis=1)
+
+            win_center_ranges[ts] = km_to_m(ranges[best_idx])
+            win_widths[ts] = km_to_m(np.array(widths)[w_idx])
 
         return win_center_ranges, win_widths
 
     def get_all_single_fits(self):
         self.all_results = Dict()
         self.elast_signals = Dict()
+        self.channels = []
+        self.bad_channels = []
 
+        tasks = []
+        task_ids = []
         for bp in self.bsc_params:
             sigs = self.data_storage.elpp_signals(bp.prod_id_str)
             for sig in sigs:
                 if sig.is_elast_sig:
                     self.elast_signals[bp] = sig
-                    self.channels.append(sig.channel_id_str)
+                    channel_id = sig.channel_id_str
                     self.time_dim = sig.ds.dims['time']
-                    self.run_a_rayl_fit(sig)
+
+                    # each channel is fitted only once
+                    if channel_id not in self.channels:
+                        sig_tasks = self.rayl_fit_tasks(sig)
+                        tasks.extend(sig_tasks)
+                        task_ids.extend([(channel_id, t) for t in range(len(sig_tasks))])
+                    self.channels.append(channel_id)
+
+        for (channel_id, t), result in zip(task_ids, self.run_rayl_fits(tasks)):
+            for w, df in result.items():
+                self.all_results[w][channel_id][t] = df
 
     def get_cal_height_windows(self, bp, win_center_ranges, win_widths):
 
@@ -377,11 +438,12 @@ class FindBscCalibrWindowAsInELDA(FindBscCalibrWindow):
         # get the parameters for the rolling mean calculation
         data_set, w_width, error_threshold = self.get_calibr_window_properties(bsc_param)
 
-        # calculate the rolling means and standard errors of the means (sems) with the given window properties
-        means, sems = calc_rolling_means_sems(data_set, w_width)
+        # calculate the rolling means and relative standard errors of the means (sems)
+        # with the given window properties (all time slices at once, also if the window widths differ)
+        means, sems, rel_sems = rolling_means_sems(data_set.data.values, w_width[:, 0])
 
         # find the min/max indexes of the window with the minimum data
-        win_first_idx, win_last_idx = find_minimum_window(means, sems, w_width, error_threshold)
+        win_first_idx, win_last_idx = find_minimum_window(means, rel_sems, w_width, error_threshold)
 
         # Create a calibration window from win_first_idx, win_last_idx
         calibration_window = self.create_calibration_window_dataarray(data_set, win_first_idx, win_last_idx, None, None)
@@ -6,8 +6,7 @@ from ELDAmwl.component.registry import registry
 from ELDAmwl.errors.exceptions import NoValidDataPointsForCalibration, IntegrationFailed
 from ELDAmwl.rayleigh import RayleighLidarRatio
 from ELDAmwl.utils.constants import NC_FILL_INT, ABOVE_KLETT_REF
-from ELDAmwl.utils.numerical import closest_bin
-from ELDAmwl.utils.numerical import integral_profile
+from ELDAmwl.utils.numerical import integral_profiles
 
 import numpy as np
 import xarray as xr
@@ -74,6 +73,8 @@ class CalcBscProfileKF(BaseOperation):
             range_axis = elast_sig.altitude
 
         num_times = elast_sig.dims['time']
+        num_levels = elast_sig.dims['level']
+        levels = np.arange(num_levels)
 
         # calculate difference profile between particle and Rayleigh lidar ratio
         lidar_ratio = elast_sig.assumed_particle_lidar_ratio
@@ -83,89 +84,75 @@ class CalcBscProfileKF(BaseOperation):
         calibr_factor = np.ones(num_times) * np.nan
         calibr_bin = np.ones(num_times, dtype=int) * NC_FILL_INT
         calibr_factor_err = np.ones(num_times) * np.nan
-        # sqr_rel_calibr_err = np.ones(times) * np.nan
         M = np.full(rayl_bsc.shape, np.nan)
         A = np.full(rayl_bsc.shape, np.nan)
         A_int = np.full(rayl_bsc.shape, np.nan)
         B = np.full(rayl_bsc.shape, np.nan)
         B_err = np.full(rayl_bsc.shape, np.nan)
 
-        for t in range(num_times):
-            # 1) calculate calibration factor
-            if calibration['cal_first_lev'][t] == NC_FILL_INT:
-                # if there is no valid calibration height -> fill with nan
-                B[t] = np.nan
-                A[t] = np.nan
-            else:
-                # convert elast_sig.ds (xr.Dataset) into pd.Dataframe for easier selection of calibration window
-                df_sig = elast_sig.data.isel(
-                    {'level': range(calibration['cal_first_lev'][t],
-                                    calibration['cal_last_lev'][t] + 1),
-                     'time': t})\
-                    .to_dataframe()
-                mean_sig = df_sig.data.mean()
-                sem_sig = df_sig.data.sem()
-                rel_sem_sig = sem_sig / mean_sig
-
-                df_rayl = rayl_bsc.isel({'level':
-                                        range(calibration['cal_first_lev'][t],
-                                              calibration['cal_last_lev'][t] + 1),
-                                         'time': t})\
-                    .to_dataframe()
-                mean_rayl_bsc = df_rayl.mol_backscatter.mean()
-                # assume that rayleigh backscatter has no uncertainty
-
-                if rel_sem_sig > error_params.err_threshold.highrange:
-                    self.logger.error('relative error of signal in calibration window is larger than error threshold')
-                    raise NoValidDataPointsForCalibration
-
-                else:
-                    calibr_factor[t] = mean_sig / mean_rayl_bsc / calibration.calibr_value.value
-                    calibr_factor_err[t] = calibr_factor[t] * \
-                        np.sqrt(np.square(rel_sem_sig) + np.square(calibration.calibr_value.rel_error))
-
-                # 2) find signal bin which has the value closest to the mean of the calibration window
-                cb = closest_bin(
-                    elast_sig.data[t].values,
-                    # error=elast_sig.err[t].values,
-                    first_bin=calibration['cal_first_lev'][t],
-                    last_bin=calibration['cal_last_lev'][t] + 1,
-                    # search_value=mean_sig,
-                    )
-                if cb is None:
-                    self.logger.error('cannot find altitude bin close enough to mean signal within calibration window')
-                    return None
-                else:
-                    calibr_bin[t] = cb
-
-                # 3) calculate M, A, A_int, B, and B_err
-                try:
-                    M[t, calibr_bin[t]:] = integral_profile(rayl_bsc[t].values,
-                                                            range_axis=range_axis[t].values,
-                                                            first_bin=calibr_bin[t])
-                    M[t, :calibr_bin[t] + 1] = integral_profile(rayl_bsc[t].values,
-                                                                range_axis=range_axis[t].values,
-                                                                first_bin=calibr_bin[t],
-                                                                last_bin=0)
-
-                    M[t, calibr_bin[t]] = 0
-
-                    A[t] = elast_sig.data[t] * np.exp(-2 * lr_diff[t] * M[t])
-                    A_int[t, calibr_bin[t]:] = integral_profile(A[t],
-                                                                range_axis=range_axis[t].values,
-                                                                first_bin=calibr_bin[t])
-                    A_int[t, :calibr_bin[t] + 1] = integral_profile(A[t],
-                                                                    range_axis=range_axis[t].values,
-                                                                    extrapolate_ovl_factor=1,
-                                                                    first_bin=calibr_bin[t],
-                                                                    last_bin=0)
-
-                    A_int[t, calibr_bin[t]] = 0
-
-                    B[t, :] = calibr_factor[t]
-                    B_err[t, :] = calibr_factor_err[t]
-                except IntegrationFailed:
-                    return None
+        # all time slices are processed at once.
+        # time slices without valid calibration height remain nan
+        cal_first_lev = np.asarray(calibration['cal_first_lev'])
+        cal_last_lev = np.asarray(calibration['cal_last_lev'])
+        ts = np.where(cal_first_lev != NC_FILL_INT)[0]
+
+        sig = elast_sig.data.values[ts]
+        rayl = rayl_bsc.values[ts]
+        ranges = np.broadcast_to(np.asarray(range_axis), elast_sig.data.shape)[ts]
+        cal_window = (levels >= cal_first_lev[ts, np.newaxis]) & (levels <= cal_last_lev[ts, np.newaxis])
+
+        # 1) calculate calibration factor
+        # mean and standard error of the mean (ddof=1) of the signal in the calibration window
+        win_sig = np.where(cal_window, sig, np.nan)
+        num_points = np.sum(~np.isnan(win_sig), axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean_sig = np.nansum(win_sig, axis=1) / num_points
+            sum_sq_dev = np.nansum(np.square(win_sig - mean_sig[:, np.newaxis]), axis=1)
+            sem_sig = np.sqrt(sum_sq_dev / (num_points - 1) / num_points)
+        rel_sem_sig = sem_sig / mean_sig
+
+        win_rayl = np.where(cal_window & ~np.isnan(rayl), rayl, 0)
+        mean_rayl_bsc = np.sum(win_rayl, axis=1) / np.sum(cal_window & ~np.isnan(rayl), axis=1)
+        # assume that rayleigh backscatter has no uncertainty
+
+        if np.any(rel_sem_sig > error_params.err_threshold.highrange):
+            self.logger.error('relative error of signal in calibration window is larger than error threshold')
+            raise NoValidDataPointsForCalibration
+
+        calibr_factor[ts] = mean_sig / mean_rayl_bsc / calibration.calibr_value.value
+        calibr_factor_err[ts] = calibr_factor[ts] * \
+            np.sqrt(np.square(rel_sem_sig) + np.square(calibration.calibr_value.rel_error))
+
+        # 2) find signal bin which has the value closest to the mean of the calibration window
+        # (as in closest_bin, the first nan bin within the window is taken if there is any)
+        diff = np.where(cal_window, np.absolute(sig - mean_sig[:, np.newaxis]), np.inf)
+        calibr_bin[ts] = np.argmin(diff, axis=1)
+        cb = calibr_bin[ts]
+        below_cb = levels < cb[:, np.newaxis]
+        at_cb = levels == cb[:, np.newaxis]
+
+        # 3) calculate M, A, A_int, B, and B_err
+        # forward integration above and backward integration below the calibration bin
+        try:
+            M_ts = np.where(below_cb,
+                            integral_profiles(rayl, ranges, first_bins=cb, last_bins=0),
+                            integral_profiles(rayl, ranges, first_bins=cb))
+            M_ts[at_cb] = 0
+
+            A_ts = sig * np.exp(-2 * np.broadcast_to(np.asarray(lr_diff), elast_sig.data.shape)[ts] * M_ts)
+            A_int_ts = np.where(below_cb,
+                                integral_profiles(A_ts, ranges, extrapolate_ovl_factor=1,
+                                                  first_bins=cb, last_bins=0),
+                                integral_profiles(A_ts, ranges, first_bins=cb))
+            A_int_ts[at_cb] = 0
+        except IntegrationFailed:
+            return None
+
+        M[ts] = M_ts
+        A[ts] = A_ts
+        A_int[ts] = A_int_ts
+        B[ts] = calibr_factor[ts, np.newaxis]
+        B_err[ts] = calibr_factor_err[ts, np.newaxis]
 
         # 4) calculate backscatter coefficient
         denominator = B - 2 * lidar_ratio * A_int
@@ -180,8 +167,11 @@ class CalcBscProfileKF(BaseOperation):
         bsc['calibration_bin'] = xr.DataArray(calibr_bin,
                                               coords=[bsc.time],
                                               dims=['time'])
-        for t in range(num_times):
-            bsc['qf'][t][calibr_bin[t]:-1] = bsc['qf'][t][calibr_bin[t]:-1] | ABOVE_KLETT_REF
+        # all bins from the calibration bin up to (but not including) the last bin
+        # (as python slices [calibr_bin:-1], with negative fill values counted from the end)
+        start_bin = np.where(calibr_bin < 0, np.maximum(calibr_bin + num_levels, 0), calibr_bin)
+        above_ref = (levels >= start_bin[:, np.newaxis]) & (levels < num_levels - 1)
+        bsc['qf'].values[above_ref] = bsc['qf'].values[above_ref] | ABOVE_KLETT_REF
         return bsc
 
 
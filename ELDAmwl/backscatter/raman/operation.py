@@ -121,14 +121,30 @@ class CalcRamanBackscatterDefault(BaseOperation):
         if data is None:
             data = self.sigratio
 
+        self.result.ds = self.calc_routine.run(
+            sigratio=data.ds,
+            **self.calc_params(data))
+
+        self.result.ds['mol_backscatter'] = deepcopy(data.ds.mol_backscatter)
+        self.profile_qf = deepcopy(data.profile_qf)
+
+        return self.result
+
+    def calc_params(self, data):
+        """extracts relevant parameter for calculation of raman backscatter
+        from BackscatterParams
+
+        Args:
+            data (:class:`ELDAmwl.signals.Signals`): signal ratios
+
+        Returns:
+            addict.Dict with keys 'error_params' and 'calibration'
+        """
         cal_first_lev = data.heights_to_levels(
             self.calibr_window[:, 0])
         cal_last_lev = data.heights_to_levels(
             self.calibr_window[:, 1])
 
-        # extract relevant parameter for calculation of raman backscatter
-        # from BackscatterParams into Dict
-
         calibr_value = DataPoint.from_data(
             self.bsc_params.calibration_params.cal_value, 0, 0)
         cal_params = Dict({'cal_first_lev': cal_first_lev.values,
@@ -139,15 +155,29 @@ class CalcRamanBackscatterDefault(BaseOperation):
                             self.bsc_params.quality_params.error_threshold,
                              })
 
-        self.result.ds = self.calc_routine.run(
-            sigratio=data.ds,
-            error_params=error_params,
-            calibration=cal_params)
+        return Dict({'error_params': error_params,
+                     'calibration': cal_params})
 
-        self.result.ds['mol_backscatter'] = deepcopy(data.ds.mol_backscatter)
-        self.profile_qf = deepcopy(data.profile_qf)
+    def run_samples(self, samples):
+        """run the Raman backscatter calculation for many Monte-Carlo samples at once
 
-        return self.result
+        The calculator class handles the additional sample axis of the signal ratio directly.
+        Samples with too noisy calibration windows are filled with nan.
+
+        Args:
+            samples (np.array): (sample, time, level) varied data of the signal ratio
+
+        Returns:
+            np.array (sample, time, level) with the backscatter coefficients of all samples
+        """
+        sigratio = self.sigratio.ds.copy()
+        sigratio['data'] = (['sample', 'time', 'level'], samples)
+
+        bsc = self.calc_routine.run(
+            sigratio=sigratio,
+            **self.calc_params(self.sigratio))
+
+        return bsc.data.transpose('sample', 'time', 'level').values
 
 
 class RamanBackscatterFactory(BackscatterFactory):
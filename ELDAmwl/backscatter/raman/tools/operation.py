@@ -48,37 +48,29 @@ class CalcRamanBscProfileViaBR(BaseOperation):
         # todo: make BaseOperation for RAYL_LR
 
         # 1) calculate calibration factor
-
-        times = sigratio.dims['time']
-        calibr_factor = np.ones(times) * np.nan
-        calibr_factor_err = np.ones(times) * np.nan
-        sqr_rel_calibr_err = np.ones(times) * np.nan
-
-        for t in range(times):
-            df = sigratio.data.isel({'level':
-                                    range(calibration['cal_first_lev'][t],
-                                          calibration['cal_last_lev'][t]),
-                                     'time': t})\
-                .to_dataframe()
-            mean = df.data.mean()
-            sem = df.data.sem()
-            rel_sem = sem / mean
-
-            if rel_sem > error_params.err_threshold.highrange:
-                raise NoValidDataPointsForCalibration
-
-            else:
-                calibr_factor[t] = calibration.calibr_value.value / mean
-                calibr_factor_err[t] = calibr_factor[t] * \
-                    np.sqrt(np.square(rel_sem) + np.square(calibration.calibr_value.rel_error))
-                sqr_rel_calibr_err[t] = np.square(calibr_factor_err[t] / calibr_factor[t])
-
-        cf = xr.DataArray(calibr_factor,
-                          dims=['time'],
-                          coords=[sigratio.time])
-        sqr_cf_err = xr.DataArray(sqr_rel_calibr_err,
-                                  dims=['time'],
-                                  coords=[sigratio.time])
+        #    the calibration window of each time slice is selected with a mask (time, level)
+        levels = xr.DataArray(np.arange(sigratio.dims['level']), dims=['level'])
+        in_window = (levels >= xr.DataArray(calibration['cal_first_lev'], dims=['time'])) & \
+                    (levels < xr.DataArray(calibration['cal_last_lev'], dims=['time']))
+        window = sigratio.data.where(in_window)
+
+        mean = window.mean('level')
+        sem = window.std('level', ddof=1) / np.sqrt(window.count('level'))
+        rel_sem = sem / mean
+
+        too_noisy = rel_sem > error_params.err_threshold.highrange
+        if 'sample' in too_noisy.dims:
+            # Monte-Carlo samples: only the samples with too noisy calibration windows fail.
+            # They are filled with nan and counted as failed samples by the Monte-Carlo
+            # retrieval (like failed samples of the sample-by-sample retrieval)
+            failed_samples = too_noisy.any('time')
+            mean = mean.where(~failed_samples)
+
+        elif too_noisy.any():
+            raise NoValidDataPointsForCalibration
+
+        cf = calibration.calibr_value.value / mean
+        sqr_cf_err = np.square(rel_sem) + np.square(calibration.calibr_value.rel_error)
 
         # 2) calculate backscatter ratio
         bsc = deepcopy(sigratio)
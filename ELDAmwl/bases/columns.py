@@ -49,6 +49,17 @@ class Columns(object):
         self.ds['err'][time, :] = np.nan
         self.ds['binres'][time, :] = NC_FILL_INT
 
+    def set_invalid_profiles(self, time_mask):
+        """sets all time slices of time_mask invalid at once (vectorized version of set_invalid_profile)
+
+        Args:
+            time_mask (np.array of bool (time)): True for all time slices which shall be set invalid
+        """
+        time_mask = np.asarray(time_mask, dtype=bool)
+        self.ds['data'].values[time_mask] = np.nan
+        self.ds['err'].values[time_mask] = np.nan
+        self.ds['binres'].values[time_mask] = NC_FILL_INT
+
     def set_invalid_point(self, time, level, qf):
         self.ds['data'][time, level] = np.nan
         self.ds['err'][time, level] = np.nan
@@ -60,6 +71,25 @@ class Columns(object):
         else:
             self.ds['qf'][time, level] = qf
 
+    def set_invalid_mask(self, mask, qf):
+        """sets all points of mask invalid at once (vectorized version of set_invalid_point)
+
+        Args:
+            mask (np.array of bool (time, level)): True for all points which shall be set invalid
+            qf (int): quality flag which is added (bitwise or) to the points of mask
+        """
+        mask = np.asarray(mask, dtype=bool)
+        if not mask.any():
+            return
+
+        self.ds['data'].values[mask] = np.nan
+        self.ds['err'].values[mask] = np.nan
+        self.ds['binres'].values[mask] = NC_FILL_INT
+
+        qf_values = self.ds['qf'].values
+        old_qf = qf_values[mask]
+        qf_values[mask] = np.where(old_qf != NC_FILL_BYTE, old_qf | qf, qf)
+
     def angle_to_time_dependent_var(self, angle_var, data_var):
         """
         converts xr variables from (time dependent) angle dimension
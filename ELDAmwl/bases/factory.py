@@ -6,6 +6,7 @@ from ELDAmwl.component.interface import IDBFunc
 from ELDAmwl.component.interface import ILogger
 from ELDAmwl.component.interface import IParams
 from ELDAmwl.component.registry import registry
+from ELDAmwl.log.profiler import profiled_operation
 from zope import component
 
 
@@ -30,6 +31,8 @@ class BaseOperationFactory(object):
     def __call__(self, *args, **kwargs):
         klass = self.get_class()
         res = klass(*args, **kwargs)
+        if isinstance(res, BaseOperation):
+            res.factory_name = self.name
         return res
 
     @property
@@ -48,8 +51,17 @@ class BaseOperationFactory(object):
 class BaseOperation(object):
     """
     Base class of operations
+
+    The run methods of all operations are recorded in the profile of the run
+    (see :class:`ELDAmwl.log.profiler.RunProfiler`).
     """
     _params = None
+    factory_name = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if 'run' in cls.__dict__:
+            cls.run = profiled_operation(cls.run)
 
     def __init__(self, **kwargs):
         self.kwargs = kwargs
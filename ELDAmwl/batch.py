@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+"""processing of many measurements in one ELDAmwl run"""
+from addict import Dict
+from ELDAmwl.component.interface import IDBFunc
+from ELDAmwl.component.interface import IMCPool
+from ELDAmwl.elda_mwl.elda_mwl import register_params
+from ELDAmwl.errors.error_codes import UNKNOWN_EXCEPTION
+from ELDAmwl.errors.exceptions import WrongCommandLineParameter
+from ELDAmwl.main import elda_setup_components
+from ELDAmwl.main import Main
+from ELDAmwl.storage.data_storage import register_datastorage
+from ELDAmwl.utils.constants import EXIT_CODE_NONE, EXIT_CODE_OK, EXIT_CODE_SOME
+from ELDAmwl.utils.constants import MWL_PROD_ID_DEFAULT
+from zope import component
+
+import argparse
+import datetime
+import multiprocessing
+import sys
+import traceback
+
+
+# name of the log file with the messages which do not belong to a measurement
+BATCH_LOG_ID = 'batch'
+
+# BatchMain instance of a worker process
+_worker_main = None
+
+
+class BatchMain(Main):
+    """
+    Processes many measurements in one process (or in a pool of worker processes).
+
+    The components (config, logger, db access, ...) are registered only once
+    and reused for all measurements. Data storage and measurement params are
+    renewed for each measurement. Each measurement gets its own log file.
+    """
+
+    def handle_args(self):
+        parser = argparse.ArgumentParser(description='EARLINET Lidar Data Analyzer for \
+                           multi-wavelengths measurements, batch processing of many measurements')
+
+        parser.add_argument('meas_ids', metavar='meas_id', type=str, nargs='*',
+                            help='the ids of the measurements')
+
+        parser.add_argument('-f', dest='meas_id_file', default=None, type=str,
+                            help='file with one measurement id per line')
+
+        parser.add_argument('--start', dest='start', default=None, type=datetime.datetime.fromisoformat,
+                            help='process all measurements with ELPP files which started '
+                                 'after this time (ISO format, e.g. 2018-10-17T00:00)')
+
+        parser.add_argument('--stop', dest='stop', default=None, type=datetime.datetime.fromisoformat,
+                            help='process all measurements with ELPP files which started '
+                                 'before this time (ISO format). Requires --start')
+
+        parser.add_argument('--station', dest='station_id', default=None, type=str,
+                            help='process only measurements of this station (with --start and --stop)')
+
+        parser.add_argument('-n', dest='num_workers', default=1, type=int,
+                            help='number of worker processes. default = 1 (no parallel processing)')
+
+        parser.add_argument('-s', dest='summary_file', default=None, type=str,
+                            help='file into which the return codes of all measurements are written')
+
+        parser.add_argument('-i', dest='proc_inst', default=None, type=str,
+                            help='processing_inst: name of the institution \
+                                at which this code is running')
+
+        parser.add_argument('-l', dest='ll_file', default='DEBUG', type=str,
+                            choices=['QUIET', 'CRITICAL', 'ERROR',
+                                     'WARNING', 'INFO', 'DEBUG'],
+                            help='how many output is written to the '
+                                 'log files. default = debug')
+
+        parser.add_argument('-c', dest='config_dir', default='.', type=str,
+                            help='Config directory. default = "."')
+
+        args = parser.parse_args()
+        args.meas_id = BATCH_LOG_ID
+
+        return args
+
+    def elda_cmdline(self):
+        """
+        Parse the CMD line arguments and register the components
+        """
+        try:
+            args = self.handle_args()
+        except Exception:
+            raise WrongCommandLineParameter
+
+        if (args.start is None) != (args.stop is None):
+            raise WrongCommandLineParameter
+
+        self.setup(args)
+        return args
+
+    def setup(self, args):
+        elda_setup_components(args=args)
+
+        # customize the logger according to command line parameters
+        if args.ll_file:
+            if args.ll_file == 'QUIET':
+                self.logger.disabled = True
+            else:
+                self.logger.setLevel(args.ll_file)
+
+    def read_meas_ids(self, args):
+        """collects the ids of all measurements which shall be processed
+
+        Returns:
+            list of measurement ids (str), without duplicates
+        """
+        meas_ids = list(args.meas_ids)
+
+        if args.meas_id_file is not None:
+            with open(args.meas_id_file) as infile:
+                for line in infile:
+                    meas_id = line.split('#')[0].strip()
+                    if meas_id:
+                        meas_ids.append(meas_id)
+
+        if args.start is not None:
+            db_func = component.queryUtility(IDBFunc)
+            meas_ids.extend(db_func.read_measurement_ids(args.start, args.stop, station_id=args.station_id))
+
+        return list(dict.fromkeys(meas_ids))
+
+    def reset_components(self):
+        """renews the components which contain data of a measurement"""
+        register_datastorage()
+        register_params()
+
+        db_func = component.queryUtility(IDBFunc)
+        db_func.config_cache = None
+        db_func.session.rollback()
+
+    def elda_single(self, meas_id):
+        """processes one measurement
+
+        Returns:
+            tuple (meas_id, return code)
+        """
+        self.reset_components()
+        self.logger.set_measurement_id(meas_id)
+
+        try:
+            return_code = self.elda(Dict({'meas_id': meas_id}))
+        except Exception as e:
+            exc_type, exc_value, exc_traceback = sys.exc_info()
+            self.logger.error(f'unknown exception raised {e}')
+            for line in traceback.format_tb(exc_traceback):
+                self.logger.error(f'exception: {line[:-1]}')  # noqa P103
+            self.write_status_in_db(meas_id, UNKNOWN_EXCEPTION, str(e))
+            return_code = EXIT_CODE_NONE
+
+        return meas_id, return_code
+
+    def write_status_in_db(self, meas_id, status, description):
+        """writes the status of a measurement which was stopped by an unknown exception into the db"""
+        db_func = component.queryUtility(IDBFunc)
+        try:
+            db_func.session.rollback()
+            db_func.write_product_status_in_db(meas_id, MWL_PROD_ID_DEFAULT, None, status, description)
+        except Exception as e:
+            self.logger.error(f'cannot write status of measurement {meas_id} into db: {e}')
+
+    def run_serial(self, meas_ids):
+        for meas_id in meas_ids:
+            yield self.elda_single(meas_id)
+
+    def run_parallel(self, args, meas_ids):
+        if 'fork' in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context('fork')
+        else:
+            context = multiprocessing.get_context()
+
+        # the workers open their own db connections
+        component.queryUtility(IDBFunc).engine.dispose()
+
+        with context.Pool(args.num_workers, initializer=init_worker, initargs=(args,)) as pool:
+            for result in pool.imap_unordered(run_worker, meas_ids):
+                yield result
+
+    def run(self):
+        try:
+            args = self.elda_cmdline()
+            meas_ids = self.read_meas_ids(args)
+            self.logger.info('batch processing of {} measurements'.format(len(meas_ids)))
+
+            if args.num_workers > 1:
+                results = self.run_parallel(args, meas_ids)
+            else:
+                results = self.run_serial(meas_ids)
+
+            return_codes = {}
+            for meas_id, return_code in results:
+                return_codes[meas_id] = return_code
+                self.logger.set_measurement_id(BATCH_LOG_ID)
+                self.logger.info('measurement {} finished with return code {}'.format(meas_id, return_code))
+
+            if args.summary_file is not None:
+                with open(args.summary_file, 'w') as outfile:
+                    for meas_id in meas_ids:
+                        outfile.write('{} {}\n'.format(meas_id, return_codes[meas_id]))
+
+            sys.exit(self.get_return_value(return_codes))
+
+        except Exception as e:
+            exc_type, exc_value, exc_traceback = sys.exc_info()
+            if not self.logger:
+                print(f'unknown exception raised {e}')
+                for line in traceback.format_tb(exc_traceback):
+                    print(f'exception: {line[:-1]}')  # noqa P103
+            else:
+                self.logger.error(f'unknown exception raised {e}')
+                for line in traceback.format_tb(exc_traceback):
+                    self.logger.error(f'exception: {line[:-1]}')  # noqa P103
+            sys.exit(EXIT_CODE_NONE)
+
+    def get_return_value(self, return_codes):
+        """determines the return code of the batch
+
+        Returns: 0 in case that all measurements were completely processed,
+        1 in case some products of some measurements are missing,
+        2 if no products were derived at all
+        """
+        codes = set(return_codes.values())
+        if codes <= {EXIT_CODE_OK}:
+            return EXIT_CODE_OK
+        elif codes == {EXIT_CODE_NONE}:
+            return EXIT_CODE_NONE
+        else:
+            return EXIT_CODE_SOME
+
+
+def init_worker(args):
+    """registers the components in a worker process of the batch"""
+    global _worker_main
+    _worker_main = BatchMain()
+    _worker_main.setup(args)
+
+    # the worker processes are daemons and cannot have a pool of MC workers
+    component.getGlobalSiteManager().unregisterUtility(provided=IMCPool)
+
+
+def run_worker(meas_id):
+    return _worker_main.elda_single(meas_id)
+
+
+def run():
+    main = BatchMain()
+    main.run()
+
+
+if __name__ == '__main__':
+    run()
@@ -83,3 +83,15 @@ class IVLDROp(interface.Interface):
     """
     Marker Interface for VLDR operation
     """
+
+
+class IMCPool(interface.Interface):
+    """
+    Marker Interface for the worker pool of Monte Carlo retrievals
+    """
+
+
+class IProfiler(interface.Interface):
+    """
+    Marker Interface for the timing and memory profile of a run
+    """
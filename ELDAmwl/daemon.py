@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""ELDAmwl as long-living service which processes measurements from a job queue"""
+from ELDAmwl.batch import BATCH_LOG_ID
+from ELDAmwl.batch import BatchMain
+from ELDAmwl.component.interface import IDBFunc
+from ELDAmwl.component.interface import IMCPool
+from ELDAmwl.errors.exceptions import WrongCommandLineParameter
+from ELDAmwl.utils.constants import EXIT_CODE_NONE, EXIT_CODE_OK
+from ELDAmwl.utils.job_queue import DirectoryJobQueue
+from zope import component
+
+import argparse
+import multiprocessing
+import signal
+import sys
+import traceback
+
+
+class WorkerDaemon(BatchMain):
+    """
+    Processes the measurements of a job queue until it is stopped (SIGTERM or SIGINT).
+
+    All components are set up once at start and kept warm (imports, db connection,
+    Savitzky-Golay coefficients, ...). With more than one worker, each worker
+    process takes jobs from the queue independently. The status of each measurement
+    is written into the db (table eldamwl_product_status) as in single runs.
+    """
+
+    stop_event = None
+
+    def handle_args(self):
+        parser = argparse.ArgumentParser(description='EARLINET Lidar Data Analyzer for \
+                           multi-wavelengths measurements, service which processes a job queue')
+
+        parser.add_argument('queue_dir', type=str,
+                            help='spool directory of the job queue')
+
+        parser.add_argument('-n', dest='num_workers', default=1, type=int,
+                            help='number of worker processes. default = 1')
+
+        parser.add_argument('-p', dest='poll_interval', default=5., type=float,
+                            help='time (in s) between two looks into an empty queue. default = 5')
+
+        parser.add_argument('--exit-when-empty', dest='exit_when_empty', action='store_true',
+                            help='stop as soon as the queue is empty')
+
+        parser.add_argument('-i', dest='proc_inst', default=None, type=str,
+                            help='processing_inst: name of the institution \
+                                at which this code is running')
+
+        parser.add_argument('-l', dest='ll_file', default='DEBUG', type=str,
+                            choices=['QUIET', 'CRITICAL', 'ERROR',
+                                     'WARNING', 'INFO', 'DEBUG'],
+                            help='how many output is written to the '
+                                 'log files. default = debug')
+
+        parser.add_argument('-c', dest='config_dir', default='.', type=str,
+                            help='Config directory. default = "."')
+
+        args = parser.parse_args()
+        args.meas_id = BATCH_LOG_ID
+
+        return args
+
+    def elda_cmdline(self):
+        try:
+            args = self.handle_args()
+        except Exception:
+            raise WrongCommandLineParameter
+
+        self.setup(args)
+        return args
+
+    def work(self, queue, args):
+        """takes jobs from the queue and processes them until stop_event is set"""
+        while not self.stop_event.is_set():
+            meas_id = queue.claim()
+            if meas_id is None:
+                if args.exit_when_empty:
+                    break
+                self.stop_event.wait(args.poll_interval)
+                continue
+
+            meas_id, return_code = self.elda_single(meas_id)
+            queue.finish(meas_id, return_code)
+
+            self.logger.set_measurement_id(BATCH_LOG_ID)
+            self.logger.info('measurement {} finished with return code {}'.format(meas_id, return_code))
+
+    def request_stop(self, signum, frame):
+        self.stop_event.set()
+
+    def run(self):
+        try:
+            args = self.elda_cmdline()
+            queue = DirectoryJobQueue(args.queue_dir)
+
+            requeued = queue.requeue_unfinished()
+            if requeued:
+                self.logger.warning('requeued unfinished jobs {}'.format(', '.join(requeued)))
+
+            if 'fork' in multiprocessing.get_all_start_methods():
+                context = multiprocessing.get_context('fork')
+            else:
+                context = multiprocessing.get_context()
+            self.stop_event = context.Event()
+
+            # the current job is finished before stopping
+            signal.signal(signal.SIGTERM, self.request_stop)
+            signal.signal(signal.SIGINT, self.request_stop)
+
+            self.logger.info('process job queue {} with {} worker(s)'.format(args.queue_dir, args.num_workers))
+
+            if args.num_workers > 1:
+                # the workers open their own db connections
+                component.queryUtility(IDBFunc).engine.dispose()
+
+                workers = [context.Process(target=run_worker, args=(self, queue, args))
+                           for _ in range(args.num_workers)]
+                for worker in workers:
+                    worker.start()
+                for worker in workers:
+                    worker.join()
+            else:
+                self.work(queue, args)
+
+            self.logger.info('job queue processing stopped')
+            sys.exit(EXIT_CODE_OK)
+
+        except Exception as e:
+            exc_type, exc_value, exc_traceback = sys.exc_info()
+            if not self.logger:
+                print(f'unknown exception raised {e}')
+                for line in traceback.format_tb(exc_traceback):
+                    print(f'exception: {line[:-1]}')  # noqa P103
+            else:
+                self.logger.error(f'unknown exception raised {e}')
+                for line in traceback.format_tb(exc_traceback):
+                    self.logger.error(f'exception: {line[:-1]}')  # noqa P103
+            sys.exit(EXIT_CODE_NONE)
+
+
+def run_worker(daemon, queue, args):
+    """entry point of a forked worker process of the daemon"""
+    daemon.setup(args)
+    # the cpus are shared by the workers -> the MC samples are retrieved in the worker itself
+    component.getGlobalSiteManager().unregisterUtility(provided=IMCPool)
+    daemon.work(queue, args)
+    daemon.logger.flush_db_log()
+
+
+def run():
+    daemon = WorkerDaemon()
+    daemon.run()
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""in-memory snapshot of the configuration tables of a mwl product"""
+from addict import Dict
+from ELDAmwl.database.tables.backscatter import BscCalibrMethod
+from ELDAmwl.database.tables.backscatter import ElastBackscatterOption
+from ELDAmwl.database.tables.backscatter import ElastBscMethod
+from ELDAmwl.database.tables.backscatter import RamanBackscatterOption
+from ELDAmwl.database.tables.backscatter import RamanBscMethod
+from ELDAmwl.database.tables.depolarization import VLDRMethod
+from ELDAmwl.database.tables.depolarization import VLDROption
+from ELDAmwl.database.tables.eldamwl_class_names import EldamwlClassNames
+from ELDAmwl.database.tables.extinction import ExtinctionOption
+from ELDAmwl.database.tables.extinction import ExtMethod
+from ELDAmwl.database.tables.lidar_ratio import ExtBscOption
+from ELDAmwl.database.tables.system_product import MWLproductProduct
+from ELDAmwl.database.tables.system_product import SmoothMethod
+from sqlalchemy import inspect
+
+
+# tables with available methods (small, read completely)
+METHOD_TABLES = [
+    BscCalibrMethod,
+    ElastBscMethod,
+    ExtMethod,
+    RamanBscMethod,
+    SmoothMethod,
+    VLDRMethod,
+]
+
+# tables with options of individual products (read for the products of one mwl product)
+OPTION_TABLES = [
+    ElastBackscatterOption,
+    ExtBscOption,
+    ExtinctionOption,
+    RamanBackscatterOption,
+    VLDROption,
+]
+
+
+def row_snapshot(table, row):
+    """copy of the column values of a db row.
+
+    The snapshot is independent of the db session (it is not expired by commits).
+
+    Returns:
+        addict.Dict with the python attribute names of the columns as keys
+    """
+    return Dict({attr.key: getattr(row, attr.key)
+                 for attr in inspect(table).mapper.column_attrs})
+
+
+class ConfigCache(object):
+    """
+    Per-run snapshot of the configuration tables which are needed to find the
+    algorithms and options of all products of a mwl product.
+
+    All tables are read with one query each. Afterwards, lookups are answered
+    from the in-memory index. A lookup returns None if the requested rows are
+    not part of the snapshot (then, the caller has to query the db).
+
+    Args:
+        session: db session
+        mwl_prod_id (int): id of the mwl product
+    """
+
+    def __init__(self, session, mwl_prod_id):
+        self.mwl_prod_id = mwl_prod_id
+        self.class_names = {}
+        self.methods = {}
+        self.options = {}
+
+        for row in session.query(EldamwlClassNames):
+            self.class_names.setdefault(row.method, []).append(row.classname)
+
+        for table in METHOD_TABLES:
+            index = {}
+            for row in session.query(table):
+                index.setdefault(row.ID, []).append(row_snapshot(table, row))
+            self.methods[table] = index
+
+        product_ids = session.query(MWLproductProduct.product_id)\
+            .filter(MWLproductProduct.mwl_product_id == mwl_prod_id)
+        self.product_ids = {row.product_id for row in product_ids}
+
+        for table in OPTION_TABLES:
+            index = {}
+            for row in session.query(table).filter(table.product_id.in_(self.product_ids)):
+                index.setdefault(row.product_id, []).append(row_snapshot(table, row))
+            self.options[table] = index
+
+    def class_name_rows(self, method):
+        """all class names of a method
+
+        Returns:
+            list of str
+        """
+        return self.class_names.get(method, [])
+
+    def method_rows(self, method_table, method_id):
+        """all rows of method_table with ID == method_id
+
+        Returns:
+            list of addict.Dict or None if method_table is not cached
+        """
+        if method_table not in self.methods:
+            return None
+        return self.methods[method_table].get(method_id, [])
+
+    def option_rows(self, option_table, product_id):
+        """all rows of option_table with product_id == product_id
+
+        Returns:
+            list of addict.Dict or None if option_table or the product is not cached
+        """
+        if option_table not in self.options:
+            return None
+        if int(product_id) not in self.product_ids:
+            return None
+        return self.options[option_table].get(int(product_id), [])
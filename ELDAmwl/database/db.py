@@ -5,6 +5,7 @@ from ELDAmwl.database.tables.system_product import SystemProduct
 from ELDAmwl.errors.exceptions import DBErrorTerminating
 from sqlalchemy import create_engine
 from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import scoped_session
 from sqlalchemy.orm import sessionmaker
 from zope import component
 
@@ -40,7 +41,8 @@ class DBUtils(object):
         self.engine = create_engine(self.get_connect_string())
 
         # create a configured "Session" class
-        self.session = sessionmaker(bind=self.engine)()
+        # each thread gets its own session (the products may be retrieved in several threads)
+        self.session = scoped_session(sessionmaker(bind=self.engine))
 
     def test_db(self):
         tasks = self.session.query(SystemProduct)
@@ -2,6 +2,8 @@
 """functions for db handling"""
 from addict import Dict
 from ELDAmwl.component.interface import IDBFunc
+from ELDAmwl.database.config_cache import ConfigCache
+from ELDAmwl.database.config_cache import row_snapshot
 from ELDAmwl.database.db import DBUtils
 from ELDAmwl.database.tables.angstroem import AngstroemExpOption
 from ELDAmwl.database.tables.backscatter import BscCalibrLowestHeight
@@ -44,6 +46,7 @@ from ELDAmwl.utils.constants import EBSC
 from ELDAmwl.utils.constants import MWL
 from ELDAmwl.utils.constants import RBSC
 from sqlalchemy.orm import aliased
+from sqlalchemy.orm import sessionmaker
 from sqlalchemy import func
 from zope import component
 from zope import interface
@@ -60,6 +63,11 @@ def register_db_func(connect_string=None):
 @interface.implementer(IDBFunc)
 class DBFunc(DBUtils):
 
+    # separate session for the log messages which are written by a background thread
+    log_session = None
+    # snapshot of the configuration tables of the actual mwl product
+    config_cache = None
+
     def __init__(self, connect_string=None):
         super(DBFunc, self).__init__(connect_string)
 
@@ -75,6 +83,68 @@ class DBFunc(DBUtils):
         self.session.add(log_msg)
         self.session.commit()
 
+    def db_log_many(self, records):
+        """writes many log messages at once into the db (bulk insert)
+
+        This method is called by the background thread of the buffered db logger
+        (:class:`ELDAmwl.log.log.BufferedDBLogWriter`). Therefore, it uses
+        its own session instead of self.session.
+
+            Args:
+                records (list of dict): one dict per log message with the
+                        column names of the table eldamwl_logs as keys
+        """
+        if self.log_session is None:
+            self.log_session = sessionmaker(bind=self.engine)()
+
+        try:
+            self.log_session.bulk_insert_mappings(ELDAmwlLogs, records)
+            self.log_session.commit()
+        except Exception:
+            self.log_session.rollback()
+            raise
+
+    def preload_config(self, mwl_prod_id):
+        """reads the configuration tables (class names, methods, product options)
+        of a mwl product at once into an in-memory snapshot.
+
+        Afterwards, the read_*_algorithm, read_*_method_id and read_*_params functions
+        are answered from this snapshot instead of querying the db.
+
+            Args:
+                mwl_prod_id (int): the id of the mwl product
+        """
+        self.config_cache = ConfigCache(self.session, mwl_prod_id)
+
+    def class_name_rows(self, method):
+        """names of the python classes which implement the method (from snapshot if available)"""
+        if self.config_cache is not None:
+            return self.config_cache.class_name_rows(method)
+
+        classes = self.session.query(EldamwlClassNames)\
+            .filter(EldamwlClassNames.method == method)
+        return [c.classname for c in classes]
+
+    def method_rows(self, method_table, method_id):
+        """rows of method_table with the given ID (from snapshot if available)"""
+        if self.config_cache is not None:
+            rows = self.config_cache.method_rows(method_table, method_id)
+            if rows is not None:
+                return rows
+
+        return self.session.query(method_table)\
+            .filter(method_table.ID == method_id).all()
+
+    def option_rows(self, option_table, product_id):
+        """rows of option_table of the given product (from snapshot if available)"""
+        if self.config_cache is not None:
+            rows = self.config_cache.option_rows(option_table, product_id)
+            if rows is not None:
+                return rows
+
+        return self.session.query(option_table)\
+            .filter(option_table.product_id == product_id).all()
+
     def read_classname(self, method):
         """reads from db in which python class the method is implemented
             Args:
@@ -83,14 +153,13 @@ class DBFunc(DBUtils):
             Returns:
                 str: name of the BaseOperation class to be used
          """
-        classes = self.session.query(EldamwlClassNames)\
-            .filter(EldamwlClassNames.method == method)
+        classes = self.class_name_rows(method)
 
-        if classes.count() == 1:
-            return classes.first().classname
+        if len(classes) == 1:
+            return classes[0]
         else:
             self.logger.error('wrong number {0} of class names for method {1}'
-                              .format(classes.count(), method))
+                              .format(len(classes), method))
 
     def read_algorithm(self, method_id, method_table):
         """ read from db which algorithm shall be used for product retrieval.
@@ -103,15 +172,14 @@ class DBFunc(DBUtils):
                 str: name of the BaseOperation class to be used
 
             """
-        methods = self.session.query(method_table)\
-            .filter(method_table.ID == method_id)
+        methods = self.method_rows(method_table, method_id)
 
-        if methods.count() == 1:
-            result = self.read_classname(methods.first().method)
+        if len(methods) == 1:
+            result = self.read_classname(methods[0].method)
             return result
         else:
             self.logger.error(
-                'wrong number ({0}) of available methods'.format(methods.count()),
+                'wrong number ({0}) of available methods'.format(len(methods)),
             )
 
     def read_effbin_algorithm(self, method_id, method_table):
@@ -127,15 +195,14 @@ class DBFunc(DBUtils):
                 str: name of the BaseOperation class to be used
 
             """
-        methods = self.session.query(method_table)\
-            .filter(method_table.ID == method_id)
+        methods = self.method_rows(method_table, method_id)
 
-        if methods.count() == 1:
-            result = self.read_classname(methods.first().method_for_getting_effective_binres)
+        if len(methods) == 1:
+            result = self.read_classname(methods[0].method_for_getting_effective_binres)
             return result
         else:
             self.logger.error(
-                'wrong number ({0}) of available methods'.format(methods.count()),
+                'wrong number ({0}) of available methods'.format(len(methods)),
             )
 
     def read_usedbin_algorithm(self, method_id, method_table):
@@ -150,15 +217,14 @@ class DBFunc(DBUtils):
                 str: name of the BaseOperation class to be used
 
             """
-        methods = self.session.query(method_table)\
-            .filter(method_table.ID == method_id)
+        methods = self.method_rows(method_table, method_id)
 
-        if methods.count() == 1:
-            result = self.read_classname(methods.first().method_for_getting_used_binres)
+        if len(methods) == 1:
+            result = self.read_classname(methods[0].method_for_getting_used_binres)
             return result
         else:
             self.logger.error(
-                'wrong number ({0}) of available methods'.format(methods.count()),
+                'wrong number ({0}) of available methods'.format(len(methods)),
             )
 
     def read_algorithm_options(self, method_table):
@@ -190,15 +256,14 @@ class DBFunc(DBUtils):
                 int: id of the algorithm in table _extinction_methods
 
         """
-        options = self.session.query(ExtinctionOption)\
-            .filter(ExtinctionOption.product_id == product_id)
+        options = self.option_rows(ExtinctionOption, product_id)
 
-        if options.count() == 1:
-            result = options.first().ext_method_id
+        if len(options) == 1:
+            result = options[0].ext_method_id
             return result
         else:
             self.logger.error(
-                'wrong number of extinction options ({0})'.format(options.count()),
+                'wrong number of extinction options ({0})'.format(len(options)),
             )
 
     def read_extinction_algorithm(self, product_id):
@@ -255,15 +320,14 @@ class DBFunc(DBUtils):
                 int: id of the algorithm in table _ram_bsc_methods
 
         """
-        options = self.session.query(RamanBackscatterOption)\
-            .filter(RamanBackscatterOption.product_id == product_id)
+        options = self.option_rows(RamanBackscatterOption, product_id)
 
-        if options.count() == 1:
-            result = options.first().ram_bsc_method_id
+        if len(options) == 1:
+            result = options[0].ram_bsc_method_id
             return result
         else:
             self.logger.error(
-                'wrong number of Raman bsc options ({0})'.format(options.count()),
+                'wrong number of Raman bsc options ({0})'.format(len(options)),
             )
 
     def read_raman_bsc_smooth_method_id(self, product_id):
@@ -276,15 +340,14 @@ class DBFunc(DBUtils):
                 int: id of the algorithm in table _ram_bsc_methods
 
         """
-        options = self.session.query(RamanBackscatterOption)\
-            .filter(RamanBackscatterOption.product_id == product_id)
+        options = self.option_rows(RamanBackscatterOption, product_id)
 
-        if options.count() == 1:
-            result = options.first().smooth_method_id
+        if len(options) == 1:
+            result = options[0].smooth_method_id
             return result
         else:
             self.logger.error(
-                'wrong number of Raman bsc options ({0})'.format(options.count()),
+                'wrong number of Raman bsc options ({0})'.format(len(options)),
             )
 
     def read_raman_bsc_algorithm(self, product_id):
@@ -326,15 +389,14 @@ class DBFunc(DBUtils):
                 int: id of the algorithm in table _vldr_methods
 
         """
-        options = self.session.query(VLDROption)\
-            .filter(VLDROption.product_id == product_id)
+        options = self.option_rows(VLDROption, product_id)
 
-        if options.count() == 1:
-            result = options.first().smooth_method_id
+        if len(options) == 1:
+            result = options[0].smooth_method_id
             return result
         else:
             self.logger.error(
-                'wrong number of Raman bsc options ({0})'.format(options.count()),
+                'wrong number of Raman bsc options ({0})'.format(len(options)),
             )
 
     def read_vldr_usedbin_algorithm(self, product_id):
@@ -406,15 +468,14 @@ class DBFunc(DBUtils):
                 int: id of the algorithm in table _elast_bsc_methods
 
         """
-        options = self.session.query(ElastBackscatterOption)\
-            .filter(ElastBackscatterOption.product_id == product_id)
+        options = self.option_rows(ElastBackscatterOption, product_id)
 
-        if options.count() == 1:
-            result = options.first().elast_bsc_method_id
+        if len(options) == 1:
+            result = options[0].elast_bsc_method_id
             return result
         else:
             self.logger.error(
-                'wrong number of elastic bsc options ({0})'.format(options.count()),
+                'wrong number of elastic bsc options ({0})'.format(len(options)),
             )
 
     def read_elast_bsc_smooth_method_id(self, product_id):
@@ -427,15 +488,14 @@ class DBFunc(DBUtils):
                 int: id of the algorithm in table _elast_bsc_methods
 
         """
-        options = self.session.query(ElastBackscatterOption)\
-            .filter(ElastBackscatterOption.product_id == product_id)
+        options = self.option_rows(ElastBackscatterOption, product_id)
 
-        if options.count() == 1:
-            result = options.first().smooth_method_id
+        if len(options) == 1:
+            result = options[0].smooth_method_id
             return result
         else:
             self.logger.error(
-                'wrong number of elastic bsc options ({0})'.format(options.count()),
+                'wrong number of elastic bsc options ({0})'.format(len(options)),
             )
 
     def read_elast_bsc_algorithm(self, product_id):
@@ -492,17 +552,20 @@ class DBFunc(DBUtils):
                 product_id (int): the id of the actual extinction product
 
             Returns:
-                ??: options
+                addict.Dict: column values of the row of table ext_bsc_options
+                with the python attribute names of the columns as keys
+                (independent of whether the row is read from the snapshot or from db)
 
             """
-        options = self.session.query(ExtBscOption)\
-            .filter(ExtBscOption.product_id == product_id)
+        options = self.option_rows(ExtBscOption, product_id)
 
-        if options.count() == 1:
-            return options[0]
+        if len(options) == 1:
+            if isinstance(options[0], Dict):
+                return options[0]
+            return row_snapshot(ExtBscOption, options[0])
         else:
             self.logger.error(
-                'wrong number of lidar ratio options ({0})'.format(options.count()),
+                'wrong number of lidar ratio options ({0})'.format(len(options)),
             )
 
     def read_extinction_params(self, product_id):
@@ -783,19 +846,18 @@ class DBFunc(DBUtils):
                 options : {'elast_bsc_method', 'lr_input_method'}
 
             """
-        options = self.session.query(ElastBackscatterOption)\
-            .filter(ElastBackscatterOption.product_id == product_id)
-
-        if options.count() == 1:
-            result = {'elast_bsc_method': options.first().elast_bsc_method_id,
-                      'lr_input_method': options.first().lr_input_method_id,
-                      'error_method': options.first().error_method_id,
-                      'smooth_method': options.first().smooth_method_id,
-                      'fixed_lr': options.first().fixed_lr,
-                      'fixed_lr_error': options.first().fixed_lr_error,
+        options = self.option_rows(ElastBackscatterOption, product_id)
+
+        if len(options) == 1:
+            result = {'elast_bsc_method': options[0].elast_bsc_method_id,
+                      'lr_input_method': options[0].lr_input_method_id,
+                      'error_method': options[0].error_method_id,
+                      'smooth_method': options[0].smooth_method_id,
+                      'fixed_lr': options[0].fixed_lr,
+                      'fixed_lr_error': options[0].fixed_lr_error,
                       }
 
-            # if options.first()._lr_input_method_id == PROFILE:
+            # if options[0]._lr_input_method_id == PROFILE:
             #     lr_file = self.session.query(LRFile) \
             #         .filter(LRFile.ID == ElastBackscatterOption._lr_file_ID) \
             #         .filter(ElastBackscatterOption._product_ID == product_id)
@@ -808,7 +870,7 @@ class DBFunc(DBUtils):
             return result
         else:
             self.logger.error(
-                'wrong number of elast bsc options ({0})'.format(options.count()),
+                'wrong number of elast bsc options ({0})'.format(len(options)),
             )
 
     def read_iter_bsc_params(self, product_id):
@@ -853,18 +915,17 @@ class DBFunc(DBUtils):
                 options : {'ram_bsc_method'}
 
             """
-        options = self.session.query(RamanBackscatterOption)\
-            .filter(RamanBackscatterOption.product_id == product_id)
+        options = self.option_rows(RamanBackscatterOption, product_id)
 
-        if options.count() == 1:
-            result = {'ram_bsc_method': options.first().ram_bsc_method_id,
-                      'error_method': options.first().error_method_id,
-                      'smooth_method': options.first().smooth_method_id,
+        if len(options) == 1:
+            result = {'ram_bsc_method': options[0].ram_bsc_method_id,
+                      'error_method': options[0].error_method_id,
+                      'smooth_method': options[0].smooth_method_id,
                       }
             return result
         else:
             self.logger.error(
-                'wrong number of Raman bsc options ({0})'.format(options.count()),
+                'wrong number of Raman bsc options ({0})'.format(len(options)),
             )
 
     def read_vldr_params(self, product_id):
@@ -880,18 +941,17 @@ class DBFunc(DBUtils):
                 options : {'vldr_method': None, 'error_method': None, 'smooth_method': None}
 
             """
-        options = self.session.query(VLDROption)\
-            .filter(VLDROption.product_id == product_id)
+        options = self.option_rows(VLDROption, product_id)
 
-        if options.count() == 1:
-            result = {'vldr_method': options.first().vldr_method_id,
-                      'error_method': options.first().error_method_id,
-                      'smooth_method': options.first().smooth_method_id,
+        if len(options) == 1:
+            result = {'vldr_method': options[0].vldr_method_id,
+                      'error_method': options[0].error_method_id,
+                      'smooth_method': options[0].smooth_method_id,
                       }
             return result
         else:
             self.logger.error(
-                'wrong number of VLDR options ({0})'.format(options.count()),
+                'wrong number of VLDR options ({0})'.format(len(options)),
             )
 
     def get_mc_params_query(self, prod_id):
@@ -1002,6 +1062,30 @@ class DBFunc(DBUtils):
             )
             raise NoMwlProductDefined(system_id)
 
+    def read_measurement_ids(self, start, stop, station_id=None):
+        """ read from db the ids of all measurements with ELPP files
+            which started within the given time period
+
+            Args:
+                start (datetime.datetime): begin of the time period
+                stop (datetime.datetime): end of the time period
+                station_id (str): id of the station, optional.
+                        default = None => measurements of all stations
+
+            Returns:
+                list: List of measurement ids (str), sorted by start time
+
+            """
+        measurements = self.session.query(Measurements.ID, Measurements.start)\
+            .filter(Measurements.start >= start)\
+            .filter(Measurements.start < stop)\
+            .filter(PreparedSignalFile.measurements_id == Measurements.ID)
+
+        if station_id is not None:
+            measurements = measurements.filter(Measurements.hoi_stations_id == station_id)
+
+        return [m.ID for m in measurements.distinct().order_by(Measurements.start)]
+
     def read_system_id(self, measurement_id):
         """ function to read from db which products shall be derived .
 
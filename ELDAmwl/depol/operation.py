@@ -213,30 +213,58 @@ class CalcVLDRDefault(BaseOperation):
         if data is None:
             data = self.sig_ratio
 
-        # extract relevant parameter for calculation of VLDR into Dict
-
-        params = Dict({'gain_ratio': data.pol_calibr.gain_factor.value,
-                       'gain_ratio_correction': data.pol_calibr.gain_factor_correction.value,
-                       'HT': self.vldr_params.crosstalk_h_transm,
-                       'HR': self.vldr_params.crosstalk_h_refl,
-                       'GT': self.vldr_params.crosstalk_g_transm,
-                       'GR': self.vldr_params.crosstalk_g_refl,
-                       'sys_err_lower_bound_a': self.vldr_params.depol_uncertainty_params.a_lower,
-                       'sys_err_lower_bound_b': self.vldr_params.depol_uncertainty_params.b_lower,
-                       'sys_err_lower_bound_c': self.vldr_params.depol_uncertainty_params.c_lower,
-                       'sys_err_upper_bound_a': self.vldr_params.depol_uncertainty_params.a_upper,
-                       'sys_err_upper_bound_b': self.vldr_params.depol_uncertainty_params.b_upper,
-                       'sys_err_upper_bound_c': self.vldr_params.depol_uncertainty_params.c_upper,
-                       })
-
         # todo: propagate systematic errors through all operations, smoothing etc.
         self.result.ds = self.calc_routine.run(
             sigratio=data.ds,
-            depol_params=params)
+            depol_params=self.depol_params(data))
         self.result.profile_qf = deepcopy(data.profile_qf)
 
         return self.result
 
+    def depol_params(self, data):
+        """extracts the relevant parameter for calculation of VLDR into Dict
+
+        Args:
+            data (`.Signals`): signal ratios
+
+        Returns:
+            addict.Dict with the parameters listed in `.CalcVLDRDefault.run`
+        """
+        return Dict({'gain_ratio': data.pol_calibr.gain_factor.value,
+                     'gain_ratio_correction': data.pol_calibr.gain_factor_correction.value,
+                     'HT': self.vldr_params.crosstalk_h_transm,
+                     'HR': self.vldr_params.crosstalk_h_refl,
+                     'GT': self.vldr_params.crosstalk_g_transm,
+                     'GR': self.vldr_params.crosstalk_g_refl,
+                     'sys_err_lower_bound_a': self.vldr_params.depol_uncertainty_params.a_lower,
+                     'sys_err_lower_bound_b': self.vldr_params.depol_uncertainty_params.b_lower,
+                     'sys_err_lower_bound_c': self.vldr_params.depol_uncertainty_params.c_lower,
+                     'sys_err_upper_bound_a': self.vldr_params.depol_uncertainty_params.a_upper,
+                     'sys_err_upper_bound_b': self.vldr_params.depol_uncertainty_params.b_upper,
+                     'sys_err_upper_bound_c': self.vldr_params.depol_uncertainty_params.c_upper,
+                     })
+
+    def run_samples(self, samples):
+        """run the VLDR calculation for many Monte-Carlo samples at once
+
+        The calculation of VLDR profiles is element-wise. Therefore, the calculator class can directly
+        handle signal ratios with an additional sample axis.
+
+        Args:
+            samples (np.array): (sample, time, level) varied data of the signal ratio
+
+        Returns:
+            np.array (sample, time, level) with the VLDR of all samples
+        """
+        sigratio = self.sig_ratio.ds.copy()
+        sigratio['data'] = (['sample', 'time', 'level'], samples)
+
+        vldr = self.calc_routine.run(
+            sigratio=sigratio,
+            depol_params=self.depol_params(self.sig_ratio))
+
+        return vldr.data.transpose('sample', 'time', 'level').values
+
 
 registry.register_class(VLRDFactory,
                         VLRDFactoryDefault.__name__,
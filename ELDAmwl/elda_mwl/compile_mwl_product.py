@@ -1,7 +1,6 @@
 # -*- coding: utf-8 -*-
 """Classes for handling of mwl products"""
 from addict import Dict
-from copy import deepcopy
 from ELDAmwl.bases.factory import BaseOperation
 from ELDAmwl.bases.factory import BaseOperationFactory
 from ELDAmwl.component.registry import registry
@@ -17,9 +16,24 @@ import numpy as np
 import xarray as xr
 
 
+# float variables of the product matrices (order of the first axis of GetProductMatrixDefault.values)
+MATRIX_VARS = [
+    'data',
+    'absolute_statistical_uncertainty',
+    'absolute_systematic_uncertainty_negative',
+    'absolute_systematic_uncertainty_positive',
+]
+MATRIX_DIMS = ['wavelength', 'time', 'level']
+
+
 class GetProductMatrixDefault(BaseOperation):
     """
     brings all products onto a common grid (wavelength, time, altitude)
+
+    The matrices of all product types of one resolution are views into one
+    preallocated block (variable, product type, wavelength, time, level) of
+    float values and one block (product type, wavelength, time, level) of
+    quality flags. The products are written into these blocks by index.
     """
 
     product_params = None  # table with all scheduled products
@@ -27,12 +41,19 @@ class GetProductMatrixDefault(BaseOperation):
     wavelengths = None
     p_types = None
     result = None
+    values = None  # block of float variables of all product types of the current resolution
+    flags = None  # block of quality flags of all product types of the current resolution
+    empty_entries = None  # empty product types, wavelengths, time slices, height bins per resolution
+    empty_products = None  # product types with empty matrices per resolution (see qc)
+    failed_products = None  # params of the products with empty matrices per resolution (see qc)
+    empty_wavelengths = None  # wavelengths without valid data per resolution (see qc)
 
     def prepare(self):
         self.product_params = self.kwargs['product_params']
         self.wavelengths = Dict()
         self.p_types = Dict()
         self.result = Dict()
+        self.empty_entries = Dict()
 
         for res in RESOLUTIONS:
             self.wavelengths[res] = self.product_params.wavelengths(res=res)
@@ -70,7 +91,8 @@ class GetProductMatrixDefault(BaseOperation):
         for param in params:
             # todo: remove limit to EXT when all prod types are included
             if (alt_axis is None) and (param.product_type in [EXT, RBSC, EBSC, LR, VLDR]):
-                product = self.data_storage.product_qc(param.prod_id_str, res)
+                with self.data_storage.borrow():
+                    product = self.data_storage.product_qc(param.prod_id_str, res)
                 alt_axis = product.altitude
             else:
                 # todo: find max of alt axes
@@ -82,28 +104,35 @@ class GetProductMatrixDefault(BaseOperation):
                      'wl': wl_axis,
                      })
 
-    def create_empty_dataset(self, ptype, wavelengths):
+    def allocate_matrices(self, res):
+        """allocates the blocks of float values (filled with nan) and quality flags
+        (filled with ALL_OK) of all product types of the resolution res"""
+        shape = (len(self.p_types[res]),) + self.shape.shape
+        self.values = np.full((len(MATRIX_VARS),) + shape, np.nan)
+        self.flags = np.full(shape, ALL_OK, dtype=int)
+
+    def create_empty_dataset(self, ptype, res, wavelengths):
         # create a common Dataset for each product type
-        # with common shape and empty data variables
-        array = np.ones(self.shape.shape) * np.nan
-        flag_array = np.ones(self.shape.shape, dtype=int) * ALL_OK
+        # with common shape and empty data variables.
+        # The data variables are views into the preallocated blocks
+        p_idx = self.p_types[res].index(ptype)
 
         ds = xr.Dataset(data_vars={
             'altitude': self.shape.alt,
             'wavelength': self.shape.wl,
             'data': (
-                ['wavelength', 'time', 'level'],
-                deepcopy(array),
+                MATRIX_DIMS,
+                self.values[MATRIX_VARS.index('data'), p_idx],
                 MWLFileStructure.data_attrs(MWLFileStructure, ptype),
             ),
             'absolute_statistical_uncertainty': (
-                ['wavelength', 'time', 'level'],
-                deepcopy(array),
+                MATRIX_DIMS,
+                self.values[MATRIX_VARS.index('absolute_statistical_uncertainty'), p_idx],
                 MWLFileStructure.stat_err_attrs(MWLFileStructure, ptype),
             ),
             'quality_flag': (
-                ['wavelength', 'time', 'level'],
-                deepcopy(flag_array),
+                MATRIX_DIMS,
+                self.flags[p_idx],
                 MWLFileStructure.qf_attrs(MWLFileStructure, ptype),
             ),
             'meta_data': (
@@ -115,128 +144,128 @@ class GetProductMatrixDefault(BaseOperation):
 
         if MWLFileStructure.is_product_with_sys_error(MWLFileStructure, ptype):
             ds['absolute_systematic_uncertainty_negative'] = xr.DataArray(
-                deepcopy(array),
-                dims=['wavelength', 'time', 'level'],
+                self.values[MATRIX_VARS.index('absolute_systematic_uncertainty_negative'), p_idx],
+                dims=MATRIX_DIMS,
                 attrs=MWLFileStructure.sys_err_neg_attrs(MWLFileStructure, ptype),
             )
             ds['absolute_systematic_uncertainty_positive'] = xr.DataArray(
-                deepcopy(array),
-                dims=['wavelength', 'time', 'level'],
+                self.values[MATRIX_VARS.index('absolute_systematic_uncertainty_positive'), p_idx],
+                dims=MATRIX_DIMS,
                 attrs=MWLFileStructure.sys_err_pos_attrs(MWLFileStructure, ptype),
             )
         return ds
 
     def combine_ebsc_rbsc_matrix(self, res, wavelengths):
+        """fills the gaps of the Raman backscatter matrix with elastic backscatter data
+        (like xr.Dataset.combine_first) and uses the result for both backscatter types"""
+        rbsc_idx = self.p_types[res].index(RBSC)
+        ebsc_idx = self.p_types[res].index(EBSC)
         rbsc_matrix = self.result[res][RBSC]
         ebsc_matrix = self.result[res][EBSC]
-        combined = rbsc_matrix.combine_first(ebsc_matrix)
+
+        rbsc_values = self.values[:, rbsc_idx]
+        np.copyto(rbsc_values, self.values[:, ebsc_idx], where=np.isnan(rbsc_values))
+        # quality flags are never empty -> those of the Raman backscatter are kept
+        self.values[:, ebsc_idx] = rbsc_values
+        self.flags[ebsc_idx] = self.flags[rbsc_idx]
+
+        meta_data = rbsc_matrix.meta_data.values
+        for wl_idx, ebsc_meta_data in enumerate(ebsc_matrix.meta_data.values):
+            if meta_data[wl_idx] is None:
+                meta_data[wl_idx] = ebsc_meta_data
+        for name in ebsc_matrix.data_vars:
+            if name not in rbsc_matrix.data_vars:
+                rbsc_matrix[name] = ebsc_matrix[name]
+
         # preliminray solution: write combined data in matrices of both bsc products
         # => the writing routine will overwrite the first with the second
         # todo: make writing routine intelligent that only 1 bsc matrix is needed
         for bsc_type in [RBSC, EBSC]:
-            self.result[res][bsc_type] = combined
+            self.result[res][bsc_type] = rbsc_matrix
 
     def get_product_matrix(self, ptype, res, wavelengths):
-        ds = self.create_empty_dataset(ptype, wavelengths)
-        ds.load()
-
-        for wl in wavelengths:
-            # get the product param related to products type and wavelength;
-            # returns None if the product does not exists
-            param = self.product_params.prod_param(ptype, wl)
-            if param is not None:
-                if param.calc_with_res(res):
-                    prod_id = param.prod_id_str
-                    # get product object from data storage
-                    prod = self.data_storage.product_qc(prod_id, res)
-                    # write product data into common Dataset
-                    prod.write_data_in_ds(ds)
-
-                    wl_idx = wavelengths.index(wl)
-                    ds.meta_data[wl_idx] = '/{}/{}'.format(
-                        MWLFileStructure.GROUP_NAME[MWLFileStructure.META_DATA],
-                        prod.mwl_meta_id,
-                    )
+        ds = self.create_empty_dataset(ptype, res, wavelengths)
+
+        # the products are only read -> no copies needed
+        with self.data_storage.borrow():
+            for wl in wavelengths:
+                # get the product param related to products type and wavelength;
+                # returns None if the product does not exists
+                param = self.product_params.prod_param(ptype, wl)
+                if param is not None:
+                    if param.calc_with_res(res):
+                        prod_id = param.prod_id_str
+                        # get product object from data storage
+                        prod = self.data_storage.product_qc(prod_id, res)
+                        # write product data into common Dataset (= into the preallocated blocks)
+                        prod.write_data_in_ds(ds)
+
+                        wl_idx = wavelengths.index(wl)
+                        ds.meta_data[wl_idx] = '/{}/{}'.format(
+                            MWLFileStructure.GROUP_NAME[MWLFileStructure.META_DATA],
+                            prod.mwl_meta_id,
+                        )
 
         return ds
 
-    def find_empty_time_sices(self, res):
-        empty_time_slices = None
-
-        for ptype in self.p_types[res]:
-            a_matrix = self.result[res][ptype]
-            if empty_time_slices is None:
-                # init result with True
-                empty_time_slices = np.ones_like(a_matrix.time, dtype=bool)
-                empty_time_slices[:] = True
-            # if a time slice in this product is empty AND was empty in other products
-            empty_time_slices = empty_time_slices & a_matrix.data.isnull().all(dim=['level', 'wavelength']).values
-
-        return empty_time_slices
-
-    def find_empty_height_bins(self, res):
-        empty_height_bins = None
-
-        for ptype in self.p_types[res]:
-            a_matrix = self.result[res][ptype]
-            if empty_height_bins is None:
-                empty_height_bins = np.ones_like(a_matrix.level, dtype=bool)
-                empty_height_bins[:] = True
-
-            empty_height_bins = empty_height_bins & a_matrix.data.isnull().all(dim=['time', 'wavelength']).values
-
-        return empty_height_bins
-
-    def find_empty_wavelengths(self, res):
-        empty_wavelengths = None
-
-        for ptype in self.p_types[res]:
-            a_matrix = self.result[res][ptype]
-            if empty_wavelengths is None:
-                empty_wavelengths = np.ones_like(a_matrix.wavelength, dtype=bool)
-                empty_wavelengths[:] = True
-
-            empty_wavelengths = empty_wavelengths & a_matrix.data.isnull().all(dim=['time', 'level']).values
-
-        return empty_wavelengths
-
-    def find_empty_products(self, res):
-        empty_products = []
-        for ptype in self.p_types[res]:
-            a_matrix = self.result[res][ptype]
-            if a_matrix.data.isnull().all():
-                empty_products.append(ptype)
+    def find_empty_entries(self):
+        """product types, wavelengths, time slices and height bins without any valid data point
+        in the product matrices of the current resolution
 
-        return empty_products
+        Returns:
+            Dict with boolean arrays products, wavelengths, time_slices, height_bins
+        """
+        valid = ~np.isnan(self.values[MATRIX_VARS.index('data')])
+        valid_in_profile = valid.any(axis=3)
+        valid_in_bin = valid.any(axis=(0, 1, 2))
+
+        return Dict({
+            'products': ~valid_in_profile.any(axis=(1, 2)),
+            'wavelengths': ~valid_in_profile.any(axis=(0, 2)),
+            'time_slices': ~valid_in_profile.any(axis=(0, 1)),
+            'height_bins': ~valid_in_bin,
+        })
 
     def qc(self):
-        """ identify failed product retrievals"""
+        """ identify failed product retrievals
+
+        A product has failed if the matrices of its product type are empty for all
+        resolutions with which the product shall be calculated.
+        Uses the empty entries which were found by :meth:`clip_data`.
+        """
+        self.empty_products = Dict()
+        self.failed_products = Dict()
+        self.empty_wavelengths = Dict()
 
         # all possibly failed products
         failed_products = []
 
         # are there empty product matrices ?
         for res in RESOLUTIONS:
-            self.empty_products[res] = self.find_empty_products(res)
+            self.empty_products[res] = []
+            self.failed_products[res] = []
+            if res not in self.empty_entries:
+                continue
+
+            empty = self.empty_entries[res]
+            self.empty_products[res] = [ptype for ptype, is_empty in zip(self.p_types[res], empty.products)
+                                        if is_empty]
+            self.empty_wavelengths[res] = empty.wavelengths
 
             # which individual products contributed to these matrices ?
             for ptype in self.empty_products[res]:
-                self.failed_products[res] = self.product_params.all_products_of_type(ptype, res=res)
-                failed_products = failed_products + self.failed_products[res]
+                self.failed_products[res] += self.product_params.all_products_of_type(ptype, res=res)
+            failed_products += self.failed_products[res]
 
         # check for all possibly failed products whether there is a valid retrieval with another resolution
         for param in failed_products:
             failed = True
             for res in RESOLUTIONS:
-                if self.product_params.product_table and param not in self.failed_products[res]:
+                if param.calc_with_res(res) and param not in self.failed_products[res]:
                     failed = False
             if failed:
                 param.mark_as_failed(self.product_params)
 
-
-            self.empty_wavelengths[res] = self.find_empty_wavelengths(res)
-
-
     def clip_data(self, res):
         """remove product types, wavelengths, time slices and altitude ranges without valid data
         from product matrices"""
@@ -244,10 +273,12 @@ class GetProductMatrixDefault(BaseOperation):
             self.logger.warning(f'no products were derived for resolution {RESOLUTION_STR[res]}')
             return None
 
-        empty_time_slices = self.find_empty_time_sices(res)
-        empty_height_bins = self.find_empty_height_bins(res)
-        empty_products = self.find_empty_products(res)
-        empty_wavelengths = self.find_empty_wavelengths(res)
+        empty = self.find_empty_entries()
+        self.empty_entries[res] = empty
+        empty_time_slices = empty.time_slices
+        empty_height_bins = empty.height_bins
+        empty_products = [ptype for ptype, is_empty in zip(self.p_types[res], empty.products) if is_empty]
+        empty_wavelengths = empty.wavelengths
 
         if empty_time_slices.all():
             self.logger.error(f'no valid products for {RESOLUTION_STR[res]}')
@@ -281,12 +312,15 @@ class GetProductMatrixDefault(BaseOperation):
 
     def filter_data(self, res):
         """set data points with critical quality flags to nan
+        (in the matrices of all product types that are defined for this resolution)
         """
-        # all product types that are defined for this resolution
-        for ptype in self.p_types[res]:
-            a_matrix = self.result[res][ptype]
-            for qf in self.cfg.CRITICAL_FLAGS:
-                a_matrix['data'] = a_matrix.data.where((a_matrix.quality_flag & qf) != qf)
+        if len(self.p_types[res]) == 0:
+            return
+
+        critical = np.zeros(self.flags.shape, dtype=bool)
+        for qf in self.cfg.CRITICAL_FLAGS:
+            critical |= (self.flags & qf) == qf
+        self.values[MATRIX_VARS.index('data')][critical] = np.nan
 
     def store_matrices(self, res):
         if len(self.p_types[res]) > 0:
@@ -305,6 +339,8 @@ class GetProductMatrixDefault(BaseOperation):
 
         for res in RESOLUTIONS:
             self.shape = self.get_common_shape(res)
+            if len(self.p_types[res]) > 0:
+                self.allocate_matrices(res)
 
             for ptype in self.p_types[res]:
                 self.result[res][ptype] = self.get_product_matrix(ptype, res, self.wavelengths[res])
@@ -317,6 +353,10 @@ class GetProductMatrixDefault(BaseOperation):
 
             self.store_matrices(res)
 
+        # the clipped matrices are copies -> the blocks are not needed anymore
+        self.values = None
+        self.flags = None
+
 
 class GetProductMatrix(BaseOperationFactory):
     """
@@ -53,7 +53,7 @@ class QualityControlDefault(BaseOperation):
 
             retrieval_failed = True
             for res in RESOLUTIONS:
-                if prod_param in self.product_params.all_products_of_res(res, include_failed=True):
+                if self.product_params.has_product(prod_param, res=res, include_failed=True):
                     profile = self.data_storage.product_qc(prod_id, res)
                     retrieval_failed = retrieval_failed & profile.is_out_of_range()
 
@@ -72,7 +72,7 @@ class QualityControlDefault(BaseOperation):
 
             retrieval_failed = True
             for res in RESOLUTIONS:
-                if prod_param in self.product_params.all_products_of_res(res):
+                if self.product_params.has_product(prod_param, res=res):
                     profile = self.data_storage.product_qc(prod_id, res)
                     retrieval_failed = retrieval_failed & profile.retrieval_failed()
 
@@ -1,7 +1,5 @@
 # -*- coding: utf-8 -*-
 """ELDAmwl operations"""
-import numpy as np
-import pandas as pd
 import zope
 from addict import Dict
 from zope import component
@@ -16,19 +14,22 @@ from ELDAmwl.depol.params import VLDRParams
 from ELDAmwl.elda_mwl.get_basic_products import GetBasicProducts
 from ELDAmwl.elda_mwl.get_derived_products import GetDerivedProducts
 from ELDAmwl.elda_mwl.get_lidar_constants import GetLidarConstants
+from ELDAmwl.elda_mwl.product_index import ProductIndex
+from ELDAmwl.elda_mwl.scheduler import TaskGraph
 from ELDAmwl.errors.exceptions import ProductNotUnique, DifferentProductsResolution, CouldNotFindProductsResolution, \
     ELDAmwlConfigurationException
 from ELDAmwl.elda_mwl.compile_mwl_product import GetProductMatrix
 from ELDAmwl.elda_mwl.do_quality_control import QualityControl
 from ELDAmwl.errors.exceptions import ProductNotUnique, ELDAmwlException
 from ELDAmwl.extinction.params import ExtinctionParams
+from ELDAmwl.log.profiler import profiled_stage
 from ELDAmwl.lidar_ratio.params import LidarRatioParams
 from ELDAmwl.angstroem_exponent.params import AngstroemExpParams
 from ELDAmwl.output.write_mwl_output import WriteMWLOutput
 from ELDAmwl.prepare_signals import PrepareSignals
 from ELDAmwl.products import GeneralProductParams
 from ELDAmwl.products import SmoothParams
-from ELDAmwl.signals import ElppData
+from ELDAmwl.signals import ElppFileCache
 from ELDAmwl.utils.constants import EBSC
 from ELDAmwl.utils.constants import EXIT_CODE_NONE
 from ELDAmwl.utils.constants import EXIT_CODE_OK
@@ -38,14 +39,8 @@ from ELDAmwl.utils.constants import HIGHRES
 from ELDAmwl.utils.constants import LOWRES
 from ELDAmwl.utils.constants import LR
 from ELDAmwl.utils.constants import RBSC
-from ELDAmwl.utils.constants import RESOLUTION_STR
 from ELDAmwl.utils.constants import VLDR
 from ELDAmwl.utils.constants import AE
-from zope import component
-
-import numpy as np
-import pandas as pd
-import zope
 
 
 PARAM_CLASSES = {RBSC: RamanBscParams,
@@ -80,67 +75,39 @@ class MeasurementParams(Params):
         self.measurement_params.system_id = self.db_func.read_system_id(self.meas_id)
         self.measurement_params.mwl_product_id = self.db_func.read_mwl_product_id(self.system_id)  # noqa E501
 
+        # read algorithms and options of all products at once
+        self.db_func.preload_config(self.measurement_params.mwl_product_id)
+
         # product_list provides a link between product id and
         # the parameter object of the product
         self.measurement_params.product_list = Dict()
 
-        # the product_table provides a table-like overview of
+        # the product_index provides a table-like overview of
         # all individual products. It shall be used for search operations
         # (e.g. for all extinction products or all basic products or..)
-        # the search operations are realized by filtering the DataFrame.
-        # they return the corresponding product_ids.
+        # the search operations return the corresponding product_ids.
         # Using the link between product id and parameter object from
         # the product_list, the search operations
         # will return lists of product parameter objects.
-        self.measurement_params.product_table = pd.DataFrame.from_dict(
-            {'id': [],
-             'wl': [],
-             'type': [],
-             'basic': [],
-             'derived': [],
-             'failed': [],
-             RESOLUTION_STR[HIGHRES]: [],
-             RESOLUTION_STR[LOWRES]: [],
-             'elpp_file': []})\
-            .astype({'id': 'str',
-                     'wl': 'float',
-                     'type': 'int',
-                     'basic': 'bool',
-                     'derived': 'bool',
-                     'failed': 'bool',
-                     RESOLUTION_STR[HIGHRES]: 'bool',
-                     RESOLUTION_STR[LOWRES]: 'bool',
-                     'elpp_file': 'str'})
+        self.measurement_params.product_index = ProductIndex()
 
         self.smooth_params = SmoothParams.from_db(self.measurement_params.mwl_product_id)
 
     def wavelengths(self, res=None, prod_types=None):
-        """unique sorted list of wavelengths of all products with resolution = res
+        """unique sorted list of wavelengths of all basic products with resolution = res
         Args:
             res (optional): ['lowres', 'highres']
+            prod_types (optional): product type or list of product types
         Returns:
             list of float: unique, sorted list of wavelengths of all products with resolution = res
         """
-        prod_df = self.measurement_params.product_table
-        prod_df = prod_df[(prod_df['failed'] == False) & (prod_df['basic'] == 1)]
-
-        if res is not None:
-            prod_df = prod_df[prod_df[RESOLUTION_STR[res]] == True]
-        if prod_types is not None:
-            if (len(prod_types) == 1) or isinstance(prod_types, int):
-                prod_df = prod_df[prod_df['type'] == prod_types]
-            elif len(prod_types) > 1:
-                type_df = prod_df[prod_df['type'] == prod_types[0]]
-                for pt in prod_types[1:]:
-                    type_df = pd.concat([type_df, prod_df[prod_df['type'] == pt]])
-                prod_df = type_df
-            else:
-                self.logger.error('empty list of product types')
-
-        all_wls = prod_df.wl.to_numpy()
+        if isinstance(prod_types, int):
+            prod_types = [prod_types]
+        elif (prod_types is not None) and (len(prod_types) == 0):
+            self.logger.error('empty list of product types')
+            prod_types = None
 
-        unique_wls = np.unique(all_wls)
-        return unique_wls.tolist()
+        return self.product_index.wavelengths(res=res, prod_types=prod_types, basic=True)
 
     def prod_types(self, res=None):
         """unique sorted list of all product types with resolution = res
@@ -150,16 +117,7 @@ class MeasurementParams(Params):
         Returns:
             list of float: unique, sorted list of all product types with resolution = res
         """
-        prod_df = self.measurement_params.product_table
-        prod_df = prod_df[prod_df['failed'] == False]
-
-        if res is not None:
-            all_ptypes = prod_df['type'][prod_df[RESOLUTION_STR[res]] == True].to_numpy()   # noqa E712
-        else:
-            all_ptypes = prod_df.type.to_numpy()
-
-        unique_ptypes = np.unique(all_ptypes)
-        return unique_ptypes.tolist()
+        return self.product_index.prod_types(res=res)
 
     def basic_products(self, res=None):
         """list of parameters of all basic products
@@ -168,12 +126,7 @@ class MeasurementParams(Params):
             list of :class:`ELDAmwl.products.ProductParams`:
             list of parameters of all basic products
         """
-        prod_df = self.measurement_params.product_table
-        prod_df = prod_df[prod_df['failed'] == False]
-        if res is not None:
-            prod_df = prod_df[prod_df[RESOLUTION_STR[res]]]
-        ids = prod_df['id'][prod_df.basic]
-        return self.filtered_list(ids)
+        return self.filtered_list(self.product_index.find(res=res, basic=True))
 
     def derived_products(self, res=None):
         """list of parameters of all derived products
@@ -182,12 +135,7 @@ class MeasurementParams(Params):
             list of :class:`ELDAmwl.products.ProductParams`:
             list of parameters of all basic products
         """
-        prod_df = self.measurement_params.product_table
-        prod_df = prod_df[prod_df['failed'] == False]
-        if res is not None:
-            prod_df = prod_df[prod_df[RESOLUTION_STR[res]]]
-        ids = prod_df['id'][~prod_df.basic]
-        return self.filtered_list(ids)
+        return self.filtered_list(self.product_index.find(res=res, basic=False))
 
     def failed_products(self):
         """list of parameters of all products which could not be derived
@@ -196,10 +144,7 @@ class MeasurementParams(Params):
             list of :class:`ELDAmwl.products.ProductParams`:
             list of parameters of all products which could not be derived
         """
-        prod_df = self.measurement_params.product_table
-        prod_df = prod_df[prod_df['failed']]
-        ids = prod_df['id']
-        return self.filtered_list(ids)
+        return self.filtered_list(self.product_index.failed_ids())
 
     def all_products_of_res(self, res, include_failed=False):
         """list of parameters of all products with resolution res
@@ -208,11 +153,16 @@ class MeasurementParams(Params):
             list of :class:`ELDAmwl.products.ProductParams`:
             list of parameters of all products with resolution res
         """
-        prod_df = self.measurement_params.product_table
-        if not include_failed:
-            prod_df = prod_df[prod_df['failed'] == False]
-        ids = prod_df['id'][prod_df[RESOLUTION_STR[res]]]
-        return self.filtered_list(ids)
+        return self.filtered_list(self.product_index.find(res=res, include_failed=include_failed))
+
+    def has_product(self, prod_param, res=None, include_failed=False):
+        """whether the product of prod_param shall be calculated with resolution res
+
+        Returns:
+            bool: True if prod_param is in the list of all products with resolution res
+        """
+        bits = self.product_index.select(res=res, include_failed=include_failed)
+        return bool(bits & self.product_index.bit(prod_param.prod_id_str))
 
     def all_products_of_type(self, type, res=None):
         """list of parameters of all products of requested type
@@ -221,12 +171,7 @@ class MeasurementParams(Params):
             list of :class:`ELDAmwl.products.ProductParams`:
             list of parameters of all products with requested type
         """
-        prod_df = self.measurement_params.product_table
-        prod_df = prod_df[prod_df['failed'] == False]
-        if res is not None:
-            prod_df = prod_df[prod_df[RESOLUTION_STR[res]]]
-        ids = prod_df['id'][prod_df.type == type]
-        return self.filtered_list(ids)
+        return self.filtered_list(self.product_index.find(prod_types=[type], res=res))
 
     def all_basic_products_of_wl(self, wl):
         """list of parameters of all basic products with wavelength wl
@@ -235,10 +180,7 @@ class MeasurementParams(Params):
             list of :class:`ELDAmwl.products.ProductParams`:
             list of parameters of all basic products with wavelength wl
         """
-        prod_df = self.measurement_params.product_table
-        prod_df = prod_df[prod_df['failed'] == False]
-        ids = prod_df['id'][(prod_df.wl == wl) & (prod_df.basic)]
-        return self.filtered_list(ids)
+        return self.filtered_list(self.product_index.find(wl=wl, basic=True))
 
     def extinction_products(self, res=None):
         """list of parameters of all extinction products
@@ -247,12 +189,7 @@ class MeasurementParams(Params):
             list of :class:`ELDAmwl.products.ProductParams`:
             list of parameters of all extinction products
         """
-        prod_df = self.measurement_params.product_table
-        prod_df = prod_df[prod_df['failed'] == False]
-        if res is not None:
-            prod_df = prod_df[prod_df[RESOLUTION_STR[res]]]
-        ids = prod_df['id'][prod_df.type == EXT]
-        return self.filtered_list(ids)
+        return self.all_products_of_type(EXT, res=res)
 
     def raman_bsc_products(self, res=None):
         """list of parameters of all Raman backscatter products
@@ -261,12 +198,7 @@ class MeasurementParams(Params):
             list of :class:`ELDAmwl.products.ProductParams`:
             list of parameters of all Raman backscatter products
         """
-        prod_df = self.measurement_params.product_table
-        prod_df = prod_df[prod_df['failed'] == False]
-        if res is not None:
-            prod_df = prod_df[prod_df[RESOLUTION_STR[res]]]
-        ids = prod_df['id'][prod_df.type == RBSC]
-        return self.filtered_list(ids)
+        return self.all_products_of_type(RBSC, res=res)
 
     def elast_bsc_products(self, res=None):
         """list of parameters of all elastic backscatter products
@@ -275,12 +207,7 @@ class MeasurementParams(Params):
             list of :class:`ELDAmwl.products.ProductParams`:
             list of parameters of all elastic backscatter products
         """
-        prod_df = self.measurement_params.product_table
-        prod_df = prod_df[prod_df['failed'] == False]
-        if res is not None:
-            prod_df = prod_df[prod_df[RESOLUTION_STR[res]]]
-        ids = prod_df['id'][prod_df.type == EBSC]
-        return self.filtered_list(ids)
+        return self.all_products_of_type(EBSC, res=res)
 
     def vldr_products(self, res=None, include_failed=False):
         """list of parameters of all vldr products
@@ -289,13 +216,8 @@ class MeasurementParams(Params):
             list of :class:`ELDAmwl.products.ProductParams`:
             list of parameters of all vldr products
         """
-        prod_df = self.measurement_params.product_table
-        if not include_failed:
-            prod_df = prod_df[prod_df['failed'] == False]
-        if res is not None:
-            prod_df = prod_df[prod_df[RESOLUTION_STR[res]]]
-        ids = prod_df['id'][prod_df.type == VLDR]
-        return self.filtered_list(ids)
+        return self.filtered_list(self.product_index.find(prod_types=[VLDR], res=res,
+                                                          include_failed=include_failed))
 
     def all_bsc_products(self, res=None):
         """list of parameters of all backscatter products
@@ -304,10 +226,7 @@ class MeasurementParams(Params):
             list of :class:`ELDAmwl.products.ProductParams`:
             list of parameters of all backscatter products
         """
-        if res is not None:
-            return self.raman_bsc_products(res=res) + self.elast_bsc_products(res=res)
-        else:
-            return self.raman_bsc_products() + self.elast_bsc_products()
+        return self.raman_bsc_products(res=res) + self.elast_bsc_products(res=res)
 
     def lidar_ratio_products(self, res=None):
         """list of parameters of all lidar_ratio products
@@ -316,46 +235,30 @@ class MeasurementParams(Params):
             list of :class:`ELDAmwl.products.ProductParams`:
             list of parameters of all lidar ratio products
         """
-        prod_df = self.measurement_params.product_table
-        prod_df = prod_df[prod_df['failed'] == False]
-        if res is not None:
-            prod_df = prod_df[prod_df[RESOLUTION_STR[res]]]
-        ids = prod_df['id'][prod_df.type == LR]
-        return self.filtered_list(ids)
+        return self.all_products_of_type(LR, res=res)
 
-    def angstroem_exp_products(self, res = None):
+    def angstroem_exp_products(self, res=None):
         """list of parameters of all angstroem_exp products
 
         Returns:
             list of :class:`ELDAmwl.products.ProductParams`:
             list of parameters of all angstroem exponent products
         """
-        prod_df = self.measurement_params.product_table
-        prod_df = prod_df[prod_df['failed'] == False]
-        if res is not None:
-            prod_df = prod_df[prod_df[RESOLUTION_STR[res]]]
-        ids = prod_df['id'][prod_df.type == AE]
-        return self.filtered_list(ids)
+        return self.all_products_of_type(AE, res=res)
 
     def filtered_list(self, filtered_ids):
-        """ converts a filtered subset of the product_table
+        """ converts a list of product ids (result of a search in the product_index)
         into list of product parameter instances`
 
         Args:
-            filtered_ids: filtered subset of the product_table (pd.DataFrame)
+            filtered_ids (list of str): product ids
 
         Returns:
             list of :class:`ELDAmwl.products.ProductParams`:
             list of parameters corresponding to the filtered_ids
 
         """
-        if len(filtered_ids) > 0:
-            result = []
-            for idx in filtered_ids:
-                result.append(self.measurement_params.product_list[idx])
-            return result
-        else:
-            return []
+        return [self.measurement_params.product_list[idx] for idx in filtered_ids]
 
     def count_scheduled_products(self):
         """counts the number of scheduled products.
@@ -365,10 +268,8 @@ class MeasurementParams(Params):
         Returns: (integer): number of products
 
         """
-        prod_df = self.measurement_params.product_table
-        result = prod_df[prod_df['lowres']].id.count() \
-                 + prod_df[prod_df['highres']].id.count()
-        return result
+        return self.product_index.count(res=LOWRES, include_failed=True) \
+            + self.product_index.count(res=HIGHRES, include_failed=True)
 
     def read_product_list(self):
         """Reads the parameter of all products of this measurement from database.
@@ -376,8 +277,9 @@ class MeasurementParams(Params):
         General information on the product (id, product type, wavelength,
         is it a basic product,
         to be calculated with high / low resolution, etc.) are
-        stored in the product_table (pandas.DataFrame).
-        This table is used for search
+        stored in the product_index
+        (:class:`ELDAmwl.elda_mwl.product_index.ProductIndex`).
+        This index is used for search
         and filter operations.
         The parameters (:class:`ELDAmwl.products.ProductParams`)
         itself are stored in
@@ -423,17 +325,10 @@ class MeasurementParams(Params):
     def prod_params(self, prod_type, wl, include_failed=False):
         """ returns a list with params of all products of type prod_type and wavelength wl
          """
-        prod_df = self.measurement_params.product_table
-        if not include_failed:
-            prod_df = prod_df[prod_df['failed'] == False]
-
-        ids = prod_df['id'][(prod_df.wl == wl) & (prod_df.type == prod_type)]
+        ids = self.product_index.find(prod_types=[prod_type], wl=wl, include_failed=include_failed)
 
-        if ids.size > 0:
-            result = []
-            for idx in ids:
-                result.append(self.measurement_params.product_list[idx])
-            return result
+        if len(ids) > 0:
+            return self.filtered_list(ids)
         else:
             return None
 
@@ -460,13 +355,11 @@ class MeasurementParams(Params):
             id (str): of the product with wavelength wl and type product_type
             None: if no product exists for wl and product_type
         """
-        prod_df = self.measurement_params.product_table
-        prod_df = prod_df[prod_df['failed'] == False]
-        ids = prod_df['id'][(prod_df.wl == wl) & (prod_df.type == prod_type)]
+        ids = self.product_index.find(prod_types=[prod_type], wl=wl)
 
-        if ids.size == 1:
-            return ids.values[0]
-        elif ids.size >= 1:
+        if len(ids) == 1:
+            return ids[0]
+        elif len(ids) > 1:
             self.logger.warning('more than one product id for wavelength {} and product type {}'.format(wl, prod_type))
             return None
         else:
@@ -504,6 +397,7 @@ class RunELDAmwl(BaseOperation):
         self.data_storage.set_scc_version_id(scc_version_id)
         self.params.load_from_db(meas_id)
 
+    @profiled_stage
     def read_tasks(self):
         """read from db which products shall be calculated and make sure that all the preprocessed files have the same resolution
 
@@ -530,14 +424,17 @@ class RunELDAmwl(BaseOperation):
         #  (calc_with_lr or calc_with_hr)
         # todo: check whether there is only one product per wavelength and type (e.g. no different usecases or Raman+elast
 
+    @profiled_stage
     def read_elpp_data(self):
         """read pre-processed signals from ELPP files
 
         """
         self.logger.info('read ELPP files')
+        elpp_files = ElppFileCache()
         for p_param in self.params.basic_products():
-            ElppData().read_nc_file(p_param)
+            elpp_files.read(p_param)
 
+    @profiled_stage
     def prepare_signals(self):
         """prepare signal data for optical retrievals
 
@@ -545,27 +442,23 @@ class RunELDAmwl(BaseOperation):
         self.logger.info('prepare signals')
         PrepareSignals()(products=self.params.basic_products()).run()
 
-    def get_basic_products(self):
-        """calculate basic products
-
-        """
-        self.logger.info('calc basic products ')
-        GetBasicProducts()(product_params=self.params).run()
-
-    def get_derived_products(self):
-        """calculate derived products
-
-        """
-        self.logger.info('calc derived products ')
-        GetDerivedProducts()(product_params=self.params).run()
-
-    def get_lidar_constants(self):
-        """calculate lidar constants
+    @profiled_stage
+    def get_products(self):
+        """calculate basic products, derived products, and lidar constants
 
+        All retrievals are combined in one dependency graph. Independent
+        retrievals can run concurrently (see cfg.NUM_THREADS), e.g.,
+        the derived products at one wavelength can be calculated while
+        the basic products at other wavelengths are still in progress.
         """
-        self.logger.info('calc lidar constants ')
-        GetLidarConstants()(product_params=self.params).run()
+        self.logger.info('calc basic products, derived products, and lidar constants ')
+        graph = TaskGraph()
+        GetBasicProducts()(product_params=self.params).add_tasks(graph)
+        GetDerivedProducts()(product_params=self.params).add_tasks(graph)
+        GetLidarConstants()(product_params=self.params).add_tasks(graph)
+        graph.run()
 
+    @profiled_stage
     def get_product_matrix(self):
         """combine all products in common matrixes
 
@@ -573,6 +466,7 @@ class RunELDAmwl(BaseOperation):
         self.logger.info('bring all products and cloud mask on common grid (altitude, time, wavelength) ')
         GetProductMatrix()(product_params=self.params).run()
 
+    @profiled_stage
     def quality_control(self):
         """synergystic quality control of all products
 
@@ -611,6 +505,7 @@ class RunELDAmwl(BaseOperation):
 #        for p_param in self.params.basic_products():
 #            self.data.basic_product_common_smooth(p_param.prod_id_str, 'lowres').save_to_netcdf()
 
+    @profiled_stage
     def write_mwl_output(self):
         """write mwl output in single nc file
 
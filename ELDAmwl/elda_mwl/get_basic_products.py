@@ -17,12 +17,18 @@ from ELDAmwl.component.registry import registry
 from ELDAmwl.depol.operation import VLRDFactory
 from ELDAmwl.depol.vertical_resolution.operation import VLDREffBinRes
 from ELDAmwl.depol.vertical_resolution.operation import VLDRUsedBinRes
+from ELDAmwl.elda_mwl.scheduler import product_node
+from ELDAmwl.elda_mwl.scheduler import qc_node
+from ELDAmwl.elda_mwl.scheduler import raw_node
+from ELDAmwl.elda_mwl.scheduler import TaskGraph
 from ELDAmwl.errors.exceptions import ELDAmwlException
 from ELDAmwl.errors.exceptions import NoCalibrWindowFound
 from ELDAmwl.errors.exceptions import UseCaseNotImplemented
 from ELDAmwl.extinction.operation import ExtinctionFactory
 from ELDAmwl.extinction.vertical_resolution.operation import ExtEffBinRes
 from ELDAmwl.extinction.vertical_resolution.operation import ExtUsedBinRes
+from ELDAmwl.storage.cached_functions import array_key
+from ELDAmwl.storage.cached_functions import fixed_smooth_profile
 from ELDAmwl.utils.constants import AUTO, P_ALL_OK
 from ELDAmwl.utils.constants import EBSC
 from ELDAmwl.utils.constants import EXT
@@ -31,6 +37,8 @@ from ELDAmwl.utils.constants import RBSC
 from ELDAmwl.utils.constants import RESOLUTION_STR
 from ELDAmwl.utils.constants import RESOLUTIONS
 from ELDAmwl.utils.constants import VLDR
+from ELDAmwl.utils.numerical import linear_transition
+from functools import partial
 
 import numpy as np
 import xarray as xr
@@ -62,11 +70,26 @@ class GetBasicProductsDefault(BaseOperation):
     product_params = None
     smooth_type = None
     bsc_calibr_window = None
+    raw_products = None
 
     def run(self):
+        graph = TaskGraph()
+        self.add_tasks(graph)
+        graph.run()
+
+    def add_tasks(self, graph):
+        """adds the retrievals of all basic products to the dependency graph
+
+        The common calibration window and the bin resolutions are needed by
+        all products. Therefore, they are derived immediately.
+
+        Args:
+            graph (:class:`ELDAmwl.elda_mwl.scheduler.TaskGraph`): the dependency graph
+        """
         # todo: write status of retrieval in database table eldamwl_product_status
         self.product_params = self.kwargs['product_params']
         self.smooth_type = self.product_params.smooth_params.smooth_type
+        self.raw_products = {}
 
         if len(self.product_params.all_bsc_products()) > 0:
             self.bsc_calibr_window = FindCommonBscCalibrWindow()(
@@ -86,7 +109,7 @@ class GetBasicProductsDefault(BaseOperation):
                                         'smoothing',
                                         '{0} or {1}'.format(AUTO, FIXED)))
 
-        self.get_common_smooth_products()
+        self.add_common_smooth_tasks(graph)
 
     def find_common_smooth(self):
         """
@@ -105,12 +128,34 @@ class GetBasicProductsDefault(BaseOperation):
         sp = self.product_params.smooth_params
         station_height = float(self.data_storage.header.vars.station_altitude)
 
+        # use dimensions and axes of cloud_mask
+        cm = self.data_storage.cloud_mask
+        altitude = cm.altitude.values
+
+        def first_bin_above(height):
+            """first bin with an altitude above height (above station) of each profile.
+            If the profile ends below height, the number of levels is returned"""
+            above = altitude > (height + station_height)
+            return np.where(above.any(axis=-1), above.argmax(axis=-1), altitude.shape[-1])
+
         for res in RESOLUTIONS:
-            # use dimensions and axes of cloud_mask
-            cm = self.data_storage.cloud_mask
+            # resolutions below and above transition zone
+            vert_res_low = sp.vert_res[RESOLUTION_STR[res]]['lowrange']
+            vert_res_high = sp.vert_res[RESOLUTION_STR[res]]['highrange']
 
-            # create empty array
-            vres = xr.DataArray(np.ones(cm.shape)*np.nan,
+            key = ('vertical_resolution',
+                   array_key(altitude),
+                   station_height,
+                   sp.transition_zone.bottom,
+                   sp.transition_zone.top,
+                   vert_res_low,
+                   vert_res_high)
+            vres = xr.DataArray(fixed_smooth_profile(key, partial(linear_transition,
+                                                                  altitude.shape[-1],
+                                                                  first_bin_above(sp.transition_zone.bottom),
+                                                                  first_bin_above(sp.transition_zone.top),
+                                                                  vert_res_low,
+                                                                  vert_res_high)),
                                 dims=cm.dims,
                                 name='vertical_resolution',
                                 coords=cm.coords,
@@ -120,27 +165,6 @@ class GetBasicProductsDefault(BaseOperation):
                                     'units': 'm',
                                     })
 
-            # resolutions below and above transition zone
-            vert_res_low = sp.vert_res[RESOLUTION_STR[res]]['lowrange']
-            vert_res_high = sp.vert_res[RESOLUTION_STR[res]]['highrange']
-
-            for t in range(cm.time.shape[0]):
-                # first and last bin of transition zone
-                tz_bottom_bin = np.where(cm.altitude[t].values > (sp.transition_zone.bottom + station_height))[0][0]
-                tz_top_bin = np.where(cm.altitude[t].values > (sp.transition_zone.top + station_height))[0][0]
-
-                # gradient within transition zone
-                delta_res = (vert_res_high - vert_res_low) / (tz_top_bin - tz_bottom_bin)
-
-                # ! reversed logic! because
-                # where(condition, fillvalue where condition is not true)
-                vres[t] = vres[t].where(vres.level > tz_bottom_bin, vert_res_low)
-                vres[t] = vres[t].where(vres.level < tz_top_bin, vert_res_high)
-
-                # fill data in transition zone
-                for idx in range(int(tz_bottom_bin), int(tz_top_bin)):
-                    vres[t, idx] = float(vert_res_low + delta_res * (idx - tz_bottom_bin))
-
             # write vres in data storage
             self.data_storage.set_common_vertical_resolution(res, vres)
 
@@ -158,13 +182,14 @@ class GetBasicProductsDefault(BaseOperation):
                 pid = prod_param.prod_id_str
                 used_binres_routine = GET_USED_BINRES_CLASSES[prod_param.product_type]()(prod_id=pid)
                 # todo: get binres for all signals involved in the product and then store the max of them
-                # dummy_sig is a deepcopy from data storage
-                dummy_sig = self.data_storage.prepared_signals(pid)[0]
-                binres = dummy_sig.get_binres_from_fixed_smooth(
-                    sp,
-                    res,
-                    used_binres_routine=used_binres_routine,
-                )
+                # dummy_sig is only read -> read-only view of the data storage
+                with self.data_storage.borrow():
+                    dummy_sig = self.data_storage.prepared_signals(pid)[0]
+                    binres = dummy_sig.get_binres_from_fixed_smooth(
+                        sp,
+                        res,
+                        used_binres_routine=used_binres_routine,
+                    )
                 self.data_storage.set_binres_common_smooth(pid, res, binres)
 
     def get_auto_smooth_products(self):
@@ -177,17 +202,43 @@ class GetBasicProductsDefault(BaseOperation):
         # todo: get elast_bsc
         # todo: get vol_depol
 
-    def get_common_smooth_products(self):
-        """get all basic products with pre-defined smoothing
+    def add_common_smooth_tasks(self, graph):
+        """adds the retrievals of all basic products with pre-defined smoothing to the dependency graph
 
         """
         self.logger.info('get products on common smooth grid')
-        self.get_extinctions_fixed_smooth()
-        self.get_raman_bsc_fixed_smooth()
-        self.get_elast_bsc_fixed_smooth()
-        self.get_bsc_ratios_fixed_smooth()
-        self.get_vldr_fixed_smooth()
-        self.single_products_quality_control()
+        self.add_extinction_tasks(graph)
+        self.add_raman_bsc_tasks(graph)
+        self.add_elast_bsc_tasks(graph)
+        self.add_bsc_ratio_tasks(graph)
+        self.add_vldr_tasks(graph)
+        self.add_quality_control_tasks(graph)
+
+    def add_smoothing_tasks(self, graph, prod_param, get_raw_product, smooth_product):
+        """adds the retrieval of an un-smoothed product and its smoothing with each required resolution
+
+        Args:
+            graph (:class:`ELDAmwl.elda_mwl.scheduler.TaskGraph`): the dependency graph
+            prod_param (:class:`ELDAmwl.products.ProductParams`): params of the product
+            get_raw_product (callable): retrieves the un-smoothed product (argument: prod_param)
+            smooth_product (callable): smoothes the product (arguments: prod_param, res)
+        """
+        prod_id = prod_param.prod_id_str
+        graph.add(raw_node(prod_id), partial(get_raw_product, prod_param))
+
+        smoothed = []
+        for res in RESOLUTIONS:
+            # if resolution res is required: smooth a copy of the raw product
+            if self.product_params.has_product(prod_param, res=res):
+                graph.add(product_node(prod_id, res),
+                          partial(smooth_product, prod_param, res),
+                          depends_on=[raw_node(prod_id)])
+                smoothed.append(product_node(prod_id, res))
+
+        # the raw product is not needed anymore after smoothing
+        graph.add(('release', prod_id),
+                  partial(self.raw_products.pop, prod_id, None),
+                  depends_on=[raw_node(prod_id)] + smoothed)
 
     def get_extinctions_auto_smooth(self):
         """get extinction products with automatic smoothing
@@ -202,26 +253,30 @@ class GetBasicProductsDefault(BaseOperation):
             self.data_storage.set_basic_product_auto_smooth(
                 ext_param.prod_id_str, extinction)
 
-    def get_extinctions_fixed_smooth(self):
-        """get extinction products with pre-defined smoothing
-
-        """
+    def add_extinction_tasks(self, graph):
         for res in RESOLUTIONS:
             ext_params = self.product_params.extinction_products(res=res)
             if len(ext_params) == 0:
                 self.logger.warning(f'no extinction products will be calculated with {RESOLUTION_STR[res]}')
             for ext_param in ext_params:
-                self.logger.info('get extinction at {0} nm (product id {1})'.format(
-                    ext_param.general_params.emission_wavelength, ext_param.prod_id_str))
-
-                extinction = ExtinctionFactory()(
-                    data_storage=self.data_storage,
-                    ext_param=ext_param,
-                    autosmooth=False,
-                    resolution=res,
-                ).get_product()
-                self.data_storage.set_basic_product_common_smooth(
-                    ext_param.prod_id_str, res, extinction)
+                graph.add(product_node(ext_param.prod_id_str, res),
+                          partial(self.get_extinction_fixed_smooth, ext_param, res))
+
+    def get_extinction_fixed_smooth(self, ext_param, res):
+        """get an extinction product with pre-defined smoothing
+
+        """
+        self.logger.info('get extinction at {0} nm (product id {1})'.format(
+            ext_param.general_params.emission_wavelength, ext_param.prod_id_str))
+
+        extinction = ExtinctionFactory()(
+            data_storage=self.data_storage,
+            ext_param=ext_param,
+            autosmooth=False,
+            resolution=res,
+        ).get_product()
+        self.data_storage.set_basic_product_common_smooth(
+            ext_param.prod_id_str, res, extinction)
 
     def get_raman_bsc_auto_smooth(self):
         for bsc_param in self.product_params.raman_bsc_products():
@@ -242,88 +297,91 @@ class GetBasicProductsDefault(BaseOperation):
             self.data_storage.set_basic_product_auto_smooth(
                 prod_id, smooth_bsc)
 
-    def get_raman_bsc_fixed_smooth(self):
+    def calibr_window(self, bsc_param):
+        """calibration window of a backscatter product
+
+        If no common calibration window for all bsc has been found
+        -> use calibration window of the individual bsc product
+        """
+        if self.bsc_calibr_window is not None:
+            return self.bsc_calibr_window
+        elif bsc_param.calibr_window is not None:
+            return bsc_param.calibr_window
+        else:
+            raise NoCalibrWindowFound(bsc_param.prod_id_str)
+
+    def smooth_product(self, prod_param, res):
+        """smoothes a copy of the raw product with the common bin resolution res
+
+        """
+        prod_id = prod_param.prod_id_str
+        if prod_param.has_failed(self.product_params):
+            return
+
+        smooth_product = deepcopy(self.raw_products[prod_id])
+        smooth_product.smooth(self.data_storage.binres_common_smooth(prod_id, res))
+        smooth_product.resolution = res
+        self.data_storage.set_basic_product_common_smooth(
+            prod_id, res, smooth_product)
+
+    def add_raman_bsc_tasks(self, graph):
         if len(self.product_params.raman_bsc_products()) == 0:
             self.logger.warning('no Raman backscatter products will be calculated')
 
         for bsc_param in self.product_params.raman_bsc_products():
-            prod_id = bsc_param.prod_id_str
-            self.logger.info('get Raman backscatter at {0} nm (product id {1})'.format(
-                bsc_param.general_params.emission_wavelength,
-                prod_id
-            ))
-
-            # if no common calibration window for all bsc has been found
-            # -> use calibration window of the individual bsc product
-            if self.bsc_calibr_window is not None:
-                cal_win = self.bsc_calibr_window
-            elif bsc_param.calibr_window is not None:
-                cal_win = bsc_param.calibr_window
-            else:
-                raise NoCalibrWindowFound(prod_id)
+            self.add_smoothing_tasks(graph, bsc_param, self.get_raman_bsc, self.smooth_product)
+
+    def get_raman_bsc(self, bsc_param):
+        prod_id = bsc_param.prod_id_str
+        self.logger.info('get Raman backscatter at {0} nm (product id {1})'.format(
+            bsc_param.general_params.emission_wavelength,
+            prod_id
+        ))
+
+        # calc preliminary bsc
+        self.raw_products[prod_id] = RamanBackscatterFactory()(
+            data_storage=self.data_storage,
+            bsc_param=bsc_param,
+            calibr_window=self.calibr_window(bsc_param),
+            autosmooth=False,
+        ).get_product()
+
+    def add_elast_bsc_tasks(self, graph):
+        if len(self.product_params.elast_bsc_products()) == 0:
+            self.logger.warning('no elastic backscatter products will be calculated')
+
+        for bsc_param in self.product_params.elast_bsc_products():
+            self.add_smoothing_tasks(graph, bsc_param, self.get_elast_bsc, self.smooth_elast_bsc)
 
+    def get_elast_bsc(self, bsc_param):
+        self.logger.info('get elastic backscatter at {0} nm  (product id {1})'.format(
+            bsc_param.general_params.emission_wavelength,
+            bsc_param.prod_id_str
+        ))
+        prod_id = bsc_param.prod_id_str
+        cal_win = self.calibr_window(bsc_param)
+
+        try:
             # calc preliminary bsc
-            bsc = RamanBackscatterFactory()(
+            self.raw_products[prod_id] = ElastBackscatterFactory()(
                 data_storage=self.data_storage,
                 bsc_param=bsc_param,
                 calibr_window=cal_win,
                 autosmooth=False,
             ).get_product()
-
-            for res in RESOLUTIONS:
-                # if resolution res is required: make a copy of bsc and smooth it
-                if bsc_param in self.product_params.all_products_of_res(res):
-                    smooth_bsc = deepcopy(bsc)
-                    smooth_bsc.smooth(self.data_storage.binres_common_smooth(prod_id, res))
-                    smooth_bsc.resolution = res
-                    self.data_storage.set_basic_product_common_smooth(
-                        prod_id, res, smooth_bsc)
-            del bsc
-
-    def get_elast_bsc_fixed_smooth(self):
-        if len(self.product_params.elast_bsc_products()) == 0:
-            self.logger.warning('no elastic backscatter products will be calculated')
-
-        for bsc_param in self.product_params.elast_bsc_products():
-            self.logger.info('get elastic backscatter at {0} nm  (product id {1})'.format(
-                bsc_param.general_params.emission_wavelength,
-                bsc_param.prod_id_str
-            ))
-            prod_id = bsc_param.prod_id_str
-
-            # if no common calibration window for all bsc has been found
-            # -> use calibration window of the individual bsc product
-            if self.bsc_calibr_window is not None:
-                cal_win = self.bsc_calibr_window
-            elif bsc_param.calibr_window is not None:
-                cal_win = bsc_param.calibr_window
-            else:
-                raise NoCalibrWindowFound(prod_id)
-
-            try:
-                # calc preliminary bsc
-                bsc = ElastBackscatterFactory()(
-                    data_storage=self.data_storage,
-                    bsc_param=bsc_param,
-                    calibr_window=cal_win,
-                    autosmooth=False,
-                ).get_product()
-
-                for res in RESOLUTIONS:
-                    # if resolution res is required: make a copy of bsc and smooth it
-                    if bsc_param in self.product_params.all_products_of_res(res):
-                        smooth_bsc = deepcopy(bsc)
-                        smooth_bsc.smooth(self.data_storage.binres_common_smooth(prod_id, res))
-                        smooth_bsc.resolution = res
-                        self.data_storage.set_basic_product_common_smooth(
-                            prod_id, res, smooth_bsc)
-                del bsc
-            except ELDAmwlException as e:
-                self.logger.error('cannot get backscatter product {}'.format(bsc_param.prod_id_str))
-                bsc_param.mark_as_failed(self.product_params)
-
-    def get_bsc_ratios_fixed_smooth(self):
-        """"get backscatter ratios from all scheduled backscatter coefficients
+        except ELDAmwlException as e:
+            self.logger.error('cannot get backscatter product {}: {}'.format(bsc_param.prod_id_str, e))
+            bsc_param.mark_as_failed(self.product_params)
+
+    def smooth_elast_bsc(self, bsc_param, res):
+        try:
+            self.smooth_product(bsc_param, res)
+        except ELDAmwlException as e:
+            self.logger.error('cannot get backscatter product {}: {}'.format(bsc_param.prod_id_str, e))
+            bsc_param.mark_as_failed(self.product_params)
+
+    def add_bsc_ratio_tasks(self, graph):
+        """"adds the backscatter ratios of all scheduled backscatter coefficients to the dependency graph
         """
 
         for res in RESOLUTIONS:
@@ -333,55 +391,66 @@ class GetBasicProductsDefault(BaseOperation):
                 self.logger.warning(f'no backscatter ratio can be calculated with '
                                     f'{RESOLUTION_STR[res]} because no bsc coef is available')
             for bsc_param in bsc_params:
-                prod_id = bsc_param.prod_id_str
-                wl = bsc_param.general_params.emission_wavelength
-                self.logger.info(f'get backscatter ratio at {wl} nm '
-                                 f'from product {prod_id} '
-                                 f'with {RESOLUTION_STR[res]} resolution')
-                # find corresponding bsc profile
-                bsc = self.data_storage.basic_product_common_smooth(prod_id, res)
-                # calculate backscatter ratio and put it in data storage
-                bsc_ratio = BackscatterRatios.from_bsc(bsc)
-                self.data_storage.set_basic_product_common_smooth(
-                    bsc_ratio.product_id_str, res, bsc_ratio)
-
-    def get_vldr_fixed_smooth(self):
+                graph.add(product_node(bsc_param.prod_id_bsc_ratio_str, res),
+                          partial(self.get_bsc_ratio_fixed_smooth, bsc_param, res),
+                          depends_on=[product_node(bsc_param.prod_id_str, res)])
+
+    def get_bsc_ratio_fixed_smooth(self, bsc_param, res):
+        """"get the backscatter ratio of a backscatter coefficient
+        """
+        if bsc_param.has_failed(self.product_params):
+            return
+
+        prod_id = bsc_param.prod_id_str
+        wl = bsc_param.general_params.emission_wavelength
+        self.logger.info(f'get backscatter ratio at {wl} nm '
+                         f'from product {prod_id} '
+                         f'with {RESOLUTION_STR[res]} resolution')
+        # find corresponding bsc profile
+        bsc = self.data_storage.basic_product_common_smooth(prod_id, res)
+        # calculate backscatter ratio and put it in data storage
+        bsc_ratio = BackscatterRatios.from_bsc(bsc)
+        self.data_storage.set_basic_product_common_smooth(
+            bsc_ratio.product_id_str, res, bsc_ratio)
+
+    def add_vldr_tasks(self, graph):
         if len(self.product_params.vldr_products()) == 0:
             self.logger.warning('no VLDR products will be calculated')
 
         for depol_param in self.product_params.vldr_products():
-            prod_id = depol_param.prod_id_str
-            self.logger.info('get VLDR at {0} nm (product id {1})'.format(
-                depol_param.general_params.emission_wavelength,
-                prod_id
-            ))
-
-            # calc preliminary vlrd
-            vldr = VLRDFactory()(
-                data_storage=self.data_storage,
-                vldr_param=depol_param,
-                autosmooth=False,
-            ).get_product()
-
-            for res in RESOLUTIONS:
-                # if resolution res is required: make a copy of bsc and smooth it
-                if depol_param in self.product_params.all_products_of_res(res):
-                    smooth_vldr = deepcopy(vldr)
-                    smooth_vldr.smooth(self.data_storage.binres_common_smooth(prod_id, res))
-                    smooth_vldr.resolution = res
-                    self.data_storage.set_basic_product_common_smooth(
-                        prod_id, res, smooth_vldr)
-            del vldr
-
-    def single_products_quality_control(self):
+            self.add_smoothing_tasks(graph, depol_param, self.get_vldr, self.smooth_product)
+
+    def get_vldr(self, depol_param):
+        prod_id = depol_param.prod_id_str
+        self.logger.info('get VLDR at {0} nm (product id {1})'.format(
+            depol_param.general_params.emission_wavelength,
+            prod_id
+        ))
+
+        # calc preliminary vlrd
+        self.raw_products[prod_id] = VLRDFactory()(
+            data_storage=self.data_storage,
+            vldr_param=depol_param,
+            autosmooth=False,
+        ).get_product()
+
+    def add_quality_control_tasks(self, graph):
         for res in RESOLUTIONS:
-            all_products = self.product_params.basic_products(res=res)
-            # todo: add bsc ratio
-            for prod_param in all_products:
+            for prod_param in self.product_params.basic_products(res=res):
                 prod_id = prod_param.prod_id_str
-                product = self.data_storage.basic_product_common_smooth(prod_id, res)
-                product.quality_control()
-                self.data_storage.set_basic_product_qc(prod_id, res, product)
+                graph.add(qc_node(prod_id, res),
+                          partial(self.single_product_quality_control, prod_param, res),
+                          depends_on=[product_node(prod_id, res)])
+
+    def single_product_quality_control(self, prod_param, res):
+        # todo: add bsc ratio
+        if prod_param.has_failed(self.product_params):
+            return
+
+        prod_id = prod_param.prod_id_str
+        product = self.data_storage.basic_product_common_smooth(prod_id, res)
+        product.quality_control()
+        self.data_storage.set_basic_product_qc(prod_id, res, product)
 
 
 class GetBasicProducts(BaseOperationFactory):
@@ -5,10 +5,15 @@ from ELDAmwl.backscatter.bsc_ratio.operation import StandardBackscatterRatioFact
 from ELDAmwl.bases.factory import BaseOperation
 from ELDAmwl.bases.factory import BaseOperationFactory
 from ELDAmwl.component.registry import registry
+from ELDAmwl.elda_mwl.scheduler import bsc_ratio_532_node
+from ELDAmwl.elda_mwl.scheduler import product_node
+from ELDAmwl.elda_mwl.scheduler import qc_node
+from ELDAmwl.elda_mwl.scheduler import TaskGraph
 from ELDAmwl.lidar_ratio.operation import LidarRatioFactory
 from ELDAmwl.utils.constants import RESOLUTIONS, RESOLUTION_STR
 from ELDAmwl.angstroem_exponent.operation import AngstroemExpFactory
 from ELDAmwl.utils.constants import RESOLUTIONS
+from functools import partial
 
 
 class GetDerivedProductsDefault(BaseOperation):
@@ -19,59 +24,92 @@ class GetDerivedProductsDefault(BaseOperation):
     product_params = None
 
     def run(self):
+        graph = TaskGraph()
+        self.add_tasks(graph)
+        graph.run()
+
+    def add_tasks(self, graph):
+        """adds the retrievals of all derived products to the dependency graph
+
+        Args:
+            graph (:class:`ELDAmwl.elda_mwl.scheduler.TaskGraph`): the dependency graph
+        """
         # todo: write status of retrieval in database table eldamwl_product_status
 
         self.product_params = self.kwargs['product_params']
 
-        self.get_derived_products()
+        self.add_standard_bsc_ratio_tasks(graph)
+        self.add_lidar_ratio_tasks(graph)
+        self.add_angstroem_exp_tasks(graph)
+        self.add_quality_control_tasks(graph)
 
-    def single_products_quality_control(self):
+    def add_quality_control_tasks(self, graph):
         for res in RESOLUTIONS:
             all_products = self.product_params.derived_products(res=res)
             for prod_param in all_products:
                 prod_id = prod_param.prod_id_str
-                product = self.data_storage.derived_product_common_smooth(prod_id, res)
-                product.quality_control()
-                self.data_storage.set_derived_products_qc(prod_id, res, product)
+                # the screening for aerosol free layers needs the standard backscatter ratio
+                graph.add(qc_node(prod_id, res),
+                          partial(self.single_product_quality_control, prod_id, res),
+                          depends_on=[product_node(prod_id, res), bsc_ratio_532_node(res)])
 
-    def get_derived_products(self):
-        self.get_standard_bsc_ratio()
-        self.get_lidar_ratios()
-        self.get_angstroem_exps()
-        self.single_products_quality_control()
+    def single_product_quality_control(self, prod_id, res):
+        product = self.data_storage.derived_product_common_smooth(prod_id, res)
+        product.quality_control()
+        self.data_storage.set_derived_products_qc(prod_id, res, product)
 
-    def get_standard_bsc_ratio(self):
+    def add_standard_bsc_ratio_tasks(self, graph):
         """
-        get the standard backscatter ratio profile for determination of aerosol free layers
+        adds the standard backscatter ratio profile for determination of aerosol free layers
+        to the dependency graph
         Returns: None
 
         """
         for res in RESOLUTIONS:
-            bsc_ratio = StandardBackscatterRatioFactory()(resolution=res).get_product()
-            if bsc_ratio is not None:
-                self.data_storage.set_bsc_ratio_532(res, bsc_ratio)
+            bsc_ratios = [product_node(bsc_param.prod_id_bsc_ratio_str, res)
+                          for bsc_param in self.product_params.all_bsc_products(res=res)]
+            graph.add(bsc_ratio_532_node(res),
+                      partial(self.get_standard_bsc_ratio, res),
+                      depends_on=bsc_ratios)
 
-    def get_lidar_ratios(self):
+    def get_standard_bsc_ratio(self, res):
+        """
+        get the standard backscatter ratio profile for determination of aerosol free layers
+        Returns: None
+
+        """
+        bsc_ratio = StandardBackscatterRatioFactory()(resolution=res).get_product()
+        if bsc_ratio is not None:
+            self.data_storage.set_bsc_ratio_532(res, bsc_ratio)
+
+    def add_lidar_ratio_tasks(self, graph):
         for res in RESOLUTIONS:
             lr_params = self.product_params.lidar_ratio_products(res=res)
             if len(lr_params) == 0:
                 self.logger.warning(f'no lidar ratio product will be calculated with {RESOLUTION_STR[res]} resolution')
 
             for lr_param in lr_params:
-                prod_id = lr_param.prod_id_str
-                self.logger.info('get lidar ratio at {0} nm (product id {1})'.format(
-                    lr_param.general_params.emission_wavelength,
-                    prod_id
-                ))
-
-                lr = LidarRatioFactory()(
-                    lr_param=lr_param,
-                    resolution=res).get_product()
-
-                self.data_storage.set_derived_products(
-                    prod_id, res, lr)
-
-    def get_angstroem_exps(self):
+                # the lidar ratio is derived from the quality controlled extinction and backscatter
+                graph.add(product_node(lr_param.prod_id_str, res),
+                          partial(self.get_lidar_ratio, lr_param, res),
+                          depends_on=[qc_node(lr_param.ext_prod_id, res),
+                                      qc_node(lr_param.bsc_prod_id, res)])
+
+    def get_lidar_ratio(self, lr_param, res):
+        prod_id = lr_param.prod_id_str
+        self.logger.info('get lidar ratio at {0} nm (product id {1})'.format(
+            lr_param.general_params.emission_wavelength,
+            prod_id
+        ))
+
+        lr = LidarRatioFactory()(
+            lr_param=lr_param,
+            resolution=res).get_product()
+
+        self.data_storage.set_derived_products(
+            prod_id, res, lr)
+
+    def add_angstroem_exp_tasks(self, graph):
         for res in RESOLUTIONS:
             ae_params = self.product_params.angstroem_exp_products(res=res)
 
@@ -80,20 +118,26 @@ class GetDerivedProductsDefault(BaseOperation):
                                     f'with {RESOLUTION_STR[res]} resolution')
 
             for ae_param in ae_params:
-                prod_id = ae_param.prod_id_str
-                self.logger.info('get angstroem exponent at {0} nm - {1} nm (product id {2}, {3})'.format(
-                    ae_param.lambda1_params.general_params.emission_wavelength,
-                    ae_param.lambda2_params.general_params.emission_wavelength,
-                    prod_id,
-                    RESOLUTION_STR[res]
-                ))
-
-                ae = AngstroemExpFactory()(
-                    ae_param=ae_param,
-                    resolution=res).get_product()
-
-                self.data_storage.set_derived_products(
-                    prod_id, res, ae)
+                graph.add(product_node(ae_param.prod_id_str, res),
+                          partial(self.get_angstroem_exp, ae_param, res),
+                          depends_on=[product_node(ae_param.lambda1_prod_id, res),
+                                      product_node(ae_param.lambda2_prod_id, res)])
+
+    def get_angstroem_exp(self, ae_param, res):
+        prod_id = ae_param.prod_id_str
+        self.logger.info('get angstroem exponent at {0} nm - {1} nm (product id {2}, {3})'.format(
+            ae_param.lambda1_params.general_params.emission_wavelength,
+            ae_param.lambda2_params.general_params.emission_wavelength,
+            prod_id,
+            RESOLUTION_STR[res]
+        ))
+
+        ae = AngstroemExpFactory()(
+            ae_param=ae_param,
+            resolution=res).get_product()
+
+        self.data_storage.set_derived_products(
+            prod_id, res, ae)
 
 
 class GetDerivedProducts(BaseOperationFactory):
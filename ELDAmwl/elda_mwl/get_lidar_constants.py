@@ -4,9 +4,14 @@
 from ELDAmwl.bases.factory import BaseOperation
 from ELDAmwl.bases.factory import BaseOperationFactory
 from ELDAmwl.component.registry import registry
+from ELDAmwl.elda_mwl.scheduler import lidar_constant_node
+from ELDAmwl.elda_mwl.scheduler import product_node
+from ELDAmwl.elda_mwl.scheduler import TaskGraph
 from ELDAmwl.errors.exceptions import ELDAmwlException
 from ELDAmwl.lidar_constant.operation import LidarConstantFactory
-from ELDAmwl.utils.constants import EBSC, RBSC
+from ELDAmwl.utils.constants import EBSC, LR, RBSC
+from ELDAmwl.utils.constants import RESOLUTIONS
+from functools import partial
 
 
 class GetLidarConstantsDefault(BaseOperation):
@@ -16,24 +21,50 @@ class GetLidarConstantsDefault(BaseOperation):
     mwl_product_params = None
 
     def run(self):
+        graph = TaskGraph()
+        self.add_tasks(graph)
+        graph.run()
+
+    def add_tasks(self, graph):
+        """adds the retrievals of the lidar constants of all wavelengths to the dependency graph
+
+        The lidar constants at a wavelength are derived from the backscatter and
+        lidar ratio products at this wavelength.
+
+        Args:
+            graph (:class:`ELDAmwl.elda_mwl.scheduler.TaskGraph`): the dependency graph
+        """
         self.mwl_product_params = self.kwargs['product_params']
-        self.get_lidar_constants()
 
-    def get_lidar_constants(self):
         wavelengths = self.mwl_product_params.wavelengths(prod_types=[RBSC, EBSC])
         if len(wavelengths) == 0:
             self.logger.warning('no lidar constants can be derived because no backscatter profiles are available')
 
         for wl in wavelengths:
-            self.logger.info('get lidar constant at {0} nm'.format(wl))
-            try:
-                lc = LidarConstantFactory()(
-                    wavelength=wl,
-                    mwl_product_params=self.mwl_product_params).run()
-
-                self.data_storage.set_lidar_constant(wl, lc)
-            except ELDAmwlException as e:
-                self.logger.error('could not derive lidar constant')
+            products = []
+            for prod_type in [RBSC, EBSC, LR]:
+                prod_param = self.mwl_product_params.prod_param(prod_type, wl)
+                if prod_param is not None:
+                    products.extend([product_node(prod_param.prod_id_str, res) for res in RESOLUTIONS])
+
+            graph.add(lidar_constant_node(wl),
+                      partial(self.get_lidar_constant, wl),
+                      depends_on=products)
+
+    def get_lidar_constant(self, wl):
+        # the backscatter product at this wavelength may have failed in the meantime
+        if wl not in self.mwl_product_params.wavelengths(prod_types=[RBSC, EBSC]):
+            return
+
+        self.logger.info('get lidar constant at {0} nm'.format(wl))
+        try:
+            lc = LidarConstantFactory()(
+                wavelength=wl,
+                mwl_product_params=self.mwl_product_params).run()
+
+            self.data_storage.set_lidar_constant(wl, lc)
+        except ELDAmwlException as e:
+            self.logger.error('could not derive lidar constant at {0} nm: {1}'.format(wl, e))
 
 
 class GetLidarConstants(BaseOperationFactory):
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""index of all products of a measurement for search operations"""
+from ELDAmwl.utils.constants import RESOLUTIONS
+
+import numpy as np
+import threading
+
+
+def bit_positions(bits):
+    """positions of all set bits of bits in ascending order"""
+    result = []
+    while bits:
+        lowest_bit = bits & -bits
+        result.append(lowest_bit.bit_length() - 1)
+        bits ^= lowest_bit
+    return result
+
+
+class ProductIndex(object):
+    """
+    Table-like overview of all individual products of a measurement
+    (id, wavelength, product type, basic / derived, resolutions, failed).
+
+    It is used for search operations (e.g. for all extinction products or
+    all basic products or ..). Each product gets a bit position in the order in which
+    it was added. The index keeps one bitset (int) per product type,
+    wavelength and resolution, one for the basic and one for the failed products.
+    A search combines the requested bitsets with bitwise and and returns
+    the ids of the found products in the order in which they were added.
+    """
+
+    def __init__(self):
+        self.ids = []
+        self.positions = {}
+        self.wavelength_of = []
+        self.type_of = []
+        self.elpp_file_of = []
+
+        self.by_type = {}
+        self.by_wl = {}
+        self.by_res = {res: 0 for res in RESOLUTIONS}
+        self.basic = 0
+        self.derived = 0
+        self.failed = 0
+
+        # products may be marked as failed while other threads search the index
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, prod_id):
+        return prod_id in self.positions
+
+    @property
+    def all_products(self):
+        """bitset of all products"""
+        return (1 << len(self.ids)) - 1
+
+    def bit(self, prod_id):
+        """bitset with only the product prod_id (0 if the product is not in the index)"""
+        if prod_id in self.positions:
+            return 1 << self.positions[prod_id]
+        return 0
+
+    def add(self, prod_id, wl, prod_type, basic, derived, resolutions, elpp_file=None):
+        """adds a product to the index
+
+        If the product is in the index already, only its resolutions are extended.
+
+        Args:
+            prod_id (str): product id
+            wl (float): emission wavelength
+            prod_type (int): product type
+            basic (bool): whether it is a basic product
+            derived (bool): whether it is a derived product
+            resolutions (list): resolutions (LOWRES, HIGHRES) with which the product shall be calculated
+            elpp_file (str): name of the ELPP file of the product
+        """
+        with self.lock:
+            if prod_id not in self.positions:
+                position = len(self.ids)
+                bit = 1 << position
+                self.ids.append(prod_id)
+                self.positions[prod_id] = position
+
+                self.wavelength_of.append(None if wl is None else float(wl))
+                self.type_of.append(int(prod_type))
+                self.elpp_file_of.append(elpp_file)
+
+                self.by_type[int(prod_type)] = self.by_type.get(int(prod_type), 0) | bit
+                if (wl is not None) and not np.isnan(wl):
+                    self.by_wl[float(wl)] = self.by_wl.get(float(wl), 0) | bit
+                if basic:
+                    self.basic |= bit
+                if derived:
+                    self.derived |= bit
+            else:
+                bit = self.bit(prod_id)
+
+            for res in resolutions:
+                self.by_res[res] |= bit
+
+    def mark_as_failed(self, prod_id):
+        with self.lock:
+            self.failed |= self.bit(prod_id)
+
+    def has_failed(self, prod_id):
+        return bool(self.failed & self.bit(prod_id))
+
+    def failed_ids(self):
+        """ids of all failed products"""
+        return [self.ids[pos] for pos in bit_positions(self.failed)]
+
+    def select(self, prod_types=None, wl=None, res=None, basic=None, include_failed=False):
+        """bitset of all products which match all given criteria
+
+        Keyword Args:
+            prod_types (list of int): product types. default = None (all types)
+            wl (float): emission wavelength. default = None (all wavelengths)
+            res (int): LOWRES or HIGHRES. default = None (all resolutions)
+            basic (bool): True = only basic, False = only not basic products. default = None (both)
+            include_failed (bool): whether failed products are included. default = False
+
+        Returns:
+            int: bitset of the found products
+        """
+        result = self.all_products
+        if not include_failed:
+            result &= ~self.failed
+        if res is not None:
+            result &= self.by_res[res]
+        if basic is not None:
+            result &= self.basic if basic else ~self.basic
+        if wl is not None:
+            result &= self.by_wl.get(float(wl), 0)
+        if prod_types is not None:
+            type_bits = 0
+            for prod_type in prod_types:
+                type_bits |= self.by_type.get(prod_type, 0)
+            result &= type_bits
+        return result
+
+    def find(self, **criteria):
+        """ids of all products which match all criteria (see :meth:`select`)"""
+        return [self.ids[pos] for pos in bit_positions(self.select(**criteria))]
+
+    def wavelengths(self, **criteria):
+        """unique sorted list of the wavelengths of all products which match all criteria (see :meth:`select`)"""
+        wls = {self.wavelength_of[pos] for pos in bit_positions(self.select(**criteria))}
+        return sorted(wl for wl in wls if (wl is not None) and not np.isnan(wl))
+
+    def prod_types(self, **criteria):
+        """unique sorted list of the types of all products which match all criteria (see :meth:`select`)"""
+        return sorted({self.type_of[pos] for pos in bit_positions(self.select(**criteria))})
+
+    def count(self, **criteria):
+        """number of products which match all criteria (see :meth:`select`)"""
+        return bin(self.select(**criteria)).count('1')
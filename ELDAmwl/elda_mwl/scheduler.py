@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""dependency graph of the retrievals of a mwl product"""
+from addict import Dict
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+from ELDAmwl.component.interface import ICfg
+from ELDAmwl.component.interface import ILogger
+from ELDAmwl.component.interface import IMCPool
+from ELDAmwl.component.interface import IProfiler
+from ELDAmwl.errors.exceptions import DependencyCycle
+from ELDAmwl.log.profiler import NODE
+from functools import partial
+from zope import component
+
+
+def raw_node(prod_id_str):
+    """name of the node which retrieves the un-smoothed product prod_id_str"""
+    return 'raw', str(prod_id_str)
+
+
+def product_node(prod_id_str, res):
+    """name of the node which puts the product prod_id_str with resolution res into the data storage"""
+    return 'product', str(prod_id_str), res
+
+
+def qc_node(prod_id_str, res):
+    """name of the node which puts the quality controlled product prod_id_str into the data storage"""
+    return 'qc', str(prod_id_str), res
+
+
+def bsc_ratio_532_node(res):
+    """name of the node which derives the standard backscatter ratio at 532 nm"""
+    return 'bsc_ratio_532', res
+
+
+def lidar_constant_node(wl):
+    """name of the node which derives the lidar constants at wavelength wl"""
+    return 'lidar_constant', wl
+
+
+class TaskGraph(object):
+    """
+    Dependency graph (DAG) of retrievals.
+
+    Each node is a function without arguments, which is run as soon as all nodes
+    it depends on are finished. Dependencies on nodes which are not part of the graph
+    are regarded as fulfilled (e.g. products which were derived in a previous step).
+
+    With cfg.NUM_THREADS = 1 (serial mode), the nodes are run one after the other
+    in the order in which they were added (as far as the dependencies allow).
+    This order is reproducible, including the order of the log messages.
+    Otherwise, all nodes which are ready are run concurrently in a pool of
+    cfg.NUM_THREADS threads, and the wall time approaches the critical path
+    of the graph. The numerical results do not depend on the execution order.
+
+    If a node raises an exception, no further nodes are started, the running
+    nodes are finished, and the exception is raised again.
+    """
+
+    def __init__(self):
+        self.nodes = Dict()
+
+    @property
+    def cfg(self):
+        return component.queryUtility(ICfg)
+
+    @property
+    def logger(self):
+        return component.queryUtility(ILogger)
+
+    def add(self, name, func, depends_on=None):
+        """adds a node to the graph
+
+        Args:
+            name (hashable): unique name of the node
+            func (callable): function without arguments
+            depends_on (list, optional): names of the nodes which have to be finished before func is run
+        """
+        self.nodes[name] = Dict({'func': partial(self.run_node, name, func),
+                                 'depends_on': list(depends_on or []),
+                                 })
+
+    def run_node(self, name, func):
+        profiler = component.queryUtility(IProfiler)
+        if profiler is None:
+            func()
+        else:
+            if isinstance(name, tuple):
+                name = ':'.join(str(part) for part in name)
+            with profiler.measure(NODE, str(name)):
+                func()
+
+    def dependencies(self, name):
+        """names of the nodes of this graph on which node name depends"""
+        return {dep for dep in self.nodes[name].depends_on if dep in self.nodes}
+
+    def order(self):
+        """stable topological order of the nodes
+
+        Returns:
+            list of node names, each node comes after all nodes it depends on.
+            Independent nodes keep the order in which they were added.
+
+        Raises:
+            DependencyCycle: if some nodes depend on each other
+        """
+        result = []
+        done = set()
+        pending = list(self.nodes.keys())
+        while pending:
+            ready = [name for name in pending if self.dependencies(name) <= done]
+            if not ready:
+                raise DependencyCycle(pending)
+            # take the first ready node and start again from the beginning
+            # -> nodes which were added earlier are preferred
+            result.append(ready[0])
+            done.add(ready[0])
+            pending.remove(ready[0])
+        return result
+
+    def run(self, num_threads=None):
+        """runs all nodes of the graph
+
+        Args:
+            num_threads (int, optional): number of threads. default = cfg.NUM_THREADS
+        """
+        if num_threads is None:
+            num_threads = self.cfg.get('NUM_THREADS', 1)
+
+        order = self.order()
+
+        if num_threads <= 1 or len(order) <= 1:
+            for name in order:
+                self.nodes[name].func()
+        else:
+            self.run_concurrently(order, num_threads)
+
+    def run_concurrently(self, order, num_threads):
+        self.logger.debug('run {0} retrievals in {1} threads'.format(len(order), num_threads))
+        self.start_worker_processes()
+
+        pending = list(order)
+        running = {}
+        done = set()
+        error = None
+
+        with ThreadPoolExecutor(max_workers=num_threads, thread_name_prefix='ELDAmwl-node') as executor:
+            while pending or running:
+                if error is None:
+                    for name in [n for n in pending if self.dependencies(n) <= done]:
+                        pending.remove(name)
+                        running[executor.submit(self.nodes[name].func)] = name
+                if not running:
+                    break
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    done.add(running.pop(future))
+                    if (future.exception() is not None) and (error is None):
+                        error = future.exception()
+
+        if error is not None:
+            raise error
+
+    def start_worker_processes(self):
+        """starts the pool of MC worker processes before the threads are started
+
+        Forking a process which runs several threads can deadlock the child process.
+        """
+        mc_pool = component.queryUtility(IMCPool)
+        if self.cfg.get('PARALLEL', False) and (mc_pool is not None) and (mc_pool.pool is None):
+            mc_pool.start()
@@ -73,3 +73,5 @@ CLASS_REGISTRY_TOO_MAY_OVERRIDES = 101
 REPEATED_ATTEMPT_TO_NORMALZE_BY_SHOTS = 102
 # Raised on attempt to correct a signal for molecular transmission several times
 REPEATED_ATTEMPT_TO_CORRECT_MOL_TRANSM = 103
+# Raised if the retrievals of a dependency graph depend on each other in a cycle
+DEPENDENCY_CYCLE = 104
@@ -5,6 +5,7 @@ from ELDAmwl.errors.error_codes import CLASS_REGISTRY_TOO_MAY_OVERRIDES
 from ELDAmwl.errors.error_codes import COULD_NOT_FIND_CALIBR_WINDOW
 from ELDAmwl.errors.error_codes import DATA_NOT_IN_STORAGE
 from ELDAmwl.errors.error_codes import DB_ERROR
+from ELDAmwl.errors.error_codes import DEPENDENCY_CYCLE
 from ELDAmwl.errors.error_codes import DIFFERENT_BSC_OPTIONS_IN_MEASUREMENT
 from ELDAmwl.errors.error_codes import DIFFERENT_CLOUD_MASK_EXISTS
 from ELDAmwl.errors.error_codes import DIFFERENT_HEADER_EXISTS
@@ -143,6 +144,21 @@ class RepeatedNormalizeByshots(ELDAmwlException):
                .format(self.channel_id))
 
 
+class DependencyCycle(ELDAmwlException):
+    """
+    Raised if the nodes of a dependency graph depend on each other in a cycle
+    """
+    return_value = DEPENDENCY_CYCLE
+
+    def __init__(self, nodes):
+        self.nodes = nodes
+
+    def __str__(self):
+        return ('cannot schedule the nodes {0} '
+                'because they depend on each other'
+                .format(', '.join(str(n) for n in self.nodes)))
+
+
 class RepeatedCorrectMolTransm(ELDAmwlException):
     """
     Raised on attempt to correct a signal for molecular transmission it was already corrected before
@@ -14,8 +14,10 @@ from ELDAmwl.extinction.tools.operation import SlopeToExtinction
 from ELDAmwl.utils.constants import ABOVE_MAX_ALT
 from ELDAmwl.utils.constants import BELOW_OVL
 from ELDAmwl.utils.constants import MC
+from ELDAmwl.utils.numerical import sliding_bitwise_or
 
 import numpy as np
+import xarray as xr
 import zope
 
 
@@ -96,6 +98,7 @@ class CalcExtinctionDefault(BaseOperation):
     y_data = None
     yerr_data = None
     qf_data = None
+    binres_data = None
 
     def __init__(self, **kwargs):
         super(CalcExtinctionDefault, self).__init__(**kwargs)
@@ -126,22 +129,76 @@ class CalcExtinctionDefault(BaseOperation):
         self.y_data = np.array(data.ds.data)
         self.yerr_data = np.array(data.ds.err)
         self.qf_data = np.array(data.ds.qf)
+        self.binres_data = np.array(data.ds.binres)
 
     def calc_single_profile(self, t, data):
+        """finds the bins of one time slice whose fit window is outside the valid profile.
+
+        Returns:
+            tuple of 3 np.array of bool (level): True for the bins whose slope can be calculated,
+            True for the bins whose fit window reaches below the first valid bin,
+            True for the bins whose fit window reaches above the last valid bin
+        """
+        fit_mask = np.zeros(data.num_levels, dtype=bool)
+        below = np.zeros(data.num_levels, dtype=bool)
+        above = np.zeros(data.num_levels, dtype=bool)
+
         fvb = data.first_valid_bin(t)
         lvb = data.last_valid_bin(t)
-        for lev in range(fvb, lvb):
-            window = int(data.ds.binres[t, lev])
-            half_win = window // 2
+        if fvb is None:
+            return fit_mask, below, above
+
+        levels = np.arange(fvb, lvb)
+        half_win = self.binres_data[t, fvb:lvb] // 2
+
+        below[fvb:lvb] = levels < (fvb + half_win)
+        above[fvb:lvb] = ~below[fvb:lvb] & (levels >= (lvb - half_win))
+        fit_mask[fvb:lvb] = ~below[fvb:lvb] & ~above[fvb:lvb]
+
+        return fit_mask, below, above
+
+    def calc_fit_mask(self, data):
+        """flags the bins whose fit window is outside the valid profile (all time slices at once).
 
-            if lev < (fvb + half_win):
-                self.result.set_invalid_point(t, lev, BELOW_OVL)
+        Returns:
+            np.array of bool (time, level): True for the bins whose slope can be calculated
+        """
+        fit_mask = np.zeros(self.binres_data.shape, dtype=bool)
+        below = np.zeros(self.binres_data.shape, dtype=bool)
+        above = np.zeros(self.binres_data.shape, dtype=bool)
+        for t in range(data.num_times):
+            fit_mask[t], below[t], above[t] = self.calc_single_profile(t, data)
+
+        self.result.set_invalid_mask(below, BELOW_OVL)
+        self.result.set_invalid_mask(above, ABOVE_MAX_ALT)
 
-            elif lev >= (lvb - half_win):
-                self.result.set_invalid_point(t, lev, ABOVE_MAX_ALT)
+        return fit_mask
 
-            else:
-                self.calc_slope(t, lev, window, half_win)
+    def calc_profiles(self, fit_mask):
+        """calculates the slopes of all bins in fit_mask at once.
+
+        if the slope routine cannot handle complete (time, level) arrays
+        (e.g. plugins), each window is fitted separately
+        """
+        if not hasattr(self.slope_routine, 'run_profiles'):
+            for t, lev in zip(*np.where(fit_mask)):
+                window = int(self.binres_data[t, lev])
+                self.calc_slope(t, lev, window, window // 2)
+            return
+
+        sig_slope = self.slope_routine.run_profiles(
+            signal=Dict({'x_data': self.x_data,
+                         'y_data': self.y_data,
+                         'yerr_data': self.yerr_data,
+                         'binres': self.binres_data,
+                         }),
+            mask=fit_mask)
+        qf = sliding_bitwise_or(self.qf_data, self.binres_data, mask=fit_mask)
+
+        self.result.ds['data'].values[fit_mask] = sig_slope.slope[fit_mask]
+        self.result.ds['err'].values[fit_mask] = sig_slope.slope_err[fit_mask]
+        self.result.ds['qf'].values[fit_mask] = qf[fit_mask]
+        self.result.ds['binres'].values[fit_mask] = self.binres_data[fit_mask]
 
     def run(self, data=None):
         """
@@ -163,9 +220,16 @@ class CalcExtinctionDefault(BaseOperation):
 
         self.prepare_data(data)
 
-        for t in range(data.num_times):
-            self.calc_single_profile(t, data)
+        fit_mask = self.calc_fit_mask(data)
+
+        self.calc_profiles(fit_mask)
 
+        self.slope_to_extinction(self.result.ds, data)
+        self.result.profile_qf = deepcopy(data.profile_qf)
+
+        return self.result
+
+    def slope_to_extinction(self, slope, data):
         # extract relevant parameter for calculation of ext from signal slope
         # from ExtinctionParams into Dict
         param_dct = Dict({
@@ -176,11 +240,59 @@ class CalcExtinctionDefault(BaseOperation):
 
         # SlopeToExtinction converts the slope into extinction coefficients
         self.slope_to_ext_routine(
-            slope=self.result.ds,
+            slope=slope,
             ext_params=param_dct).run()
-        self.result.profile_qf = deepcopy(data.profile_qf)
 
-        return self.result
+    def run_samples(self, samples, samples_per_call=None):
+        """
+        run the extinction calculation for many Monte-Carlo samples at once
+
+        The samples are random variations of the data of self.signal. All other
+        variables (uncertainty, binres, qf) are the same for all samples. Therefore,
+        the fit windows are determined only once and the slopes of the samples
+        are fitted in chunks of samples_per_call samples per call of the slope routine.
+        The sample-independent arrays are broadcast against the samples, not copied.
+
+        Args:
+            samples (np.array): (sample, time, level) varied data of the Raman signal
+            samples_per_call (int, optional): maximum number of samples which are fitted
+                    in one call of the slope routine. Default = None => all samples at once
+
+        Returns:
+            np.array (sample, time, level) with the extinction coefficients of all samples or
+            None if the slope routine cannot handle complete profiles
+        """
+        if not hasattr(self.slope_routine, 'run_profiles'):
+            return None
+
+        data = self.signal
+        self.prepare_data(data)
+
+        fit_mask = self.calc_fit_mask(data)
+
+        num_samples = samples.shape[0]
+        if not samples_per_call:
+            samples_per_call = num_samples
+
+        result = np.full(samples.shape, np.nan)
+        for first in range(0, num_samples, samples_per_call):
+            chunk = slice(first, min(first + samples_per_call, num_samples))
+            sig_slope = self.slope_routine.run_profiles(
+                signal=Dict({'x_data': self.x_data,
+                             'y_data': samples[chunk],
+                             'yerr_data': self.yerr_data,
+                             'binres': self.binres_data,
+                             }),
+                mask=fit_mask)
+
+            slope = xr.Dataset(data_vars={
+                'data': (['sample', 'time', 'level'], sig_slope.slope),
+                'err': (['sample', 'time', 'level'], sig_slope.slope_err),
+            })
+            self.slope_to_extinction(slope, data)
+            result[chunk] = slope.data.values
+
+        return result
 
 
 class ExtinctionFactory(BaseOperationFactory):
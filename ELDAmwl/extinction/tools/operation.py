@@ -4,6 +4,7 @@ from ELDAmwl.bases.factory import BaseOperation
 from ELDAmwl.bases.factory import BaseOperationFactory
 from ELDAmwl.component.registry import registry
 from ELDAmwl.utils.constants import RANGE_BOUNDARY
+from ELDAmwl.utils.numerical import sliding_linear_fits
 from math import sqrt
 
 import numpy as np
@@ -55,6 +56,41 @@ class LinFit(BaseOperation):
 
         return result
 
+    def run_profiles(self, **kwargs):
+        """fits all sliding windows of complete (time, level) arrays at once
+
+        Keyword Args:
+            signal: addict.Dict with the keys 'x_data', 'y_data', 'yerr_data',
+                and 'binres' which are all np.array (time, level).
+                'binres' is the width of the fit window of each bin.
+                'y_data' may have leading dimensions (e.g. samples), the other
+                arrays are broadcast against it.
+            mask: np.array of bool (time, level), optional. Only bins where mask
+                is True are fitted. Default = None => all bins are fitted
+
+        Returns:
+            addict.Dict with keys 'slope' and 'slope_err' which are np.array with the shape of 'y_data'.
+            Bins which were not fitted are nan.
+
+        """
+        assert 'signal' in kwargs
+        self.data = kwargs['signal']
+
+        if self.kwargs['weight']:
+            yerr = self.data.yerr_data
+        else:
+            yerr = None
+
+        slope, slope_err = sliding_linear_fits(self.data.x_data,
+                                               self.data.y_data,
+                                               self.data.binres,
+                                               yerr_data=yerr,
+                                               mask=kwargs.get('mask'))
+
+        return Dict({'slope': slope,
+                     'slope_err': slope_err,
+                     })
+
 
 class WeightedLinearFit(BaseOperation):
     """
@@ -83,6 +119,21 @@ class WeightedLinearFit(BaseOperation):
 
         return self.fit.run(signal=kwargs['signal'])
 
+    def run_profiles(self, **kwargs):
+        """fits all sliding windows of complete (time, level) arrays at once
+
+        Keyword Args:
+            signal: addict.Dict with the keys 'x_data', 'y_data', \
+            'yerr_data', and 'binres' which are all np.array (time, level)
+            mask: np.array of bool (time, level), optional
+
+        Returns:
+            addict.Dict with keys 'slope' and 'slope_err' (np.array (time, level))
+
+        """
+        assert 'signal' in kwargs
+        return self.fit.run_profiles(**kwargs)
+
 
 class NonWeightedLinearFit(BaseOperation):
     """
@@ -110,6 +161,21 @@ class NonWeightedLinearFit(BaseOperation):
         assert 'signal' in kwargs
         return self.fit.run(signal=kwargs['signal'])
 
+    def run_profiles(self, **kwargs):
+        """fits all sliding windows of complete (time, level) arrays at once
+
+        Keyword Args:
+            signal: addict.Dict with the keys 'x_data', \
+            'y_data', 'yerr_data', and 'binres' which are all np.array (time, level)
+            mask: np.array of bool (time, level), optional
+
+        Returns:
+            addict.Dict with keys 'slope' and 'slope_err' (np.array (time, level))
+
+        """
+        assert 'signal' in kwargs
+        return self.fit.run_profiles(**kwargs)
+
 
 class SignalSlope(BaseOperationFactory):
     """
@@ -20,7 +20,7 @@ from ELDAmwl.utils.constants import OVL_FACTOR_ERR
 from ELDAmwl.utils.constants import RAMAN
 from ELDAmwl.utils.constants import RBSC
 from ELDAmwl.utils.constants import RESOLUTIONS
-from ELDAmwl.utils.numerical import integral_profile
+from ELDAmwl.utils.numerical import integral_profiles
 from numpy import sqrt
 from numpy import square as sqr
 
@@ -534,9 +534,22 @@ class CalcLidarConstantDefault(BaseOperation):
         # find valid time slices
         valid_ts = np.where(~self.bsc.data.isnull().all(dim='level'))[0]
 
+        # calculate atmospheric transmission below calibration height
+        # 1) integrated backscatter with lower and upper error bound,
+        # all valid time slices and bounds at once
+        bsc_data = self.bsc.data[valid_ts].values
+        bsc_err = self.bsc.err[valid_ts].values
+        int_bsc_bounds = integral_profiles(np.stack([bsc_data,
+                                                     bsc_data - bsc_err,
+                                                     bsc_data + bsc_err]),
+                                           range_axis=self.bsc.range[valid_ts].values,
+                                           extrapolate_ovl_factor=np.array([[OVL_FACTOR],
+                                                                            [OVL_FACTOR - OVL_FACTOR_ERR],
+                                                                            [OVL_FACTOR + OVL_FACTOR_ERR]]))
+
         # calculation of calibration constant (has to be done for each time slice separately)
         # use only valid time slices
-        for t in valid_ts:
+        for idx, t in enumerate(valid_ts):
             # value of the molecular backscatter at calibration height
             mol_bsc = self.signal.ds.mol_backscatter[t, sig_calibr_bins[t]].values
 
@@ -556,26 +569,7 @@ class CalcLidarConstantDefault(BaseOperation):
             vol_bsc = (part_bsc + mol_bsc)[bsc_calibr_bins[t]]
             vol_bsc_err = vol_bsc * (part_bsc_err / part_bsc)[bsc_calibr_bins[t]]
 
-            # calculate atmospheric transmission below calibration height
-            # 1) integrated backscatter with lower and upper error bound
-            int_bsc = integral_profile(part_bsc,
-                                       range_axis=self.bsc.range[t].values,
-                                       extrapolate_ovl_factor=OVL_FACTOR,
-                                       first_bin=None,
-                                       last_bin=None)[bsc_calibr_bins[t]]
-
-            int_bsc_min = integral_profile(part_bsc - part_bsc_err,
-                                           range_axis=self.bsc.range[t].values,
-                                           extrapolate_ovl_factor=(OVL_FACTOR - OVL_FACTOR_ERR),
-                                           first_bin=None,
-                                           last_bin=None)[bsc_calibr_bins[t]]
-
-            int_bsc_max = integral_profile(part_bsc + part_bsc_err,
-                                           range_axis=self.bsc.range[t].values,
-                                           extrapolate_ovl_factor=(OVL_FACTOR + OVL_FACTOR_ERR),
-                                           first_bin=None,
-                                           last_bin=None)[bsc_calibr_bins[t]]
-
+            int_bsc, int_bsc_min, int_bsc_max = int_bsc_bounds[:, idx, bsc_calibr_bins[t]]
             int_bsc_err = abs(int_bsc_max - int_bsc_min) / 2
 
             # 2) aod = integrated backscatter * assumed lidar ratio
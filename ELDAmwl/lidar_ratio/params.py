@@ -22,11 +22,12 @@ class LidarRatioParams(ProductParams):
         # global measurement params
         meas_params = component.queryUtility(IParams).measurement_params
 
-        query = self.db_func.read_lidar_ratio_params(general_params.prod_id)
-        self.bsc_prod_id = query.raman_backscatter_options_product_id
-        self.ext_prod_id = query.extinction_options_product_id
-        self.general_params.error_method = ERROR_METHODS[query.error_method_id]  # noqa E501
-        self.min_BscRatio = float(query.min_BscRatio_for_LR)
+        # addict.Dict with the columns of table ext_bsc_options
+        options = self.db_func.read_lidar_ratio_params(general_params.prod_id)
+        self.bsc_prod_id = options.raman_backscatter_options_product_id
+        self.ext_prod_id = options.extinction_options_product_id
+        self.general_params.error_method = ERROR_METHODS[options.error_method_id]  # noqa E501
+        self.min_BscRatio = float(options.min_BscRatio_for_LR)
 
         # self. backscatter_params is a link to the parameters of the basic bsc product
         self.backscatter_params = meas_params.product_list[str(self.bsc_prod_id)]
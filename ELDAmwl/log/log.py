@@ -12,9 +12,13 @@ from logging import StreamHandler
 from sys import stdout
 from zope import component
 
+import atexit
 import datetime
 import ELDAmwl
 import os
+import queue
+import threading
+import time
 import zope
 
 
@@ -24,6 +28,112 @@ SYSLOG_WARN = 4
 SYSLOG_INFO = 6
 SYSLOG_DEBUG = 7
 
+# default size and time thresholds for flushing buffered db log messages
+DB_LOG_BUFFER_SIZE = 500
+DB_LOG_FLUSH_INTERVAL = 2.0
+
+
+class BufferedDBLogWriter:
+    """
+    Writes log messages into the db with bulk inserts by a background thread
+
+    The messages are put into a queue without blocking the caller.
+    A background thread collects them and writes them into the db as soon as
+    buffer_size messages are waiting or the oldest waiting message is older
+    than flush_interval seconds. The remaining messages are written when the
+    writer is closed, at the latest at exit of the program.
+
+    Args:
+        write_func (func): function which writes a list of log records
+                (dicts with the column names of the table eldamwl_logs as keys)
+                into the db, e.g. :meth:`ELDAmwl.database.db_functions.DBFunc.db_log_many`
+        logger (logging.Logger): logger for errors while writing into the db
+                (must not log into the db itself)
+
+    Keyword Args:
+        buffer_size (int): maximum number of buffered messages
+        flush_interval (float): maximum time (in s) a message stays in the buffer
+    """
+
+    _STOP = object()
+
+    def __init__(self, write_func, logger,
+                 buffer_size=DB_LOG_BUFFER_SIZE,
+                 flush_interval=DB_LOG_FLUSH_INTERVAL):
+        self.write_func = write_func
+        self.logger = logger
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+
+        self.queue = queue.Queue()
+        # the writer thread exists only in the process which created it
+        self.pid = os.getpid()
+        self.thread = threading.Thread(target=self._work, name='ELDAmwl-db-log', daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def __call__(self, level, datetime, measurement_id, product_id, module_version, msg):
+        """puts a log message into the buffer. Same signature as :meth:`ELDAmwl.database.db_functions.DBFunc.db_log`
+        """
+        if (os.getpid() != self.pid) or not self.thread.is_alive():
+            # forked worker processes (and a closed writer) log to console and file only
+            return
+
+        self.queue.put({
+            'level': level,
+            'datetime': datetime,
+            'measurements_id': measurement_id,
+            'product_id': product_id,
+            'module_version': module_version,
+            'message': msg,
+        })
+
+    def flush(self):
+        """blocks until all messages which are buffered so far are written into the db"""
+        if self.thread.is_alive() and (os.getpid() == self.pid):
+            self.queue.join()
+
+    def close(self):
+        """writes all remaining messages into the db and stops the background thread"""
+        if self.thread.is_alive() and (os.getpid() == self.pid):
+            self.queue.put(self._STOP)
+            self.thread.join()
+        atexit.unregister(self.close)
+
+    def _write(self, records):
+        try:
+            self.write_func(records)
+        except Exception as e:
+            self.logger.error('could not write {} log messages into the db: {}'.format(len(records), e))
+
+        for _ in records:
+            self.queue.task_done()
+
+    def _work(self):
+        records = []
+        deadline = None
+        stop = False
+
+        while not stop:
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+            try:
+                record = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                record = None
+
+            if record is self._STOP:
+                self.queue.task_done()
+                stop = True
+            elif record is not None:
+                if not records:
+                    deadline = time.monotonic() + self.flush_interval
+                records.append(record)
+
+            if records and (stop or len(records) >= self.buffer_size or time.monotonic() >= deadline):
+                self._write(records)
+                records = []
+                deadline = None
+
 
 @zope.interface.implementer(ILogger)
 class Logger:
@@ -31,13 +141,16 @@ class Logger:
     Logger class for logging to console, file and DB
     """
     logger = None
+    formatter = None
     db_log_func = None
+    db_log_writer = None
     db_log_level = None
     meas_id = None
 
     def __init__(self, measurement_id):
         self.module_version = '4711'
         self.meas_id = measurement_id
+        self.log_files = set()
         self.setup_logger()
 
     @property
@@ -132,20 +245,55 @@ class Logger:
                 log_file_path,
                 '{id}.log'.format(id=self.meas_id),
             )
-            if not self.cfg.APPEND_LOG_FILE:
+            # a log file which was already written in this run (batch mode) is continued
+            if not self.cfg.APPEND_LOG_FILE and log_file_name not in self.log_files:
                 file_handler = FileHandler(log_file_name, mode='w')
             else:
                 file_handler = FileHandler(log_file_name)
+            self.log_files.add(log_file_name)
             file_handler_formatter = formatter
             file_handler.setFormatter(file_handler_formatter)
             file_handler.setLevel(self.cfg.log_level_file)
             self.logger.addHandler(file_handler)
 
+    def set_measurement_id(self, measurement_id):
+        """
+        Switches the logger to another measurement (used in batch mode).
+        The messages are written into the log file of the new measurement.
+        """
+        file_handlers = [h for h in self.logger.handlers if isinstance(h, FileHandler)]
+        if measurement_id == self.meas_id and file_handlers:
+            return
+
+        self.meas_id = measurement_id
+        for handler in file_handlers:
+            self.logger.removeHandler(handler)
+            handler.close()
+        self.setup_file_logger(self.formatter)
+
     def setup_db_logger(self):
         """
         Setup the DB logger. Should be called from the outside after a DB connection is established
+
+        If cfg.DB_LOG_BUFFERED is True (default), the log messages are written into the DB
+        by a :class:`BufferedDBLogWriter`, otherwise each message is committed immediately.
         """
-        self.db_log_func = component.queryUtility(IDBFunc).db_log
+        db_func = component.queryUtility(IDBFunc)
+        if self.cfg.get('DB_LOG_BUFFERED', True):
+            self.db_log_writer = BufferedDBLogWriter(
+                db_func.db_log_many,
+                self.logger,
+                buffer_size=self.cfg.get('DB_LOG_BUFFER_SIZE', DB_LOG_BUFFER_SIZE),
+                flush_interval=self.cfg.get('DB_LOG_FLUSH_INTERVAL', DB_LOG_FLUSH_INTERVAL),
+            )
+            self.db_log_func = self.db_log_writer
+        else:
+            self.db_log_func = db_func.db_log
+
+    def flush_db_log(self):
+        """blocks until all buffered log messages are written into the DB"""
+        if self.db_log_writer is not None:
+            self.db_log_writer.flush()
 
     def setup_logger(self):
         """
@@ -154,6 +302,7 @@ class Logger:
         The db logger has to be brought up via an external call after the DB connection is ensured-
         """
         get_logger, formatter = self.get_logger_formatter()
+        self.formatter = formatter
         self.logger = get_logger('ELDAmwl')
         self.logger.setLevel(self.cfg.log_level)
 
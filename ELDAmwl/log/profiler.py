@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+"""timing and memory profile of an ELDAmwl run"""
+from contextlib import contextmanager
+from ELDAmwl.component.interface import ICfg
+from ELDAmwl.component.interface import ILogger
+from ELDAmwl.component.interface import IProfiler
+from ELDAmwl.utils.constants import RESOLUTION_STR
+from ELDAmwl.utils.constants import RESOLUTIONS
+from ELDAmwl.utils.path_utils import abs_file_path
+from functools import wraps
+from zope import component
+
+import datetime
+import ELDAmwl
+import json
+import os
+import threading
+import time
+import tracemalloc
+import zope
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows -> no peak RSS in the profile
+    resource = None
+
+
+STAGE = 'stage'
+NODE = 'node'
+OPERATION = 'operation'
+
+
+def peak_rss_mb():
+    """peak resident set size of the process (in MB) or None if unknown"""
+    if resource is None:
+        return None
+    # ru_maxrss is given in kB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.
+
+
+def operation_labels(operation):
+    """factory name, class name, product id and resolution of an operation
+
+    The product id and the resolution are taken from the keyword arguments
+    of the operation or from its product params (if available).
+    """
+    labels = {'factory': getattr(operation, 'factory_name', None),
+              'name': operation.__class__.__name__}
+
+    kwargs = getattr(operation, 'kwargs', None) or {}
+    if kwargs.get('resolution') in RESOLUTIONS:
+        labels['resolution'] = RESOLUTION_STR[kwargs['resolution']]
+
+    prod_id = kwargs.get('prod_id')
+    if prod_id is None:
+        for value in list(kwargs.values()) + [operation.__dict__.get('params')]:
+            prod_id_str = getattr(value, 'prod_id_str', None)
+            if isinstance(prod_id_str, str):
+                prod_id = prod_id_str
+                break
+    if prod_id is not None:
+        labels['product_id'] = str(prod_id)
+
+    return labels
+
+
+@zope.interface.implementer(IProfiler)
+class RunProfiler(object):
+    """
+    Records wall time, CPU time and memory of the processing stages, of the
+    nodes of the dependency graph of the retrievals, and of all
+    :meth:`ELDAmwl.bases.factory.BaseOperation.run` calls of a measurement.
+
+    The peak RSS of a process can only grow. Therefore, each record contains the
+    increase of the high-water mark of the RSS during the recorded code
+    (peak_rss_increase_mb). It is 0 if the code needed less memory than
+    the process had needed before (e.g. a small stage after a large one).
+    The peak RSS of the whole run is given in the profile (peak_rss_mb).
+
+    If cfg.PROFILE_ALLOCATIONS is True, the memory allocations of Python
+    objects are traced (tracemalloc) and the change of the allocated memory
+    is recorded as well. The allocations (and the RSS increases) of
+    concurrently running threads cannot be separated from each other.
+
+    The profile is written as JSON file <meas_id>.profile.json next to the log file.
+    Nothing is recorded if cfg.PROFILE is False.
+    """
+
+    def __init__(self):
+        self.meas_id = None
+        self.records = []
+        self.start_time = None
+        self.start_datetime = None
+
+    @property
+    def cfg(self):
+        return component.queryUtility(ICfg)
+
+    @property
+    def logger(self):
+        return component.queryUtility(ILogger)
+
+    @property
+    def enabled(self):
+        return self.start_time is not None
+
+    @property
+    def trace_allocations(self):
+        return self.enabled and tracemalloc.is_tracing()
+
+    def start(self, meas_id):
+        """starts a new profile for the measurement meas_id"""
+        self.meas_id = meas_id
+        self.records = []
+        self.start_time = None
+        if not self.cfg.get('PROFILE', False):
+            return
+
+        if self.cfg.get('PROFILE_ALLOCATIONS', False) and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self.start_datetime = datetime.datetime.now()
+        self.start_time = time.perf_counter()
+
+    @contextmanager
+    def measure(self, kind, name, **labels):
+        """context which records the resources used by the code inside
+
+        Args:
+            kind (str): STAGE, NODE, or OPERATION
+            name (str): name of the stage, node, or operation class
+            **labels: further keys of the record (e.g. product_id, resolution)
+        """
+        if not self.enabled:
+            yield
+            return
+
+        # the stages run in the main thread, but may start threads themselves
+        cpu_clock = time.process_time if kind == STAGE else time.thread_time
+        alloc_start = tracemalloc.get_traced_memory()[0] if self.trace_allocations else None
+        rss_start = peak_rss_mb()
+        wall_start = time.perf_counter()
+        cpu_start = cpu_clock()
+        try:
+            yield
+        finally:
+            record = {
+                'kind': kind,
+                'name': name,
+                'thread': threading.current_thread().name,
+                'start': round(wall_start - self.start_time, 6),
+                'wall_time': round(time.perf_counter() - wall_start, 6),
+                'cpu_time': round(cpu_clock() - cpu_start, 6),
+            }
+            if rss_start is not None:
+                record['peak_rss_increase_mb'] = peak_rss_mb() - rss_start
+            if alloc_start is not None:
+                record['alloc_delta_mb'] = (tracemalloc.get_traced_memory()[0] - alloc_start) / 1024. ** 2
+            record.update(labels)
+            self.records.append(record)
+
+    def summary(self):
+        """total wall time and CPU time per kind and name of the records"""
+        result = {}
+        for record in self.records:
+            key = '{}:{}'.format(record['kind'], record['name'])
+            entry = result.setdefault(key, {'count': 0, 'wall_time': 0., 'cpu_time': 0.})
+            entry['count'] += 1
+            entry['wall_time'] += record['wall_time']
+            entry['cpu_time'] += record['cpu_time']
+        return result
+
+    def profile(self):
+        """the profile as dictionary"""
+        result = {
+            'meas_id': self.meas_id,
+            'eldamwl_version': ELDAmwl.__version__,
+            'start': self.start_datetime.isoformat(),
+            'wall_time': round(time.perf_counter() - self.start_time, 6),
+            'peak_rss_mb': peak_rss_mb(),
+            'num_threads': self.cfg.get('NUM_THREADS', 1),
+            'parallel': self.cfg.get('PARALLEL', False),
+            'summary': self.summary(),
+            'records': self.records,
+        }
+        if self.trace_allocations:
+            result['peak_traced_mb'] = tracemalloc.get_traced_memory()[1] / 1024. ** 2
+        return result
+
+    def file_name(self):
+        return os.path.join(abs_file_path(self.cfg.LOG_PATH),
+                            '{id}.profile.json'.format(id=self.meas_id))
+
+    def write(self):
+        """writes the profile into the JSON file and stops the profiling"""
+        if not self.enabled:
+            return
+
+        file_name = self.file_name()
+        try:
+            with open(file_name, 'w') as outfile:
+                json.dump(self.profile(), outfile, indent=1)
+            self.logger.debug('profile written into {}'.format(file_name))
+        except OSError as e:
+            self.logger.warning('cannot write profile into {}: {}'.format(file_name, e))
+
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self.start_time = None
+
+
+def profiled_stage(func):
+    """decorator which records a processing stage (a method of RunELDAmwl) in the profile"""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        profiler = component.queryUtility(IProfiler)
+        if profiler is None:
+            return func(*args, **kwargs)
+        with profiler.measure(STAGE, func.__name__):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def profiled_operation(func):
+    """decorator which records the run method of a BaseOperation in the profile"""
+    @wraps(func)
+    def wrapper(self, *args, **kwargs):
+        profiler = component.queryUtility(IProfiler)
+        if (profiler is None) or not profiler.enabled:
+            return func(self, *args, **kwargs)
+        labels = operation_labels(self)
+        with profiler.measure(OPERATION, labels.pop('name'), **labels):
+            return func(self, *args, **kwargs)
+    return wrapper
+
+
+def profiled_method(func):
+    """decorator which records a method of other objects than operations
+    (e.g. :meth:`ELDAmwl.products.Products.smooth`) in the profile.
+    The record is named by the qualified name of the method."""
+    @wraps(func)
+    def wrapper(self, *args, **kwargs):
+        profiler = component.queryUtility(IProfiler)
+        if (profiler is None) or not profiler.enabled:
+            return func(self, *args, **kwargs)
+        labels = operation_labels(self)
+        labels.pop('name')
+        labels.pop('factory')
+        with profiler.measure(OPERATION, func.__qualname__, **labels):
+            return func(self, *args, **kwargs)
+    return wrapper
+
+
+def register_profiler():
+    # prohibit more than one profiler instance
+    profiler = component.queryUtility(IProfiler)
+    if profiler is not None:
+        return profiler
+
+    profiler = RunProfiler()
+    component.provideUtility(profiler, IProfiler)
+    return profiler
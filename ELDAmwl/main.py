@@ -3,7 +3,9 @@ import os
 
 from ELDAmwl.component.interface import ICfg, IDBFunc
 from ELDAmwl.component.interface import ILogger
+from ELDAmwl.component.interface import IMCPool
 from ELDAmwl.component.interface import IParams
+from ELDAmwl.component.interface import IProfiler
 from ELDAmwl.config import register_config
 from ELDAmwl.database.db_functions import register_db_func
 from ELDAmwl.elda_mwl.elda_mwl import register_params
@@ -14,7 +16,9 @@ from ELDAmwl.errors.exceptions import ELDAmwlException
 from ELDAmwl.errors.exceptions import WrongCommandLineParameter
 from ELDAmwl.log.log import register_db_logger
 from ELDAmwl.log.log import register_logger
+from ELDAmwl.log.profiler import register_profiler
 from ELDAmwl.monte_carlo.operation import register_monte_carlo
+from ELDAmwl.monte_carlo.parallel_funcs import register_mc_pool
 from ELDAmwl.storage.cached_functions import gen_sg_params
 from ELDAmwl.storage.data_storage import register_datastorage
 from ELDAmwl.utils.constants import ELDA_MWL_VERSION, EXIT_CODE_NONE, MWL_PROD_ID_DEFAULT
@@ -48,6 +52,12 @@ def elda_setup_components(args=None):
     # REgister MontaCarlo Adapter
     register_monte_carlo()
 
+    # Bring up the (not yet started) worker pool for MonteCarlo samples
+    register_mc_pool()
+
+    # Bring up the timing and memory profile of the runs
+    register_profiler()
+
     gen_sg_params()
 
 
@@ -143,13 +153,14 @@ class Main:
 
         try:
             self.logger.meas_id = arg_dict.meas_id
+            profiler = component.queryUtility(IProfiler)
+            if profiler is not None:
+                profiler.start(arg_dict.meas_id)
             elda_mwl = RunELDAmwl(arg_dict.meas_id)
             elda_mwl.read_tasks()
             elda_mwl.read_elpp_data()
             elda_mwl.prepare_signals()
-            elda_mwl.get_basic_products()
-            elda_mwl.get_derived_products()
-            elda_mwl.get_lidar_constants()
+            elda_mwl.get_products()
             elda_mwl.quality_control()
             elda_mwl.get_product_matrix()
             elda_mwl.write_mwl_output()
@@ -162,6 +173,17 @@ class Main:
             dbfunc.write_product_status_in_db(arg_dict.meas_id, MWL_PROD_ID_DEFAULT, None, e.return_value, str(e))
             return_code = EXIT_CODE_NONE
 
+        finally:
+            mc_pool = component.queryUtility(IMCPool)
+            if mc_pool is not None:
+                mc_pool.close()
+
+            profiler = component.queryUtility(IProfiler)
+            if profiler is not None:
+                profiler.write()
+
+            self.logger.flush_db_log()
+
         return return_code
 
     def run(self):
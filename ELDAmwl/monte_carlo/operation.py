@@ -1,3 +1,4 @@
+from addict import Dict
 from copy import deepcopy
 from ELDAmwl.bases.factory import BaseOperation
 from ELDAmwl.bases.factory import BaseOperationFactory
@@ -5,12 +6,13 @@ from ELDAmwl.component.interface import ICfg, IVLDROp, IRamBscOp
 from ELDAmwl.component.interface import IElastBscOp
 from ELDAmwl.component.interface import IExtOp
 from ELDAmwl.component.interface import ILogger
+from ELDAmwl.component.interface import IMCPool
 from ELDAmwl.component.interface import IMonteCarlo
 from ELDAmwl.component.registry import registry
 from ELDAmwl.errors.exceptions import NotEnoughMCSamples
+from ELDAmwl.log.profiler import profiled_method
 from ELDAmwl.products import Products
 from ELDAmwl.utils.constants import FIXED, MC_TRIALS_FACTOR
-from multiprocessing.pool import Pool
 from zope import component
 
 import numpy as np
@@ -21,10 +23,22 @@ import zope
 class MonteCarlo:
     """
     Implementation of monte carlo algorithm
+
+    The random variations of the input data of all samples are drawn at once
+    as arrays with the sample axis first. If the operation can handle this
+    sample axis (adapter method run_samples), all samples are retrieved in one call.
+    Otherwise, the samples are retrieved one by one with working copies of the
+    original signals which are reused for all samples. If cfg.PARALLEL is set,
+    this is done by the persistent worker pool (:class:`ELDAmwl.monte_carlo.parallel_funcs.MCWorkerPool`).
+
+    Samples are drawn in batches of the number of missing successful samples.
+    The retrieval stops as soon as nb_of_iterations samples were successful.
     """
 
     sample_results = None
     sample_inputs = None
+    work_copies = None
+    rng = None
 
     def __init__(self, op):
         self.op = op
@@ -37,75 +51,151 @@ class MonteCarlo:
     def cfg(self):
         return component.queryUtility(ICfg)
 
-    def get_sample_inputs(self, orig):
-        # orig is a dict with signals used for the retrieval. e.g., Raman sig and elast sig
+    @property
+    def mc_pool(self):
+        return component.queryUtility(IMCPool)
+
+    def __getstate__(self):
+        # only the retrieval params are transferred to worker processes.
+        # the operation is transferred separately, the sample data via shared memory,
+        # and the working copies are rebuilt in the worker (see create_work_copies)
+        state = self.__dict__.copy()
+        for key in ['op', 'work_copies', 'sample_inputs', 'sample_results', 'rng']:
+            state.pop(key, None)
+        return state
+
+    def create_work_copies(self, orig):
+        """creates the working copies of the original signals into which the sample inputs are written
+
+        Args:
+            orig (dict): signals used for the retrieval (result of get_data())
+        """
+        self.work_copies = {}
+        for sig in orig.keys():
+            self.work_copies[sig] = deepcopy(orig[sig])
 
-        # self.sample_inputs is a list of dictionaries with one set of signals for each iteration
-        self.sample_inputs = []
-        num_samples = self.mc_params.nb_of_iterations * MC_TRIALS_FACTOR
+    def get_sample_inputs(self, orig, num_samples):
+        """draws random variations of the original signals for num_samples samples
+
+        self.sample_inputs is an addict.Dict with one entry for each signal in orig.
+        Each entry is an addict.Dict with the varied variables of this signal as
+        np.array with the sample axis first, e.g.
+        self.sample_inputs.raman_sig.data.shape = (num_samples, time, level)
+
+        Args:
+            orig (dict): signals used for the retrieval. e.g., Raman sig and elast sig
+            num_samples (int): number of samples
+        """
+        self.sample_inputs = Dict()
 
         for sig in orig.keys():
             mc_generator = CreateMCCopies()(original=orig[sig],
                                             n=num_samples,
+                                            rng=self.rng,
                                             )
-            samples = mc_generator.run()
-
-            # if the list of samples is empty: create a dictionary for each iteration
-            if len(self.sample_inputs) == 0:
-                for n in range(num_samples):
-                    self.sample_inputs.append({sig: samples[n]})
-
-            # if the list already exists: add a new key with the new sample for each iteration
-            else:
-                for n in range(num_samples):
-                    self.sample_inputs[n][sig] = samples[n]
-
-    def get_sample_results(self):
-        if self.cfg.PARALLEL:
-            pool = Pool(self.cfg.NUM_CPU)
-            self.sample_results = []
-            results = pool.imap_unordered(self.run, self.sample_inputs)
-            for result in results:
-                if isinstance(result, Products):
-                    self.sample_results.append(result.data.values)
+            self.sample_inputs[sig].data = mc_generator.run()
+
+    def sample_input(self, n):
+        """writes the variations of sample n into the working copies of the original signals
+
+        Returns:
+            dict with the same keys as the result of get_data()
+        """
+        for sig, variables in self.sample_inputs.items():
+            for var, samples in variables.items():
+                self.work_copies[sig].ds[var][:] = samples[n]
+
+        return self.work_copies
+
+    def run_sample(self, n):
+        return self.run(self.sample_input(n))
+
+    def run_samples(self, sample_inputs):
+        """runs the operation for all samples at once.
+
+        Adapters of operations which can handle the sample axis overwrite this method.
+
+        Returns:
+            np.array (sample, time, level) with the data of all sample results or
+            None if the operation cannot handle the sample axis
+        """
+        return None
+
+    def calc_samples(self, num_samples, first_sample=0):
+        """retrieves the results of the drawn samples
+
+        Returns:
+            list with the data (np.array (time, level)) of all successfully retrieved samples
+        """
+        if self.cfg.get('MC_VECTORIZED', True):
+            sample_data = self.run_samples(self.sample_inputs)
+            if sample_data is not None:
+                # samples which failed entirely are filled with nan
+                failed = np.all(np.isnan(sample_data), axis=(1, 2)) & \
+                    (not np.all(np.isnan(self.op.result.data.values)))
+                for n in np.where(failed)[0]:
+                    self.logger.warning('error in retrieving MC sample {}'.format(first_sample + n))
+                return list(sample_data[~failed])
+
+        if self.cfg.PARALLEL and (self.mc_pool is not None):
+            return self.mc_pool.run_samples(self, num_samples, first_sample=first_sample)
+
+        results = []
+        for n in range(num_samples):
+            self.logger.debug('calc sample {}'.format(first_sample + n))
+            try:
+                sample = self.run_sample(n)
+                if isinstance(sample, Products):
+                    results.append(sample.data.values.copy())
                 else:
-                    self.logger.warning('{} terminated due to errors'.format(result))
-                    # sys.exit(1)
-            pool.close()
-            pool.join()
+                    self.logger.warning('error in retrieving MC sample {}'.format(first_sample + n))
+            except Exception:
+                self.logger.warning('error in retrieving MC sample {}'.format(first_sample + n))
 
-        else:
-            results = []
-            n = 0
-            nb_of_iter = self.mc_params.nb_of_iterations
-            while (len(results) < nb_of_iter) and (n <= MC_TRIALS_FACTOR * nb_of_iter):
-                self.logger.debug('calc sample {}'.format(n))
-                try:
-                    sample = self.run(self.sample_inputs[n])
-                    if isinstance(sample, Products):
-                        results.append(sample.data.values)
-                    else:
-                        self.logger.warning('error in retrieving MC sample {}'.format(n))
-                except:
-                    self.logger.warning('error in retrieving MC sample {}'.format(n))
-                n += 1
-
-            if len(results) >= nb_of_iter:
-                self.sample_results = results
-            else:
-                raise NotEnoughMCSamples(None)
+        return results
 
+    def get_sample_results(self, orig):
+        """draws and retrieves samples until nb_of_iterations samples were successful.
+
+        At maximum, MC_TRIALS_FACTOR * nb_of_iterations samples are drawn.
+        """
+        nb_of_iter = self.mc_params.nb_of_iterations
+        max_samples = MC_TRIALS_FACTOR * nb_of_iter
+
+        results = []
+        num_drawn = 0
+        while (len(results) < nb_of_iter) and (num_drawn < max_samples):
+            num_samples = min(nb_of_iter - len(results), max_samples - num_drawn)
+            self.get_sample_inputs(orig, num_samples)
+            results.extend(self.calc_samples(num_samples, first_sample=num_drawn))
+            num_drawn += num_samples
+
+        self.sample_inputs = None
+
+        if len(results) >= nb_of_iter:
+            self.sample_results = results[:nb_of_iter]
+        else:
+            raise NotEnoughMCSamples(None)
 
     def calc_mc_error(self):
         all = np.array(self.sample_results)
         return np.nanstd(all, axis=0)
 
+    @profiled_method
     def __call__(self, mc_params):
         self.mc_params = mc_params
+        self.rng = np.random.default_rng(self.cfg.get('MC_SEED', None))
         orig_data = self.get_data()
+        self.create_work_copies(orig_data)
 
-        self.get_sample_inputs(orig_data)
-        self.get_sample_results()
+        # the operation writes each sample into its result ->
+        # keep the result of the original data
+        orig_result = deepcopy(self.op.result.ds)
+        try:
+            self.get_sample_results(orig_data)
+        finally:
+            self.op.result.ds = orig_result
+            self.work_copies = None
 
         return self.calc_mc_error()
 
@@ -128,6 +218,10 @@ class MonteCarloExtAdapter(MonteCarlo):
         """
         return self.op.run(data=data['raman_sig'])
 
+    def run_samples(self, sample_inputs):
+        return self.op.run_samples(sample_inputs.raman_sig.data,
+                                   samples_per_call=self.cfg.get('MC_SAMPLES_PER_CALL', None))
+
 
 @zope.component.adapter(IElastBscOp)
 @zope.interface.implementer(IMonteCarlo)
@@ -147,8 +241,8 @@ class MonteCarloElastBscAdapter(MonteCarlo):
         """
         return self.op.run(data=data['elast_sig'])
 
-    def get_sample_inputs(self, orig):
-        super(MonteCarloElastBscAdapter, self).get_sample_inputs(orig)
+    def get_sample_inputs(self, orig, num_samples):
+        super(MonteCarloElastBscAdapter, self).get_sample_inputs(orig, num_samples)
 
         if self.op.bsc_params.lr_input_method == FIXED:
             orig_lr = self.op.elast_sig.ds.assumed_particle_lidar_ratio.values.mean()
@@ -158,12 +252,10 @@ class MonteCarloElastBscAdapter(MonteCarlo):
                 self.logger.warning('no lidar ratio uncertainty provided for product {}'.format(self.op.bsc_params.prod_id_str))
                 return
 
-            lr_samples = np.random.normal(loc=orig_lr,
-                                          scale=orig_lr_uncertainty,
-                                          size=self.mc_params.nb_of_iterations)
-
-            for sample in range(self.mc_params.nb_of_iterations):
-                self.sample_inputs[sample]['elast_sig'].ds.assumed_particle_lidar_ratio[:] = lr_samples[sample]
+            self.sample_inputs.elast_sig.assumed_particle_lidar_ratio = self.rng.normal(
+                loc=orig_lr,
+                scale=orig_lr_uncertainty,
+                size=num_samples)
 
         # todo: variation in case of lr_input_method == PROFILE
 
@@ -186,6 +278,9 @@ class MonteCarloVLDRAdapter(MonteCarlo):
         """
         return self.op.run(data=data['sig_ratio'])
 
+    def run_samples(self, sample_inputs):
+        return self.op.run_samples(sample_inputs.sig_ratio.data)
+
 
 @zope.component.adapter(IRamBscOp)
 @zope.interface.implementer(IMonteCarlo)
@@ -205,20 +300,24 @@ class MonteCarloRamanBscAdapter(MonteCarlo):
         """
         return self.op.run(data=data['sigratio'])
 
+    def run_samples(self, sample_inputs):
+        return self.op.run_samples(sample_inputs.sigratio.data)
+
 
 class CreateMCCopies(BaseOperationFactory):
     """
-    Returns an instance of BaseOperation which creates a copy of the original(Columns).
+    Returns an instance of BaseOperation which creates random variations of the data of the original(Columns).
 
-    The data values of the copy are randomly varied within the uncertainty range of the original.
+    The data values are randomly varied within the uncertainty range of the original.
     In this case, it returns always an instance of CreateMCCopiesDefault().
 
      keyword Args:
         original (Columns): the original column instance
-        n(int): number of copies
+        n(int): number of samples
+        rng (numpy.random.Generator): random generator, optional. default = None => unseeded generator
 
     returns:
-        list with copies of the original column instance
+        np.array (n, time, level) with the varied data values of all samples
 
    """
 
@@ -241,41 +340,31 @@ class CreateMCCopies(BaseOperationFactory):
 
 class CreateMCCopiesDefault(BaseOperation):
     """
-    Returns n copies of the original(Columns).
+    Returns n random variations of the data of the original(Columns).
 
-    The data values of the copies are randomly varied within the uncertainty range of the original.
+    The data values are randomly varied within the uncertainty range of the original.
+    All samples are drawn at once. Bins with nan data or nan uncertainty are nan in all samples.
     """
 
     name = 'CreateMCCopiesDefault'
 
     def run(self):
         """
+        Returns:
+            np.array (n, time, level) with the varied data values
         """
         original = self.kwargs['original']
         num_samples = self.kwargs['n']
+        rng = self.kwargs.get('rng')
+        if rng is None:
+            rng = np.random.default_rng()
 
-        data = original.data
-        err = original.err
-
-        sample_data = np.ones((original.num_times,
-                               original.num_levels,
-                               num_samples)) * np.nan
+        data = original.data.values
+        err = original.err.values
 
-        for t in range(original.num_times):
-            for idx in np.where(~np.isnan(original.data[t]))[0]:
-                sample_data[t, idx, :] = np.random.normal(
-                    loc=data[t, idx],
-                    scale=err[t, idx],
-                    size=num_samples,
-                )
-
-        result = []
-        for n in range(num_samples):
-            mc_copy = deepcopy(original)
-            mc_copy.data[:, :] = sample_data[:, :, n]
-            result.append(mc_copy)
+        noise = rng.standard_normal(size=(num_samples,) + data.shape)
 
-        return result
+        return data + err * noise
 
 
 def register_monte_carlo():
@@ -1,8 +1,22 @@
+from addict import Dict
+from ELDAmwl.component.interface import ICfg
+from ELDAmwl.component.interface import IDataStorage
+from ELDAmwl.component.interface import IMCPool
 from ELDAmwl.component.interface import ILogger
+from ELDAmwl.products import Products
+from multiprocessing import resource_tracker
 from multiprocessing.pool import Pool
+from multiprocessing.shared_memory import SharedMemory
 from zope import component
 
+import atexit
+import io
+import multiprocessing
+import numpy as np
+import os
+import pickle
 import sys
+import zope
 
 
 class BaseDispatcher(object):
@@ -35,3 +49,290 @@ class BaseDispatcher(object):
                 sys.exit(1)
         pool.close()
         pool.join()
+
+
+def to_shared_memory(array):
+    """copies a np.array into a new shared memory block
+
+    Returns:
+        tuple (SharedMemory, addict.Dict with keys 'name', 'shape', and 'dtype')
+    """
+    shm = SharedMemory(create=True, size=max(array.nbytes, 1))
+    shared = np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)
+    shared[...] = array
+    del shared
+    spec = Dict({'name': shm.name,
+                 'shape': array.shape,
+                 'dtype': array.dtype.str})
+    return shm, spec
+
+
+def from_shared_memory(spec):
+    """attaches to an existing shared memory block
+
+    Returns:
+        tuple (SharedMemory, np.array which uses the buffer of the shared memory block)
+    """
+    try:
+        shm = SharedMemory(name=spec.name, track=False)
+    except TypeError:
+        # python < 3.13: the block is owned (and unlinked) by the creating process
+        shm = SharedMemory(name=spec.name)
+        if os.name == 'posix':
+            # the resource tracker knows the block by its name with leading slash
+            resource_tracker.unregister('/' + shm.name.lstrip('/'), 'shared_memory')
+    array = np.ndarray(spec.shape, dtype=np.dtype(spec.dtype), buffer=shm.buf)
+    return shm, array
+
+
+class SharedMemoryPickler(pickle.Pickler):
+    """pickles an object, but collects its np.arrays for a shared memory block
+
+    The pickle contains only the other attributes (e.g. retrieval params) and the
+    positions of the arrays in the block. Arrays which are referenced several times
+    are collected only once. Data storages (also copies of the data storage, which
+    are referenced by deep-copied operations) are not pickled, but replaced by the
+    data storage of the worker process.
+    """
+
+    # alignment of the arrays in the shared memory block
+    alignment = 64
+
+    def __init__(self, file, min_nbytes=4096):
+        super(SharedMemoryPickler, self).__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.min_nbytes = min_nbytes
+        # id of the array -> (offset, array). the array is kept to keep its id unique
+        self.arrays = {}
+        self.nbytes = 0
+
+    def persistent_id(self, obj):
+        if IDataStorage.implementedBy(type(obj)):
+            return 'data_storage'
+        if not isinstance(obj, np.ndarray) or obj.dtype.hasobject or obj.nbytes < self.min_nbytes:
+            return None
+        if id(obj) not in self.arrays:
+            offset = -(-self.nbytes // self.alignment) * self.alignment
+            self.arrays[id(obj)] = (offset, obj)
+            self.nbytes = offset + obj.nbytes
+        offset, array = self.arrays[id(obj)]
+        return offset, array.shape, array.dtype.str
+
+    def write_arrays(self, block):
+        """copies the collected arrays into block (np.array of uint8)"""
+        for offset, array in self.arrays.values():
+            shared = np.ndarray(array.shape, dtype=array.dtype, buffer=block, offset=offset)
+            shared[...] = array
+
+
+class SharedMemoryUnpickler(pickle.Unpickler):
+    """unpickles an object pickled with :class:`SharedMemoryPickler`
+
+    The arrays are copied out of the shared memory block, because the rebuilt
+    object may write into them. Each array is copied only once, so that
+    references to the same array stay references to the same array.
+    """
+
+    def __init__(self, file, block):
+        super(SharedMemoryUnpickler, self).__init__(file)
+        self.block = block
+        self.arrays = {}
+
+    def persistent_load(self, pid):
+        if pid == 'data_storage':
+            return component.queryUtility(IDataStorage)
+        offset, shape, dtype = pid
+        if offset not in self.arrays:
+            shared = np.ndarray(shape, dtype=np.dtype(dtype), buffer=self.block, offset=offset)
+            self.arrays[offset] = shared.copy()
+        return self.arrays[offset]
+
+
+def dumps_to_shared_memory(obj, blocks, min_nbytes=4096):
+    """pickles obj and puts its np.arrays (at least min_nbytes large) into one shared memory block
+
+    The block is appended to the list blocks, the caller has to close and unlink it.
+
+    Returns:
+        tuple (bytes: the pickled object without the data of the arrays,
+        addict.Dict: shared memory spec of the block)
+    """
+    file = io.BytesIO()
+    pickler = SharedMemoryPickler(file, min_nbytes=min_nbytes)
+    pickler.dump(obj)
+
+    shm = SharedMemory(create=True, size=max(pickler.nbytes, 1))
+    blocks.append(shm)
+    block = np.ndarray((shm.size,), dtype=np.uint8, buffer=shm.buf)
+    pickler.write_arrays(block)
+    del block
+
+    spec = Dict({'name': shm.name,
+                 'shape': (shm.size,),
+                 'dtype': np.dtype(np.uint8).str})
+    return file.getvalue(), spec
+
+
+def loads_from_shared_memory(data, spec):
+    """rebuilds an object pickled with :func:`dumps_to_shared_memory`"""
+    shm, block = from_shared_memory(spec)
+    unpickler = SharedMemoryUnpickler(io.BytesIO(data), block)
+    try:
+        return unpickler.load()
+    finally:
+        unpickler.block = None
+        del block
+        shm.close()
+
+
+def run_mc_chunk(task):
+    """runs a chunk of Monte-Carlo samples in a worker process
+
+    The input arrays of the operation and the sample inputs are read from shared memory
+    and the data of the sample results are written into shared memory. Only the (pickled)
+    adapter and operation with their retrieval params, the shared memory specs, and the
+    indexes of the samples are transferred to the worker. The operation and the working
+    copies of the signals are rebuilt in the worker.
+
+    Args:
+        task (addict.Dict): with keys
+            'adapter' (bytes): pickled MonteCarlo adapter without operation and sample data,
+            'op' (bytes): operation of the adapter, pickled with :func:`dumps_to_shared_memory`,
+            'op_arrays' (addict.Dict): shared memory spec of the block with the arrays of the operation,
+            'inputs' (list): (signal, variable, shared memory spec) of all sample inputs,
+            'results' (addict.Dict): shared memory spec of the result array (sample, time, level),
+            'samples' (list of int): indexes of the samples of this chunk
+
+    Returns:
+        dict with the indexes of failed samples as keys and error messages as values
+    """
+    adapter = pickle.loads(task.adapter)
+    adapter.op = loads_from_shared_memory(task.op, task.op_arrays)
+    adapter.create_work_copies(adapter.get_data())
+
+    blocks = []
+    errors = {}
+    try:
+        adapter.sample_inputs = Dict()
+        for sig, var, spec in task.inputs:
+            shm, adapter.sample_inputs[sig][var] = from_shared_memory(spec)
+            blocks.append(shm)
+
+        shm, results = from_shared_memory(task.results)
+        blocks.append(shm)
+
+        for n in task.samples:
+            try:
+                sample = adapter.run_sample(n)
+                if isinstance(sample, Products):
+                    results[n] = sample.data.values
+                else:
+                    errors[n] = 'no result'
+            except Exception as e:
+                errors[n] = repr(e)
+
+    finally:
+        adapter.sample_inputs = None
+        adapter.work_copies = None
+        results = None
+        for shm in blocks:
+            shm.close()
+
+    return errors
+
+
+class MCWorkerPool(object):
+    """
+    persistent pool of worker processes for Monte-Carlo error retrievals
+
+    The pool is started with the first Monte-Carlo retrieval and lives until
+    the end of the ELDAmwl run. The worker processes are forked, therefore, they
+    know all components (config, logger, ...) which are registered before.
+    """
+
+    # number of chunks per cpu which are distributed to the workers
+    chunks_per_cpu = 4
+
+    def __init__(self):
+        self.pool = None
+
+    @property
+    def cfg(self):
+        return component.queryUtility(ICfg)
+
+    @property
+    def logger(self):
+        return component.queryUtility(ILogger)
+
+    def start(self):
+        if 'fork' in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context('fork')
+        else:
+            context = multiprocessing.get_context()
+        self.pool = context.Pool(self.cfg.NUM_CPU)
+        atexit.register(self.close)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def run_samples(self, adapter, num_samples, first_sample=0):
+        """retrieves the samples of a MonteCarlo adapter in the worker processes
+
+        Args:
+            adapter (:class:`ELDAmwl.monte_carlo.operation.MonteCarlo`): the adapter with drawn sample inputs
+            num_samples (int): number of drawn samples
+            first_sample (int): number of samples drawn before (only used for log messages)
+
+        Returns:
+            list with the data (np.array (time, level)) of all successfully retrieved samples
+        """
+        if self.pool is None:
+            self.start()
+
+        blocks = []
+        try:
+            inputs = []
+            for sig, variables in adapter.sample_inputs.items():
+                for var, samples in variables.items():
+                    shm, spec = to_shared_memory(np.ascontiguousarray(samples))
+                    blocks.append(shm)
+                    inputs.append((sig, var, spec))
+
+            result_shape = (num_samples,) + adapter.op.result.data.shape
+            result_shm, result_spec = to_shared_memory(np.full(result_shape, np.nan))
+            blocks.append(result_shm)
+
+            # the input arrays of the operation are put into shared memory as well
+            pickled_adapter = pickle.dumps(adapter)
+            pickled_op, op_arrays_spec = dumps_to_shared_memory(adapter.op, blocks)
+            num_chunks = min(num_samples, self.cfg.NUM_CPU * self.chunks_per_cpu)
+            tasks = [Dict({'adapter': pickled_adapter,
+                           'op': pickled_op,
+                           'op_arrays': op_arrays_spec,
+                           'inputs': inputs,
+                           'results': result_spec,
+                           'samples': chunk.tolist()})
+                     for chunk in np.array_split(np.arange(num_samples), num_chunks)]
+
+            failed = set()
+            for errors in self.pool.imap_unordered(run_mc_chunk, tasks):
+                for n, msg in errors.items():
+                    self.logger.warning('error in retrieving MC sample {}: {}'.format(first_sample + n, msg))
+                    failed.add(n)
+
+            results = np.ndarray(result_shape, dtype=np.float64, buffer=result_shm.buf)
+            sample_results = [results[n].copy() for n in range(num_samples) if n not in failed]
+            del results
+
+        finally:
+            for shm in blocks:
+                shm.close()
+                shm.unlink()
+
+        return sample_results
+
+
+def register_mc_pool():
+    zope.component.provideUtility(MCWorkerPool(), IMCPool)
@@ -17,7 +17,10 @@ from ELDAmwl.utils.constants import MWL
 from ELDAmwl.utils.constants import RBSC
 from ELDAmwl.utils.constants import RESOLUTIONS
 from ELDAmwl.utils.path_utils import abs_file_path
+from xarray.backends import NetCDF4DataStore
 
+import netCDF4
+import numpy as np
 import xarray as xr
 
 
@@ -30,12 +33,62 @@ class WriteMWLOutputDefault(BaseOperation):
     out_filename = None
     data = None  # data of all elda_mwl groups
     meta_data = None  # meta_data of individual products
+    encoding_profile = None  # compression and chunking of the variables
 
     def init(self):
         self.data = Dict()  # data of all elda_mwl groups
         self.meta_data = Dict()  # meta_data of individual products
         self.product_params = self.kwargs['product_params']
         self.out_filename = abs_file_path(self.cfg.PRODUCT_PATH, self.mwl_filename())
+        self.encoding_profile = self.get_encoding_profile()
+
+    def get_encoding_profile(self):
+        """the encoding profile cfg.OUTPUT_ENCODING out of cfg.OUTPUT_ENCODING_PROFILES"""
+        name = self.cfg.get('OUTPUT_ENCODING', None)
+        if name is None:
+            return Dict()
+
+        profiles = self.cfg.get('OUTPUT_ENCODING_PROFILES', {})
+        if name not in profiles:
+            self.logger.warning('unknown output encoding profile {}, '
+                                'the variables are written without compression'.format(name))
+            return Dict()
+
+        return Dict(profiles[name])
+
+    def variable_encoding(self, ds, name):
+        """encoding of the variable name of the dataset ds according to the encoding profile
+
+        Only numeric variables are compressed and chunked. The data and uncertainties
+        of the product matrices (dimensions wavelength, time, level) are packed as
+        float32 if required by the profile.
+        """
+        variable = ds.variables[name]
+        profile = self.encoding_profile
+        result = {}
+
+        if variable.ndim == 0 or not np.issubdtype(variable.dtype, np.number):
+            return result
+
+        if profile.zlib:
+            result['zlib'] = True
+            result['complevel'] = profile.get('complevel', 4)
+            result['shuffle'] = profile.get('shuffle', True)
+            result['contiguous'] = False
+
+        if profile.chunks and (0 not in variable.shape):
+            # missing or null chunk length -> whole dimension
+            result['chunksizes'] = tuple(min(size, profile.chunks.get(dim) or size)
+                                         for dim, size in zip(variable.dims, variable.shape))
+            result['contiguous'] = False
+
+        if profile.float32 \
+                and (name in ds.data_vars) \
+                and {'wavelength', 'level'}.issubset(variable.dims) \
+                and np.issubdtype(variable.dtype, np.floating):
+            result['dtype'] = 'float32'
+
+        return result
 
     def mwl_filename(self):
         header = self.data_storage.header
@@ -63,44 +116,59 @@ class WriteMWLOutputDefault(BaseOperation):
     def collect_meta_data(self):
         # read meta data of all products into meta_data
         failed_products = self.product_params.failed_products()
-        for pid, param in self.product_params.product_list.items():
-            if param not in failed_products:
-                if param.calc_with_res(LOWRES):
-                    prod = self.data_storage.product_common_smooth(pid, LOWRES)
-                else:
-                    prod = self.data_storage.product_common_smooth(pid, HIGHRES)
+        with self.data_storage.borrow():
+            for pid, param in self.product_params.product_list.items():
+                if param not in failed_products:
+                    if param.calc_with_res(LOWRES):
+                        prod = self.data_storage.product_common_smooth(pid, LOWRES)
+                    else:
+                        prod = self.data_storage.product_common_smooth(pid, HIGHRES)
+
+                    # Todo Ina fix error
+                    prod.to_meta_ds_dict(self.meta_data)
+
+    def write_group(self, nc_file, group_name, group_data):
+        """writes attributes and variables of one group into the opened output file
+
+        The variables are encoded by xarray (same encoding as Dataset.to_netcdf)
+        but written into the group of the already opened file.
+
+        Args:
+            nc_file (netCDF4.Dataset): the opened output file
+            group_name (str): path of the group (nested groups are separated by '/')
+            group_data (addict.Dict): with keys attrs and data_vars
+        """
+        ds = xr.Dataset(
+            data_vars=group_data.data_vars,
+            coords={},
+            attrs=group_data.attrs)
+
+        if self.encoding_profile:
+            for name, variable in ds.variables.items():
+                # the encoding is not changed in place because the variables may be shared with the data storage
+                variable.encoding = dict(variable.encoding, **self.variable_encoding(ds, name))
+
+        if group_name == MWLFileStructure.GROUP_NAME[MWLFileStructure.GENERAL]:
+            nc_group = nc_file
+        else:
+            nc_group = nc_file.createGroup(group_name)
 
-                # Todo Ina fix error
-                prod.to_meta_ds_dict(self.meta_data)
+        # the store must not be closed, it would close the whole file
+        ds.dump_to_store(NetCDF4DataStore(nc_group))
 
     def write_groups(self):
-        for group in MWLFileStructure.MAIN_GROUPS:
-            # convert Dict into Dataset
-            if group in self.data:
-                ds = xr.Dataset(
-                    data_vars=self.data[group].data_vars,
-                    coords={},
-                    attrs=self.data[group].attrs)
-                # write attributes and variables into netCDF file
-                ds.to_netcdf(
-                    path=self.out_filename,
-                    mode=MWLFileStructure.WRITE_MODE[group],
-                    group=MWLFileStructure.GROUP_NAME[group],
-                    format='NETCDF4')
-                ds.close()
-
-        for mwl_id, md in self.meta_data.items():
-            ds = xr.Dataset(
-                data_vars=md.data_vars,
-                coords={},
-                attrs=md.attrs)
-            ds.to_netcdf(
-                path=self.out_filename,
-                mode='a',
-                group='{}/{}'.format(
-                    MWLFileStructure.GROUP_NAME[MWLFileStructure.META_DATA], mwl_id),
-                format='NETCDF4')
-            ds.close()
+        """writes all groups into the output file. The file is opened and closed only once."""
+        with netCDF4.Dataset(self.out_filename, mode='w', format='NETCDF4') as nc_file:
+            for group in MWLFileStructure.MAIN_GROUPS:
+                if group in self.data:
+                    self.write_group(nc_file,
+                                     MWLFileStructure.GROUP_NAME[group],
+                                     self.data[group])
+
+            for mwl_id, md in self.meta_data.items():
+                self.write_group(nc_file,
+                                 '{}/{}'.format(MWLFileStructure.GROUP_NAME[MWLFileStructure.META_DATA], mwl_id),
+                                 md)
 
     def register_to_db(self):
         header = self.data_storage.header
@@ -119,32 +187,34 @@ class WriteMWLOutputDefault(BaseOperation):
         self.collect_header_info()
         self.collect_meta_data()
 
-        for res in RESOLUTIONS:
-            # all product types that are available for this resolution
-            p_types = self.product_params.prod_types(res=res)
-
-            if len(p_types) > 0:
-                # collect all data with this resolution
-                group_data = Dict({'attrs': Dict(), 'data_vars': Dict()})
-
-                # todo cloudmask shall have common altitude, time and timebounds variables
-                group_data.data_vars.cloud_mask = self.data_storage.clipped_cloud_mask(res)
-                group_data.data_vars.vertical_res = self.data_storage.clipped_vertical_resolution(res)
-
-                for ptype in p_types:
-                    p_matrix = self.data_storage.product_matrix(ptype, res)
-                    if p_matrix is not None:
-                        var_name = MWLFileStructure.NC_VAR_NAMES[ptype]
-                        group_data.data_vars[var_name] = p_matrix.data
-                        group_data.data_vars['error_{}'.format(var_name)] = p_matrix.absolute_statistical_uncertainty
-                        group_data.data_vars['{}_meta_data'.format(var_name)] = p_matrix.meta_data
-                        if ptype in MWLFileStructure.PRODUCTS_WITH_SYS_ERROR:
-                            group_data.data_vars['positive_systematic_error_{}'.format(var_name)] = \
-                                p_matrix.absolute_systematic_uncertainty_positive
-                            group_data.data_vars['negative_systematic_error_{}'.format(var_name)] = \
-                                p_matrix.absolute_systematic_uncertainty_negative
-
-                self.data[MWLFileStructure.RES_GROUP[res]] = group_data
+        # the stored data are only read -> no copies needed
+        with self.data_storage.borrow():
+            for res in RESOLUTIONS:
+                # all product types that are available for this resolution
+                p_types = self.product_params.prod_types(res=res)
+
+                if len(p_types) > 0:
+                    # collect all data with this resolution
+                    group_data = Dict({'attrs': Dict(), 'data_vars': Dict()})
+
+                    # todo cloudmask shall have common altitude, time and timebounds variables
+                    group_data.data_vars.cloud_mask = self.data_storage.clipped_cloud_mask(res)
+                    group_data.data_vars.vertical_res = self.data_storage.clipped_vertical_resolution(res)
+
+                    for ptype in p_types:
+                        p_matrix = self.data_storage.product_matrix(ptype, res)
+                        if p_matrix is not None:
+                            var_name = MWLFileStructure.NC_VAR_NAMES[ptype]
+                            group_data.data_vars[var_name] = p_matrix.data
+                            group_data.data_vars['error_{}'.format(var_name)] = p_matrix.absolute_statistical_uncertainty
+                            group_data.data_vars['{}_meta_data'.format(var_name)] = p_matrix.meta_data
+                            if ptype in MWLFileStructure.PRODUCTS_WITH_SYS_ERROR:
+                                group_data.data_vars['positive_systematic_error_{}'.format(var_name)] = \
+                                    p_matrix.absolute_systematic_uncertainty_positive
+                                group_data.data_vars['negative_systematic_error_{}'.format(var_name)] = \
+                                    p_matrix.absolute_systematic_uncertainty_negative
+
+                    self.data[MWLFileStructure.RES_GROUP[res]] = group_data
 
         self.write_groups()
         self.register_to_db()
@@ -19,6 +19,7 @@ from ELDAmwl.errors.exceptions import SameWlForAE
 from ELDAmwl.errors.exceptions import NotFoundInStorage
 from ELDAmwl.errors.exceptions import SizeMismatch
 from ELDAmwl.errors.exceptions import UseCaseNotImplemented
+from ELDAmwl.log.profiler import profiled_method
 from ELDAmwl.output.mwl_file_structure import MWLFileStructure
 from ELDAmwl.rayleigh import RayleighLidarRatio
 from ELDAmwl.signals import Signals
@@ -41,9 +42,13 @@ from ELDAmwl.utils.constants import NEG_DATA, P_NEG_DATA, P_ALL_OK, P_EMPTY, P_A
 from ELDAmwl.utils.constants import PRODUCT_TYPE_NAME
 from ELDAmwl.utils.constants import RBSC
 from ELDAmwl.utils.constants import RESOLUTION_STR, SINGLE_POINT
+from ELDAmwl.utils.constants import RESOLUTIONS
 from ELDAmwl.utils.constants import P_TOO_LARGE_INTEGRAL, P_VALUE_OUTSIDE_VALID_RANGE
 from ELDAmwl.utils.constants import UNCERTAINTY_TOO_LARGE, VALUE_OUTSIDE_VALID_RANGE
-from ELDAmwl.utils.numerical import integral_profile
+from ELDAmwl.utils.numerical import count_valid_in_windows
+from ELDAmwl.utils.numerical import integral_profiles
+from ELDAmwl.utils.numerical import sliding_bitwise_or
+from ELDAmwl.utils.numerical import sliding_filter
 from zope import component
 
 import ELDAmwl.utils.constants
@@ -105,6 +110,7 @@ class Products(Signals):
     def is_derived_product(self):
         return self.params.general_params.is_derived_product
 
+    @profiled_method
     def smooth(self, binres):
         """
         performs smoothing of the data
@@ -119,8 +125,6 @@ class Products(Signals):
             raise SizeMismatch('bin resolution',
                                'product {}'.format(self.params.prod_id_str),
                                'smooth')
-        num_times = self.ds.dims['time']
-        num_levels = self.ds.dims['level']
         # first bin of the smooth window
         fb = binres.level - binres // 2
         # next bin after smooth window
@@ -129,53 +133,114 @@ class Products(Signals):
         # find valid time slices (those which have not only nan values)
         valid_ts = np.where(~self.data.isnull().all(dim='level'))[0]
 
+        smooth_mask = np.zeros(self.data.shape, dtype=bool)
         for t in valid_ts:
             # first and last smoothable bins
             fsb = np.where(fb[:, t] >= self.first_valid_bin(t))[0][0]
             # actually, this is not the last smoothable bin, but the one after that
             lsb = np.where(nb[:, t] > self.last_valid_bin(t))[0][0]
             # keep this notation in order to avoid lsb + 1 everywhere
+            smooth_mask[t, fsb:lsb] = True
 
-            for lev in range(fsb, lsb):
-                self.qf[t, lev] = np.bitwise_or.reduce(self.qf.values[t, int(fb[lev, t]):int(nb[lev, t])])
-                # todo: smoothing of mol_extinction, mol_backscatter, transmission, cloudflag, sys_err etc
-                smoothed = self.smooth_routine.run(window=int(binres[t, lev]),
-                                                   data=self.data.values[t, int(fb[lev, t]):int(nb[lev, t])],
-                                                   err=self.err.values[t, int(fb[lev, t]):int(nb[lev, t])])
-                self.data[t, lev] = smoothed.data
-                self.err[t, lev] = smoothed.err
-                self.binres[t, lev] = binres[t, lev]
-
-            for lev in range(fsb):
-                self.set_invalid_point(t, lev, CALC_WINDOW_OUTSIDE_PROFILE)
-            for lev in range(lsb, num_levels):
-                self.set_invalid_point(t, lev, CALC_WINDOW_OUTSIDE_PROFILE)
+        if hasattr(self.smooth_routine, 'run_profiles'):
+            self.smooth_profiles(binres, smooth_mask)
+        else:
+            self.smooth_bins(binres, smooth_mask)
+
+        # in valid time slices, all bins outside the smoothable range are invalid
+        edge_mask = np.zeros(self.data.shape, dtype=bool)
+        edge_mask[valid_ts] = ~smooth_mask[valid_ts]
+        self.set_invalid_mask(edge_mask, CALC_WINDOW_OUTSIDE_PROFILE)
+
+    def smooth_profiles(self, binres, smooth_mask):
+        """smoothes all bins in smooth_mask at once.
+
+        The smoothing of each bin uses the unsmoothed data of its window.
+
+        Args:
+            binres (xarray.DataArray): bin resolution which shall be used for smoothing
+            smooth_mask (np.array of bool (time, level)): True for all bins which shall be smoothed
+        """
+        window = np.where(smooth_mask, binres.values, 1).astype(int)
+
+        # todo: smoothing of mol_extinction, mol_backscatter, transmission, cloudflag, sys_err etc
+        smoothed = self.smooth_routine.run_profiles(window=window,
+                                                    data=self.data.values,
+                                                    err=self.err.values,
+                                                    mask=smooth_mask)
+        qf = sliding_bitwise_or(self.qf.values, window, mask=smooth_mask)
+
+        self.ds['qf'].values[smooth_mask] = qf[smooth_mask]
+        self.ds['data'].values[smooth_mask] = smoothed.data[smooth_mask]
+        self.ds['err'].values[smooth_mask] = smoothed.err[smooth_mask]
+        self.ds['binres'].values[smooth_mask] = window[smooth_mask]
+
+    def smooth_bins(self, binres, smooth_mask):
+        """smoothes all bins in smooth_mask separately.
+
+        This is used for smooth routines which cannot handle complete profiles (e.g. plugins)
+
+        Args:
+            binres (xarray.DataArray): bin resolution which shall be used for smoothing
+            smooth_mask (np.array of bool (time, level)): True for all bins which shall be smoothed
+        """
+        data = self.data.values.copy()
+        err = self.err.values.copy()
+        qf = self.qf.values.copy()
+
+        for t, lev in zip(*np.where(smooth_mask)):
+            window = int(binres[t, lev])
+            fb = lev - window // 2
+            nb = lev + window // 2 + 1
+
+            self.qf[t, lev] = np.bitwise_or.reduce(qf[t, fb:nb])
+            smoothed = self.smooth_routine.run(window=window,
+                                               data=data[t, fb:nb],
+                                               err=err[t, fb:nb])
+            self.data[t, lev] = smoothed.data
+            self.err[t, lev] = smoothed.err
+            self.binres[t, lev] = window
+
+    def add_qf(self, mask, qf_flag):
+        """adds (bitwise or) the quality flag qf_flag to all points of mask
+
+        Args:
+            mask (np.array of bool (time, level)): points which shall be flagged
+            qf_flag (int): quality flag
+        """
+        qf = self.ds.qf.values
+        qf[np.asarray(mask, dtype=bool)] |= qf_flag
+
+    def threshold_values(self, threshold):
+        """threshold (number or xr.DataArray) as value or array which can be compared to the data array"""
+        if isinstance(threshold, xr.DataArray):
+            return threshold.broadcast_like(self.data).transpose(*self.data.dims).values
+        return threshold
 
     def screen_negative_data(self):
-        good_points_before = self.ds.qf.where(self.ds.qf == ALL_OK).count(dim='level')
+        good_points_before = np.count_nonzero(self.ds.qf.values == ALL_OK, axis=1)
 
         self.flag_values_below_threshold(0, NEG_DATA)
 
-        good_points_after = self.ds.qf.where(self.ds.qf == ALL_OK).count(dim='level')
+        good_points_after = np.count_nonzero(self.ds.qf.values == ALL_OK, axis=1)
         num_neg_points = good_points_before - good_points_after
 
         if self.product_type in self.cfg.MAX_ALLOWED_PERCENTAGE_OF_NEG_DATA:
             max_percentage = self.cfg.MAX_ALLOWED_PERCENTAGE_OF_NEG_DATA[self.product_type]
-            bad_time_slices = np.where((num_neg_points / good_points_before) > max_percentage)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                bad_time_slices = np.where((num_neg_points / good_points_before) > max_percentage)
             self.profile_qf[bad_time_slices] = self.profile_qf[bad_time_slices] | P_NEG_DATA
         # todo: overwrite this method in angstroem exponents and skip (pass) the test
 
     def flag_values_below_threshold(self, threshold, qf_flag):
         # todo: how to handle systematic errors ?
-        max_profile = self.data + self.cfg.NEG_VALUES_ERR_FACTOR * self.err
-        bad_idxs = np.where(max_profile < threshold)
-        self.ds.qf[bad_idxs] = self.ds.qf[bad_idxs] | qf_flag
+        max_profile = self.data.values + self.cfg.NEG_VALUES_ERR_FACTOR * self.err.values
+        self.add_qf(max_profile < self.threshold_values(threshold), qf_flag)
 
     def flag_values_above_threshold(self, threshold, qf_flag):
         # todo: how to handle systematic errors ?
-        min_profile = self.data - self.cfg.NEG_VALUES_ERR_FACTOR * self.err
-        bad_idxs = np.where(min_profile > threshold)
-        self.ds.qf[bad_idxs] = self.ds.qf[bad_idxs] | qf_flag
+        min_profile = self.data.values - self.cfg.NEG_VALUES_ERR_FACTOR * self.err.values
+        self.add_qf(min_profile > self.threshold_values(threshold), qf_flag)
 
     def screen_valid_data_range(self):
         min_value = self.cfg.VALID_DATA_RANGE[self.product_type][0]
@@ -189,10 +254,11 @@ class Products(Signals):
         self.qc_profile_data_range()
 
     def screen_too_large_errors(self):
-        bad_idxs = np.where((self.rel_err > self.cfg.MAX_ALLOWED_REL_ERROR[self.product_type]) &
-                            (self.err > self.cfg.MAX_ALLOWED_ABS_ERROR[self.product_type]))
-
-        self.ds.qf[bad_idxs] = self.ds.qf[bad_idxs] | UNCERTAINTY_TOO_LARGE
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rel_err = self.rel_err.values
+        too_large_rel_err = rel_err > self.cfg.MAX_ALLOWED_REL_ERROR[self.product_type]
+        too_large_abs_err = self.err.values > self.cfg.MAX_ALLOWED_ABS_ERROR[self.product_type]
+        self.add_qf(too_large_rel_err & too_large_abs_err, UNCERTAINTY_TOO_LARGE)
 
     def screen_for_aerosol_free_layers(self):
         # can be done only for derived products, because the reference backscatter ratio at 532
@@ -209,9 +275,11 @@ class Products(Signals):
             return None
 
         try:
-            bsc_ratio_profile = self.data_storage.bsc_ratio_532(self.resolution)
-            bad_idxs = np.where((bsc_ratio_profile.data < min_bsc_ratio) & (bsc_ratio_profile.ds.qf == ALL_OK))
-            self.ds.qf[bad_idxs] = self.ds.qf[bad_idxs] | BELOW_MIN_BSCR
+            # the bsc ratio profile is only read -> no copy needed
+            with self.data_storage.borrow():
+                bsc_ratio_profile = self.data_storage.bsc_ratio_532(self.resolution)
+                bad = (bsc_ratio_profile.data.values < min_bsc_ratio) & (bsc_ratio_profile.ds.qf.values == ALL_OK)
+            self.add_qf(bad, BELOW_MIN_BSCR)
         except NotFoundInStorage:
             self.logger.error('screening for aerosol free layers '
                                   f'for {PRODUCT_TYPE_NAME[self.product_type]} failed '
@@ -219,18 +287,18 @@ class Products(Signals):
 
     def screen_for_single_points(self):
         """ flag single data points which are not connected to other neighboring valid data points
-        """
-        # use dummy_data.rolling(level=3, min_periods=1, center=True).count() < 2
-        # if level==3 and count == 2, the point has itself and 1 neighbor
-        # if level==3 and count == 1, the point has itself or only 1 neighbor
-        # if level ==5 and count >=3, the point has itself and 2 neighbors in the 5 bins window
-        # strategy -> increase level iteratively
 
+        A valid data point (qf == ALL_OK) is flagged if less than half of the bins of the window around it
+        contain valid data. The window width is the common vertical resolution in bins at this point.
+        The numbers of valid neighbors are counted like
+        valid_data.rolling(level=width, min_periods=1, center=True).count(),
+        but for all window widths at once from one cumulative sum of the valid points.
+        """
+        qf = self.ds.qf.values
         # select only data which are ok
-        dummy_data = self.data.where(self.ds.qf == ALL_OK)
+        valid = (qf == ALL_OK) & ~np.isnan(self.data.values)
 
         # the common vertical resolution of all products in m
-        # vert_res_m = self.data_storage.common_vertical_resolution(self.resolution).data
         common_vert_res = self.data_storage.common_vertical_resolution(self.resolution)
         # use only those parts of the common_vert_res array which have the coordinates as this product
         # use the inner join to make this selection
@@ -242,63 +310,53 @@ class Products(Signals):
 
         # common vertical resolution in bins
         vert_res_bins = self.heightres_to_bins(vert_res_m)
+        # the array may contain also NC_FILL_INT
+        has_binres = vert_res_bins != NC_FILL_INT
 
-        # all bin resolutions which occur in this array
-        all_bin_res = np.unique(vert_res_bins)
+        # data with all binres are taken into account when counting neighbors
+        counts = count_valid_in_windows(valid, np.where(has_binres, vert_res_bins, 1))
 
-        # this list may contain also NC_FILL_INT -> remove it
-        all_bin_res = all_bin_res[np.where(all_bin_res != NC_FILL_INT)]
+        # valid data points with less than half of the window width valid neighbors
+        bad = (qf == ALL_OK) & has_binres & (counts > 0) & (counts < (vert_res_bins / 2))
+        self.add_qf(bad, SINGLE_POINT)
 
         self.ds['heightres'] = self.data_storage.common_vertical_resolution(self.resolution)
-        self.ds['heightres_bin'] = self.data_storage.common_vertical_resolution(self.resolution)
-        self.ds['heightres_bin'].data = vert_res_bins
-        self.ds['counts'] = self.data_storage.common_vertical_resolution(self.resolution)
-        self.ds['counts'].data[:] = 0
+        self.ds['heightres_bin'] = self.ds.heightres.copy(data=vert_res_bins)
+        self.ds['counts'] = self.ds.heightres.copy(data=np.where(has_binres, counts, 0))
 
-        for br in all_bin_res:
+    def qc_integral(self):
+        max_integral = self.cfg.MAX_INTEGRAL[self.product_type]
+        # use only data points with qf == ALL_OK
+        is_ok = self.ds.qf.values == ALL_OK
+        dummy_data = np.where(is_ok, self.data.values, np.nan)
+        dummy_heights = np.where(is_ok, self.height.values, np.nan)
 
-            # data with all binres are taken into account when counting neighbors
-            counts = dummy_data.rolling(level=br, min_periods=1, center=True).count()
+        # integrate all time slices at once
+        ts = np.where(self.profile_qf == P_ALL_OK)[0]
+        int_profiles = integral_profiles(dummy_data[ts],
+                                         range_axis=dummy_heights[ts])
 
-            # comparison to number of required neighbors is done only for data points with vert_res_bins == br
-            bad_idxs = np.where((self.ds.qf == ALL_OK) & (counts < (br/2)) & (vert_res_bins == br))
-            self.ds.qf[bad_idxs] = self.ds.qf[bad_idxs] | SINGLE_POINT
+        # the last valid point of the integral profiles (if any)
+        has_integral = ~np.all(np.isnan(int_profiles), axis=1)
+        last_valid = int_profiles.shape[1] - 1 - np.argmax(~np.isnan(int_profiles[:, ::-1]), axis=1)
+        integral = int_profiles[np.arange(ts.size), last_valid]
 
-            br_idxs = np.where(vert_res_bins == br)
-            self.ds['counts'][br_idxs] = counts[br_idxs]
+        too_large = ts[has_integral & (integral > max_integral)]
+        self.profile_qf[too_large] = self.profile_qf[too_large] | P_TOO_LARGE_INTEGRAL
 
-    def qc_integral(self):
-        # todo: use only data points with qf == ALL_OK
-        max_integral = self.cfg.MAX_INTEGRAL[self.product_type]
-        dummy_data = self.data.where(self.ds.qf == ALL_OK)
-        dummy_heights = self.height.where(self.ds.qf == ALL_OK)
-
-        for t in np.where(self.profile_qf == P_ALL_OK)[0]:
-            int_profile = integral_profile(dummy_data[t].values,
-                                           range_axis=dummy_heights[t].values)
-                                           # dummy_data[t].values,
-                                           # range_axis=dummy_heights[t].values,
-                                           # extrapolate_ovl_factor=OVL_FACTOR,
-                                           # first_bin=self.first_valid_bin(t),
-                                           # last_bin=self.last_valid_bin(t))
-
-            # the last valid point of the integral profile (if any)
-            if int_profile is not None:
-                integral = int_profile[np.where(~np.isnan(int_profile))][-1]
-                if integral > max_integral:
-                    self.profile_qf[t] = self.profile_qf[t] | P_TOO_LARGE_INTEGRAL
-            else:
-                self.logger.warning('cannot perform qc integral check because no valid data in profile')
+        for t in ts[~has_integral]:
+            self.logger.warning('cannot perform qc integral check because no valid data in profile')
 
     def qc_profile_data_range(self):
         if self.product_type in self.cfg.MAX_ALLOWED_PERCENTAGE_OF_OUT_OF_RANGE_DATA:
             max_percentage = self.cfg.MAX_ALLOWED_PERCENTAGE_OF_OUT_OF_RANGE_DATA[self.product_type]
 
-            good_points = self.ds.qf.where(self.ds.qf == ALL_OK).count(dim='level')
-            out_of_range_points = self.ds.qf.where(self.ds.qf == VALUE_OUTSIDE_VALID_RANGE).count(dim='level')
+            good_points = np.count_nonzero(self.ds.qf.values == ALL_OK, axis=1)
+            out_of_range_points = np.count_nonzero(self.ds.qf.values == VALUE_OUTSIDE_VALID_RANGE, axis=1)
             all_points = out_of_range_points + good_points
 
-            bad_time_slices = np.where((out_of_range_points / all_points) > max_percentage)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                bad_time_slices = np.where((out_of_range_points / all_points) > max_percentage)
             self.profile_qf[bad_time_slices] = self.profile_qf[bad_time_slices] | P_VALUE_OUTSIDE_VALID_RANGE
 
     def retrieval_failed(self):
@@ -314,7 +372,7 @@ class Products(Signals):
             return False
 
     def flag_empty_profiles(self):
-        empty_profiles = self.data.isnull().all('level')
+        empty_profiles = np.isnan(self.data.values).all(axis=1)
         self.profile_qf[empty_profiles] = self.profile_qf[empty_profiles] | P_EMPTY
 
     def quality_control(self):
@@ -335,19 +393,15 @@ class Products(Signals):
             self.qc_integral()
 
         # if the profile is flagged by some retrieval problem -> set all data as nan
-        invalid_time_slices = np.where(self.profile_qf != P_ALL_OK)
-        for t in invalid_time_slices[0]:
-            self.set_invalid_profile(t)
+        self.set_invalid_profiles(np.asarray(self.profile_qf) != P_ALL_OK)
 
         # if all data points are flagged, set profile flag, but keep individual values
-        # operate on a copy of the data array
-        dummy_data = deepcopy(self.data)
-        for qf in self.cfg.CRITICAL_FLAGS:
-            # where returns values where condition is fulfilled, nan otherwise
-            # data points where the qf is set are filled with nan
-            dummy_data = dummy_data.where((self.qf & qf) != qf)
-
-        bad_time_slices = dummy_data.isnull().all(dim='level').values
+        qf = self.ds.qf.values
+        flagged = np.isnan(self.data.values)
+        for qf_flag in self.cfg.CRITICAL_FLAGS:
+            flagged |= (qf & qf_flag) == qf_flag
+
+        bad_time_slices = flagged.all(axis=1)
         self.profile_qf[bad_time_slices] = self.profile_qf[bad_time_slices] | P_ALL_FLAGGED
 
     def save_to_netcdf(self):
@@ -574,34 +628,26 @@ class ProductParams(Params):
             return False
 
     def mark_as_failed(self, measurement_params):
-        params_table = measurement_params.product_table
-        params_table.loc[params_table.id == self.prod_id_str, 'failed'] = True
+        measurement_params.product_index.mark_as_failed(self.prod_id_str)
+
+    def has_failed(self, measurement_params):
+        return measurement_params.product_index.has_failed(self.prod_id_str)
 
     def assign_to_product_list(self, measurement_params):
         gen_params = self.general_params
         params_list = measurement_params.product_list
-        params_table = measurement_params.product_table
 
         if self.prod_id_str not in params_list:
             params_list[self.prod_id_str] = self
-            params_table.loc[len(params_table.index)] = \
-                {'id': self.prod_id_str,
-                 'wl': gen_params.emission_wavelength,
-                 'type': gen_params.product_type,
-                 'basic': gen_params.is_basic_product,
-                 'derived': gen_params.is_derived_product,
-                 'failed': False,
-                 RESOLUTION_STR[HIGHRES]: gen_params.calc_with_hr,
-                 RESOLUTION_STR[LOWRES]: gen_params.calc_with_lr,
-                 'elpp_file': gen_params.elpp_file}
-        else:
-            df = params_table[(params_table.id == self.prod_id_str)]
-            idx = df.index[0]
-            highres = df[RESOLUTION_STR[HIGHRES]][idx] or gen_params.calc_with_hr
-            lowres = df[RESOLUTION_STR[LOWRES]][idx] or gen_params.calc_with_lr
 
-            params_table.loc[params_table.id == self.prod_id_str, RESOLUTION_STR[HIGHRES]] = highres  # noqa E501
-            params_table.loc[params_table.id == self.prod_id_str, RESOLUTION_STR[LOWRES]] = lowres  # noqa E501
+        measurement_params.product_index.add(
+            self.prod_id_str,
+            gen_params.emission_wavelength,
+            gen_params.product_type,
+            gen_params.is_basic_product,
+            gen_params.is_derived_product,
+            [res for res in RESOLUTIONS if self.calc_with_res(res)],
+            elpp_file=gen_params.elpp_file)
 
     def is_bsc_from_depol_components(self):
         if self.general_params.product_type in [RBSC, EBSC]:
@@ -904,6 +950,35 @@ class SmoothSavGolay(BaseOperation):
 
         return Dict({'data': data_sm, 'err': err_sm})
 
+    def run_profiles(self, **kwargs):
+        """smoothes complete (time, level) arrays at once.
+
+        All bins with the same window width are smoothed with a single
+        convolution of the data with the SG coefficients.
+
+        Keyword Args:
+            window(): ndarray of int (time, level) with the (odd) length of the smooth window of each bin
+            data(): ndarray (time, level) which contains the data to be smoothed
+            err(): ndarray (time, level) which contains the errors of the data to be smoothed
+            mask(): ndarray of bool (time, level), optional. Only bins where mask is True are smoothed.
+
+        Returns:
+            addict.Dict with keys 'data' and 'err' which are ndarray (time, level).
+            Bins which were not smoothed are nan.
+
+        """
+        assert 'window' in kwargs
+        assert 'data' in kwargs
+        assert 'err' in kwargs
+
+        data_sm, err_sm = sliding_filter(kwargs['data'],
+                                         kwargs['window'],
+                                         lambda win: sg_coeffs(win, 2),
+                                         err=kwargs['err'],
+                                         mask=kwargs.get('mask'))
+
+        return Dict({'data': data_sm, 'err': err_sm})
+
 
 class SmoothSlidingAverage(BaseOperation):
     """calculates Raman backscatter profile like in ansmann et al 1992"""
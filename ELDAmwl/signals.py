@@ -15,6 +15,8 @@ from ELDAmwl.errors.exceptions import RepeatedCorrectMolTransm
 from ELDAmwl.errors.exceptions import RepeatedNormalizeByshots
 from ELDAmwl.header import Header
 from ELDAmwl.rayleigh import RayleighLidarRatio
+from ELDAmwl.storage.cached_functions import array_key
+from ELDAmwl.storage.cached_functions import fixed_smooth_profile
 from ELDAmwl.utils.constants import ABOVE_MAX_ALT
 from ELDAmwl.utils.constants import ALL_OK, P_ALL_OK
 from ELDAmwl.utils.constants import ALL_RANGE
@@ -32,6 +34,7 @@ from ELDAmwl.utils.constants import TOTAL
 from ELDAmwl.utils.constants import TRANSMITTED
 from ELDAmwl.utils.constants import WATER_VAPOR
 from ELDAmwl.utils.numerical import calc_resolution, get_rangebin_axis
+from ELDAmwl.utils.numerical import linear_transition
 from ELDAmwl.utils.path_utils import abs_file_path
 from zope import component
 
@@ -105,12 +108,22 @@ class ElppData(object):
         Args:
             p_param:
 
+        """
+        self.read(elpp_file_path(p_param))
+        self.assign_to_product(p_param)
+
+    def read(self, elpp_file):
+        """reads header, cloud mask, and signals of an ELPP file
+
+        Header and cloud mask are put into the data_storage.
+
+        Args:
+            elpp_file (str): absolute path of the ELPP file
+
         """
         # todo: check if scc version in query = current version
 
-        filename = p_param.general_params.elpp_file
-        elpp_file = abs_file_path(self.cfg.SIGNAL_PATH, filename)
-        self.logger.debug('read file {0}'.format(filename))
+        self.logger.debug('read file {0}'.format(os.path.basename(elpp_file)))
 
         if not os.path.exists(elpp_file):
             self.logger.error('ELPP file {0} does not exist.'.format(elpp_file))
@@ -129,13 +142,70 @@ class ElppData(object):
         self.header = Header.from_nc_file(elpp_file, nc_ds)
         self.data_storage.header = self.header
 
+        self.signals = {}
         for idx in range(nc_ds.dims['channel']):
             sig = Signals.from_nc_file(nc_ds, idx, range_axis=self.range_bins)
             sig.ds.load()
+            self.signals[sig.channel_id_str] = sig
+
+        nc_ds.close()
+
+    def assign_to_product(self, p_param):
+        """puts the signals of the file into the data_storage as ELPP signals of a product
+
+        Args:
+            p_param (:obj:`ProductParams`): params of the product
+                        which is derived from this ELPP file
+
+        """
+        for sig in self.signals.values():
             self.data_storage.set_elpp_signal(p_param.prod_id_str, sig)  # noqa E501
             sig.register(p_param)
 
-        nc_ds.close()
+
+class ElppFileCache(object):
+    """Per-run cache of ELPP files, keyed by file path and channel id.
+
+    Each ELPP file is opened and its header, cloud mask, and signals are parsed
+    only once, even if several products use it. All those products get references
+    to the same :obj:`Signals` instances (the data_storage hands out only copies
+    or read-only views of them).
+
+    Channels with the same id in different files are not shared, because
+    the ELPP signals contain product specific variables (e.g. the depolarization
+    calibration or the assumed particle lidar ratio).
+    """
+
+    def __init__(self):
+        self.files = {}
+
+    def read(self, p_param):
+        """provides the signals of the ELPP file of a product
+
+        The file is read only if it was not read before.
+
+        Args:
+            p_param (:obj:`ProductParams`): params of the product
+
+        Returns:
+            :obj:`ElppData` with the content of the file
+        """
+        elpp_file = elpp_file_path(p_param)
+
+        elpp_data = self.files.get(elpp_file)
+        if elpp_data is None:
+            elpp_data = ElppData()
+            elpp_data.read(elpp_file)
+            self.files[elpp_file] = elpp_data
+
+        elpp_data.assign_to_product(p_param)
+        return elpp_data
+
+
+def elpp_file_path(p_param):
+    """absolute path of the ELPP file of a product"""
+    cfg = component.queryUtility(ICfg)
+    return abs_file_path(cfg.SIGNAL_PATH, p_param.general_params.elpp_file)
 
 
 class DepolarizationCalibration(object):
@@ -631,11 +701,9 @@ class Signals(Columns):
         # last valid level
         lvl = self.height_to_levels(max_h).data
 
-        for t in range(self.num_times):
-            for level in range(fvl[t]):
-                self.set_invalid_point(t, level, BELOW_OVL)
-            for level in range(lvl[t] + 1, self.num_levels):
-                self.set_invalid_point(t, level, ABOVE_MAX_ALT)
+        levels = np.arange(self.num_levels)
+        self.set_invalid_mask(levels[np.newaxis, :] < fvl[:, np.newaxis], BELOW_OVL)
+        self.set_invalid_mask(levels[np.newaxis, :] > lvl[:, np.newaxis], ABOVE_MAX_ALT)
 
     def correct_for_mol_transmission(self):
         r"""the signal data are corrected for molecular atmospheric transmission
@@ -805,38 +873,46 @@ class Signals(Columns):
             return an_eff_binres
 
     def get_binres_from_fixed_smooth(self, smooth_params, res, used_binres_routine=None):
+        """
+        profile of the number of bins which are used to calculate a product with fixed smoothing
+
+        The effective vertical resolution is smooth_params.vert_res['lowrange'] below and
+        ['highrange'] above the transition zone, and changes linearly within the transition zone.
+        The profiles are cached for each height axis, smooth params and used-binres routine.
+
+        Args:
+            smooth_params (:class:`ELDAmwl.products.SmoothParams`): smooth params of the mwl product
+            res (int): LOWRES or HIGHRES
+            used_binres_routine (BaseOperation): routine for the conversion of effective into used bin resolution
+
+        Returns:
+            xarray.DataArray (time, level): number of used bins
+        """
         if used_binres_routine:
             self.calc_used_bin_res_routine = used_binres_routine
 
-        # get params for the lower part of the profile (below transition zone)
-        tz_bottom = smooth_params.transition_zone.bottom
-        tz_bottom_bin = self.height_to_levels(tz_bottom)
-        vert_res_low = smooth_params.vert_res[RESOLUTION_STR[res]]['lowrange']
-        binres_low = self.heightres_to_bins(vert_res_low)
-        used_binres_low = self.eff_to_used_binres(binres_low)
-
-        # get params for the upper part of the profile (above transition zone)
-        tz_top = smooth_params.transition_zone.top
-        tz_top_bin = self.height_to_levels(tz_top)
-        vert_res_high = smooth_params.vert_res[RESOLUTION_STR[res]]['highrange']
-        binres_high = self.heightres_to_bins(vert_res_high)
-        used_binres_high = self.eff_to_used_binres(binres_high)
-
-        delta_res = (vert_res_high - vert_res_low) / (tz_top_bin - tz_bottom_bin)
-
-        # ! reversed logic! because
-        # where(condition, fillvalue where condition is not true)
-        result = self.binres.where(self.binres.level > tz_bottom_bin, used_binres_low)
-        result = result.where(result.level < tz_top_bin, used_binres_high)
-
-        for t in range(tz_bottom_bin.shape[0]):
-            for idx in range(int(tz_bottom_bin[t]), int(tz_top_bin[t])):
-                vert_res = float(vert_res_low + delta_res[t] * (idx - tz_bottom_bin[t]))
-                a_binres = int(self.heightres_to_bins(vert_res)[t])
-                a_used_binres = self.eff_to_used_binres(a_binres)
-                result[t, idx] = a_used_binres
-
-        return result
+        transition_zone = smooth_params.transition_zone
+        vert_res = smooth_params.vert_res[RESOLUTION_STR[res]]
+
+        def calc_used_binres():
+            vert_res_profile = linear_transition(self.binres.shape[-1],
+                                                 self.height_to_levels(transition_zone.bottom).values,
+                                                 self.height_to_levels(transition_zone.top).values,
+                                                 vert_res['lowrange'],
+                                                 vert_res['highrange'])
+            used_binres = self.eff_to_used_binres(self.heightres_to_bins(vert_res_profile))
+            return np.asarray(used_binres).astype(self.binres.dtype)
+
+        key = ('used_binres',
+               array_key(self.height.values),
+               array_key(self.raw_heightres),
+               transition_zone.bottom,
+               transition_zone.top,
+               vert_res['lowrange'],
+               vert_res['highrange'],
+               type(self.calc_used_bin_res_routine))
+
+        return self.binres.copy(data=fixed_smooth_profile(key, calc_used_binres))
 
 
 class CombineDepolComponentsDefault(BaseOperation):
@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 """functions which are often called with same parameters. Their results can be cached"""
+import numpy as np
 import pickle
+import threading
 
 from ELDAmwl.component.interface import IDBFunc
 from ELDAmwl.component.interface import ICfg
@@ -19,6 +21,8 @@ from ELDAmwl.utils.path_utils import abs_file_path
 #
 SG_PARAMS = None
 DEFAULT_ORDER = 2
+# the products may be retrieved in several threads (see cfg.NUM_THREADS)
+SG_PARAMS_LOCK = threading.Lock()
 
 
 def gen_sg_params():
@@ -44,11 +48,12 @@ def sg_coeffs(window_length, order):
         param = SG_PARAMS[window_length]
     except:
         param = savgol_coeffs(window_length, DEFAULT_ORDER)
-        SG_PARAMS[window_length] = param
+        with SG_PARAMS_LOCK:
+            SG_PARAMS[window_length] = param
 
-        SG_PARAMS_FILENAME = abs_file_path(component.queryUtility(ICfg).SAV_GOLAY_FILE)
-        with open(SG_PARAMS_FILENAME, 'wb') as outfile:
-            pickle.dump(SG_PARAMS, outfile)
+            SG_PARAMS_FILENAME = abs_file_path(component.queryUtility(ICfg).SAV_GOLAY_FILE)
+            with open(SG_PARAMS_FILENAME, 'wb') as outfile:
+                pickle.dump(SG_PARAMS, outfile)
     return param
 
 
@@ -66,6 +71,43 @@ def smooth_routine_from_db(method_id):
     return db_func.read_smooth_routine(method_id)
 
 
+# profiles of vertical and bin resolution of fixed smoothing {key: ndarray (time, level)}.
+# They depend only on the system configuration (height axis, smooth params, used-binres routine)
+# and are shared by all products, resolutions and measurements with the same configuration
+FIXED_SMOOTH_PROFILES = {}
+MAX_FIXED_SMOOTH_PROFILES = 100
+FIXED_SMOOTH_PROFILES_LOCK = threading.Lock()
+
+
+def fixed_smooth_profile(key, calc_func):
+    """profile of vertical or bin resolution of fixed smoothing
+
+    Args:
+        key (tuple): hashable description of all inputs of calc_func
+        calc_func: function without arguments which calculates the profile (ndarray) if it is not cached yet
+
+    Returns:
+        a copy of the cached profile (ndarray)
+    """
+    with FIXED_SMOOTH_PROFILES_LOCK:
+        profile = FIXED_SMOOTH_PROFILES.get(key)
+
+    if profile is None:
+        profile = calc_func()
+        with FIXED_SMOOTH_PROFILES_LOCK:
+            if len(FIXED_SMOOTH_PROFILES) >= MAX_FIXED_SMOOTH_PROFILES:
+                FIXED_SMOOTH_PROFILES.clear()
+            FIXED_SMOOTH_PROFILES[key] = profile
+
+    return profile.copy()
+
+
+def array_key(an_array):
+    """hashable representation of the values of an array"""
+    an_array = np.ascontiguousarray(an_array)
+    return an_array.shape, str(an_array.dtype), an_array.tobytes()
+
+
 # other candidates are functions for
 # * retrieval of used and effective bin resolutions
 # * converting height / altitude / range /bins
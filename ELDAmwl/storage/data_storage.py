@@ -1,22 +1,38 @@
 # -*- coding: utf-8 -*-
 """ELDAmwl operations"""
 from addict import Dict
+from contextlib import contextmanager
 from copy import deepcopy
 from ELDAmwl.component.interface import IDataStorage
 from ELDAmwl.errors.exceptions import DifferentCloudMaskExists
 from ELDAmwl.errors.exceptions import NotFoundInStorage
 from ELDAmwl.products import Products
+from ELDAmwl.storage.views import read_only_view
 from ELDAmwl.utils.constants import HIGHRES, RESOLUTIONS, RBSC, EBSC
 from ELDAmwl.utils.constants import LOWRES
 from ELDAmwl.utils.constants import NC_FILL_BYTE
 from ELDAmwl.utils.constants import RESOLUTION_STR
+from ELDAmwl.utils.numerical import bitwise_or_in_windows
 from zope import component
 
 import numpy as np
+import threading
 import xarray as xr
 import zope
 
 
+# the products may be retrieved in several threads -> each thread borrows on its own.
+# (kept outside of DataStorage because thread-local objects cannot be deep-copied)
+_BORROWING = threading.local()
+
+
+def borrow_levels():
+    """borrow levels of the current thread {id(data storage): level}"""
+    if not hasattr(_BORROWING, 'levels'):
+        _BORROWING.levels = {}
+    return _BORROWING.levels
+
+
 @zope.interface.implementer(IDataStorage)
 class DataStorage:
     """ global __data storage
@@ -28,6 +44,13 @@ class DataStorage:
     This restriction allows to implement e.g.
     intelligent memory caching in future (if needed).
 
+    By default, all getters return deepcopies of the stored objects.
+    Within the context :meth:`borrow`, the getters return read-only views
+    instead (see :func:`ELDAmwl.storage.views.read_only_view`).
+    Those share the memory with the stored objects and are the
+    preferred way to access stored data which are only read.
+    A writeable copy of a view can be obtained with :meth:`checkout`.
+
     """
 
     name = 'Datastorage'
@@ -91,6 +114,50 @@ class DataStorage:
                 })
             })
 
+    @contextmanager
+    def borrow(self):
+        """context in which all getters return read-only views instead of deepcopies
+
+        The views must not be written into (this raises a ValueError), but
+        new variables or attributes can be assigned to them without
+        changing the stored objects (copy-on-write).
+
+        Example:
+            with self.data_storage.borrow():
+                sig = self.data_storage.prepared_signals(pid)[0]
+
+        """
+        levels = borrow_levels()
+        levels[id(self)] = self.borrow_level + 1
+        try:
+            yield self
+        finally:
+            levels[id(self)] -= 1
+
+    @property
+    def borrow_level(self):
+        """number of nested :meth:`borrow` contexts of the current thread"""
+        return borrow_levels().get(id(self), 0)
+
+    def checkout(self, obj):
+        """writeable copy of a stored object or of a read-only view
+
+        Args:
+            obj: an object which was returned by one of the getters
+
+        Returns:
+            a deepcopy of obj which can be modified without restrictions
+        """
+        return deepcopy(obj)
+
+    def _provide(self, obj):
+        """returns a stored object to the outside world: a read-only view in the
+        context of :meth:`borrow`, a deepcopy otherwise"""
+        if self.borrow_level > 0:
+            return read_only_view(obj)
+        else:
+            return deepcopy(obj)
+
     def set_number_of_scheduled_products(self, number):
         self.__data.number_of_scheduled_products = number
 
@@ -243,7 +310,7 @@ class DataStorage:
         try:
             result = []
             for ch_id in self.__data.elpp_signals[prod_id_str]:
-                result.append(deepcopy(self.__data.elpp_signals[prod_id_str][ch_id]))
+                result.append(self._provide(self.__data.elpp_signals[prod_id_str][ch_id]))
             return result
         except AttributeError:
             raise NotFoundInStorage('ELPP signals',
@@ -264,7 +331,7 @@ class DataStorage:
                 and signal id was found in storage
         """
         try:
-            return deepcopy(self.__data.elpp_signals[prod_id_str][ch_id_str])
+            return self._provide(self.__data.elpp_signals[prod_id_str][ch_id_str])
         except AttributeError:
             raise NotFoundInStorage('ELPP signal {0}'.format(ch_id_str),
                                     'product {0}'.format(prod_id_str))
@@ -283,7 +350,7 @@ class DataStorage:
                 is found in storage
         """
         if channel_id in self.__data.lidar_constants:
-            result = deepcopy(self.__data.lidar_constants[channel_id])
+            result = self._provide(self.__data.lidar_constants[channel_id])
             return result
         else:
             raise NotFoundInStorage('lidar constant',
@@ -309,7 +376,7 @@ class DataStorage:
                 are found in storage
         """
         if wavelength in self.__data.lidar_constants:
-            result = deepcopy(self.__data.lidar_constants[wavelength])
+            result = self._provide(self.__data.lidar_constants[wavelength])
             return result
         else:
             raise NotFoundInStorage('lidar constant',
@@ -334,7 +401,7 @@ class DataStorage:
         try:
             result = []
             for ch_id in self.__data.prepared_signals[prod_id_str]:
-                result.append(deepcopy(self.__data.prepared_signals[prod_id_str][ch_id]))
+                result.append(self._provide(self.__data.prepared_signals[prod_id_str][ch_id]))
             return result
         except AttributeError:
             raise NotFoundInStorage('prepared signals',
@@ -359,7 +426,7 @@ class DataStorage:
                 and signal id was found in storage
         """
         try:
-            return deepcopy(self.__data.prepared_signals[prod_id_str][ch_id_str])
+            return self._provide(self.__data.prepared_signals[prod_id_str][ch_id_str])
         except AttributeError:
             raise NotFoundInStorage('prepared signal {0}'.format(ch_id_str),
                                     'product {0}'.format(prod_id_str))
@@ -390,9 +457,9 @@ class DataStorage:
                                     '{0} {1}'.format(where_str, RESOLUTION_STR[resolution]))
 
         if isinstance(result, xr.DataArray):
-            return deepcopy(result)
+            return self._provide(result)
         elif isinstance(result, Products):
-            return deepcopy(result)
+            return self._provide(result)
         else:
             # Dict returns {} instead of AttributeError
             if resolution is not None:
@@ -489,7 +556,7 @@ class DataStorage:
             result = None
 
         if isinstance(result, xr.DataArray):
-            return deepcopy(result)
+            return self._provide(result)
         else:
             raise NotFoundInStorage('{0} {1}'.format(RESOLUTION_STR[resolution], ''),
                                     '{0} {1}'.format('vertical resolution', RESOLUTION_STR[resolution]))
@@ -514,7 +581,7 @@ class DataStorage:
             result = None
 
         if isinstance(result, xr.DataArray):
-            return deepcopy(result)
+            return self._provide(result)
         else:
             raise NotFoundInStorage('{0} {1}'.format(RESOLUTION_STR[resolution], ''),
                                     '{0} {1}'.format('clipped vertical resolution', RESOLUTION_STR[resolution]))
@@ -539,7 +606,7 @@ class DataStorage:
             result = None
 
         if isinstance(result, xr.DataArray):
-            return deepcopy(result)
+            return self._provide(result)
         else:
             raise NotFoundInStorage('{0} {1}'.format(RESOLUTION_STR[resolution], ''),
                                     '{0} {1}'.format('clipped cloud_mask', RESOLUTION_STR[resolution]))
@@ -727,7 +794,7 @@ class DataStorage:
 
         """
         try:
-            result = deepcopy(self.__data.product_matrix[res][prod_type])
+            result = self._provide(self.__data.product_matrix[res][prod_type])
         except NotFoundInStorage:
             raise NotFoundInStorage('product matrix of type {0}'.format(prod_type),
                                     'products with common smoothing with {0}'.format(RESOLUTION_STR[res]))
@@ -751,7 +818,7 @@ class DataStorage:
 
         """
         try:
-            result = deepcopy(self.__data.qc_product_matrix[res][prod_type])
+            result = self._provide(self.__data.qc_product_matrix[res][prod_type])
         except NotFoundInStorage:
             raise NotFoundInStorage('product matrix of type {0}'.format(prod_type),
                                     'products with common smoothing with {0}'.format(RESOLUTION_STR[res]))
@@ -767,7 +834,7 @@ class DataStorage:
         Returns:
             :obj:'xarray.DataArray': deepcopy of the backscatter ratio at 532 nm
         """
-        return deepcopy(self.__data.bsc_ratio_532[res])
+        return self._provide(self.__data.bsc_ratio_532[res])
 
     def number_of_derived_products(self):
         count = 0
@@ -846,7 +913,6 @@ class DataStorage:
         cm = deepcopy(self.cloud_mask)
         cm[:] = NC_FILL_BYTE
 
-        num_times = cm.shape[0]
         num_levels = cm.shape[1]
 
         fb = maxres.level - maxres // 2
@@ -854,9 +920,9 @@ class DataStorage:
         fb = fb.where(fb >= 0, 0)
         lb = lb.where(lb < num_levels, num_levels - 1)
 
-        for t in range(num_times):
-            for lev in range(num_levels):
-                cm[t, lev] = np.bitwise_or.reduce(self.cloud_mask.values[t, int(fb[lev, t]):int(lb[lev, t])])
+        cm.values[:] = bitwise_or_in_windows(self.cloud_mask.values,
+                                             fb.transpose(*cm.dims).values,
+                                             lb.transpose(*cm.dims).values)
         # self.cloud_mask[0, 50] =2
         # self.cloud_mask[:, 100] = 1
         # np.bitwise_or.reduce(self.cloud_mask.values[:,40:110], axis=1)
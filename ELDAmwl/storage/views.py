@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""read-only views of stored objects"""
+from addict import Dict
+from copy import copy
+from ELDAmwl.bases.base import DataPoint
+from ELDAmwl.bases.base import Params
+
+import numpy as np
+import xarray as xr
+
+
+def read_only_array(array):
+    """read-only view of a np.array
+
+    The view shares the memory with the original array. Writing into the view raises
+    a ValueError, but the original array stays writeable.
+    """
+    view = np.asarray(array).view()
+    view.flags.writeable = False
+    return view
+
+
+# attribute types of stored objects which are viewed (copied) recursively,
+# because they contain mutable containers or arrays
+_NESTED_TYPES = (np.ndarray, xr.DataArray, xr.Dataset, dict, list, Params, DataPoint)
+
+
+def _make_variables_read_only(variables):
+    for var in variables:
+        # dimension coordinates are (immutable) pandas indexes anyway
+        if isinstance(var, xr.IndexVariable):
+            continue
+        var.data = read_only_array(var.data)
+
+
+def read_only_view(obj):
+    """read-only view of a stored object without copying its data
+
+    The view is a shallow copy of the object whose arrays share the memory with the
+    original, but are not writeable. This allows copy-on-write: assigning new
+    variables or attributes to the view (e.g. view.ds['data'] = new_array) does
+    not change the original object, while writing into the shared arrays
+    (e.g. view.ds['data'][0, 0] = 1) raises a ValueError. An object which shall be
+    modified in place must be copied with :meth:`ELDAmwl.storage.data_storage.DataStorage.checkout`.
+
+    Nested containers (addict.Dict, list) and parameter objects (e.g. params or meta data
+    of a product) are shallow copies as well, down to their arrays. Assigning a nested
+    attribute of the view (e.g. view.params.vert_res.lowres = 1) does not change the
+    original object either.
+
+    Args:
+        obj: np.array, xarray.DataArray, xarray.Dataset, addict.Dict, list, or an object
+            (e.g. :class:`ELDAmwl.signals.Signals` or :class:`ELDAmwl.bases.base.Params`)
+            whose attributes are of these types
+
+    Returns:
+        read-only view of obj
+    """
+    if obj is None:
+        return None
+
+    if isinstance(obj, np.ndarray):
+        return read_only_array(obj)
+
+    if isinstance(obj, xr.Dataset):
+        view = obj.copy(deep=False)
+        _make_variables_read_only(view.variables.values())
+        return view
+
+    if isinstance(obj, xr.DataArray):
+        view = obj.copy(deep=False)
+        _make_variables_read_only([view.variable])
+        _make_variables_read_only(view.coords.variables.values())
+        return view
+
+    if isinstance(obj, dict):
+        return Dict({key: read_only_view(value) for key, value in obj.items()})
+
+    if isinstance(obj, list):
+        return [read_only_view(item) for item in obj]
+
+    if hasattr(obj, '__dict__'):
+        view = copy(obj)
+        for name, value in vars(obj).items():
+            if isinstance(value, _NESTED_TYPES):
+                setattr(view, name, read_only_view(value))
+        return view
+
+    return obj
@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+"""benchmarks of ELDAmwl with synthetic measurements of configurable size
+
+Each configuration (number of time slices, levels, wavelengths) is processed
+end-to-end with Main.elda in a fresh process with enabled profile
+(see :class:`ELDAmwl.log.profiler.RunProfiler`). The timings of the
+processing stages and of the benchmarked operations are collected from the
+profile and written into a JSON file, e.g.
+
+    elda_benchmark -t 2 8 32 -l 1027 4096 -w 355,532,1064 -o benchmark.json
+
+The results of different ELDAmwl versions can be compared to each other
+by their (version independent) configuration keys.
+"""
+from addict import Dict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from ELDAmwl.component.interface import ICfg
+from ELDAmwl.component.interface import IProfiler
+from ELDAmwl.config import register_config
+from ELDAmwl.database.db_functions import register_db_func
+from ELDAmwl.elda_mwl.elda_mwl import register_params
+from ELDAmwl.log.log import register_logger
+from ELDAmwl.log.profiler import OPERATION
+from ELDAmwl.log.profiler import register_profiler
+from ELDAmwl.log.profiler import STAGE
+from ELDAmwl.main import Main
+from ELDAmwl.monte_carlo.operation import register_monte_carlo
+from ELDAmwl.monte_carlo.parallel_funcs import register_mc_pool
+from ELDAmwl.storage.cached_functions import gen_sg_params
+from ELDAmwl.storage.data_storage import register_datastorage
+from ELDAmwl.tests.synthetic_data import ALL_WAVELENGTHS
+from ELDAmwl.tests.synthetic_data import SyntheticMeasurement
+from zope import component
+
+import argparse
+import datetime
+import ELDAmwl
+import itertools
+import json
+import multiprocessing
+import numpy as np
+import os
+import platform
+import tempfile
+import traceback
+
+
+# operations (class names or qualified method names) with own entries in the results
+BENCHMARKED_OPERATIONS = [
+    'CalcExtinctionDefault',
+    'Products.smooth',
+    'CalcBscProfileKF',
+    'CalcRamanBscProfileViaBR',
+    'MonteCarlo.__call__',
+    'GetProductMatrixDefault',
+    'WriteMWLOutputDefault',
+]
+
+
+def configuration_key(config):
+    return 't{num_times}_l{num_levels}_w{wavelengths}'.format(
+        num_times=config.num_times,
+        num_levels=config.num_levels or 'orig',
+        wavelengths='-'.join(str(int(wl)) for wl in config.wavelengths))
+
+
+def collect_results(profile):
+    """wall time, CPU time, and peak RSS (increase) of the stages and of BENCHMARKED_OPERATIONS"""
+    result = Dict({
+        'wall_time': profile['wall_time'],
+        'peak_rss_mb': profile['peak_rss_mb'],
+        'stages': {},
+        'operations': {},
+    })
+
+    for record in profile['records']:
+        if record['kind'] == STAGE:
+            result.stages[record['name']] = {'wall_time': record['wall_time'],
+                                             'cpu_time': record['cpu_time'],
+                                             'peak_rss_increase_mb': record.get('peak_rss_increase_mb')}
+
+    for name in BENCHMARKED_OPERATIONS:
+        summary = profile['summary'].get('{}:{}'.format(OPERATION, name))
+        if summary is not None:
+            result.operations[name] = summary
+
+    return result.to_dict()
+
+
+def run_configuration(config):
+    """generates the synthetic measurement of config and processes it end-to-end
+
+    Must run in a fresh process because the components are registered only once per process.
+
+    Returns:
+        dict with the configuration and the results
+    """
+    os.environ['env'] = 'testing'
+    os.makedirs(config.work_dir, exist_ok=True)
+    measurement = SyntheticMeasurement(
+        config.work_dir,
+        num_times=config.num_times,
+        num_levels=config.num_levels,
+        wavelengths=config.wavelengths,
+    )
+
+    register_config(args=None)
+    cfg = component.queryUtility(ICfg)
+    cfg.set('SIGNAL_PATH', measurement.signal_path)
+    cfg.set('PRODUCT_PATH', config.work_dir)
+    cfg.set('LOG_PATH', config.work_dir)
+    cfg.set('log_level_console', 'WARNING')
+    cfg.set('MC_SEED', 1)
+    cfg.set('NUM_THREADS', config.num_threads)
+    cfg.set('PROFILE', True)
+
+    register_logger(measurement.meas_id)
+    measurement.generate()
+
+    register_db_func(measurement.connect_string)
+    register_datastorage()
+    register_params()
+    register_monte_carlo()
+    register_mc_pool()
+    register_profiler()
+    gen_sg_params()
+
+    return_code = Main().elda(Dict({'meas_id': measurement.meas_id}))
+
+    with open(component.queryUtility(IProfiler).file_name()) as infile:
+        profile = json.load(infile)
+
+    result = config.to_dict()
+    result.pop('work_dir')
+    result.update({
+        'key': configuration_key(config),
+        'num_channels': measurement.num_channels,
+        'return_code': return_code,
+        'results': collect_results(profile),
+    })
+    return result
+
+
+def benchmark_process(config):
+    """runs a configuration in a worker process. Exceptions are returned as error message
+    (not all ELDAmwl exceptions can be sent back to the main process)"""
+    try:
+        return run_configuration(config)
+    except BaseException:
+        return {'key': configuration_key(config), 'error': traceback.format_exc()}
+
+
+def run_benchmarks(configs):
+    """runs all configurations one after the other, each in a fresh process
+
+    A worker process which is killed (e.g. by the OOM killer of the OS) is reported as error.
+    """
+    context = multiprocessing.get_context('spawn')
+    results = []
+    for config in configs:
+        print('benchmark {}'.format(configuration_key(config)))  # noqa T001
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            try:
+                result = executor.submit(benchmark_process, config).result()
+            except BrokenProcessPool:
+                result = {'key': configuration_key(config),
+                          'error': 'the benchmark process terminated abruptly (out of memory?)'}
+        if 'error' in result:
+            print(result['error'])  # noqa T001
+        results.append(result)
+    return results
+
+
+def handle_args():
+    parser = argparse.ArgumentParser(description='benchmarks of ELDAmwl with synthetic measurements')
+
+    parser.add_argument('-t', dest='num_times', default=[2], type=int, nargs='+',
+                        help='numbers of time slices. default = 2')
+
+    parser.add_argument('-l', dest='num_levels', default=[None], type=int, nargs='+',
+                        help='numbers of levels. default = as in the template measurement')
+
+    parser.add_argument('-w', dest='wavelengths', default=[','.join(str(int(wl)) for wl in ALL_WAVELENGTHS)],
+                        type=str, nargs='+',
+                        help='comma separated lists of emission wavelengths (355, 532, 1064). default = all')
+
+    parser.add_argument('-n', dest='num_threads', default=1, type=int,
+                        help='number of threads of the retrievals (cfg.NUM_THREADS). default = 1')
+
+    parser.add_argument('-o', dest='out_file', default='benchmark.json', type=str,
+                        help='JSON file with the results. default = benchmark.json')
+
+    parser.add_argument('-d', dest='work_dir', default=None, type=str,
+                        help='directory for the synthetic measurements. default = a temporary directory')
+
+    return parser.parse_args()
+
+
+def run():
+    args = handle_args()
+
+    with tempfile.TemporaryDirectory(dir=args.work_dir) as work_dir:
+        configs = []
+        for num_times, num_levels, wavelengths in itertools.product(args.num_times,
+                                                                    args.num_levels,
+                                                                    args.wavelengths):
+            config = Dict({
+                'num_times': num_times,
+                'num_levels': num_levels,
+                'wavelengths': [float(wl) for wl in wavelengths.split(',')],
+                'num_threads': args.num_threads,
+            })
+            config.work_dir = os.path.join(work_dir, configuration_key(config))
+            configs.append(config)
+
+        results = run_benchmarks(configs)
+
+    with open(args.out_file, 'w') as outfile:
+        json.dump({
+            'eldamwl_version': ELDAmwl.__version__,
+            'created': datetime.datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'cpu_count': os.cpu_count(),
+            'configurations': results,
+        }, outfile, indent=1)
+
+
+if __name__ == '__main__':
+    run()
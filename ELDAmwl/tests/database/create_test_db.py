@@ -114,11 +114,23 @@ CSV_DATA_SOURCE = os.path.join(TEST_DB_PATH, 'csv_sources')
 class DBConstructor(object):
     """
     Construct a test DB from CSV files
+
+    Keyword Args:
+        db_filepath (str): file path of the sqlite DB. default = TEST_DB_FILEPATH
+        csv_source (str): directory of the csv source files. default = CSV_DATA_SOURCE
     """
 
-    def __init__(self):
+    def __init__(self, db_filepath=None, csv_source=None):
         self.logger = component.queryUtility(ILogger)
-        self.engine = DBUtils(TEST_CONNECT_STRING).engine
+        if db_filepath is None:
+            self.db_filepath = TEST_DB_FILEPATH
+            connect_string = TEST_CONNECT_STRING
+        else:
+            self.db_filepath = db_filepath
+            connect_string = 'sqlite+pysqlite:///' + db_filepath
+        self.csv_source = csv_source or CSV_DATA_SOURCE
+
+        self.engine = DBUtils(connect_string).engine
         self.session = sessionmaker(bind=self.engine)()
 
     def run(self):
@@ -129,7 +141,7 @@ class DBConstructor(object):
     def remove_db(self):
         """Remove the prior DB"""
         try:
-            os.remove(TEST_DB_FILEPATH)
+            os.remove(self.db_filepath)
         except FileNotFoundError:
             pass
 
@@ -155,7 +167,7 @@ class DBConstructor(object):
         Returns:
             The parsed csv file as a list of dictionaries
         """
-        file_name = os.path.join(CSV_DATA_SOURCE, table.__tablename__ + '.csv')
+        file_name = os.path.join(self.csv_source, table.__tablename__ + '.csv')
         try:
             csvfile = open(file_name)
         except FileNotFoundError:
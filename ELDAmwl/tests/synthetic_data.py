@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+"""synthetic measurements of configurable size for benchmarks
+
+The ELPP files and the test DB of the measurement 20181017oh00 are used as
+template. The profiles are repeated in time (with random noise according to their
+statistical errors) and interpolated onto a finer or coarser vertical grid.
+The products can be restricted to a subset of the emission wavelengths.
+"""
+from ELDAmwl.tests.database.create_test_db import CSV_DATA_SOURCE
+from ELDAmwl.tests.database.create_test_db import DBConstructor
+from ELDAmwl.utils.path_utils import abs_file_path
+
+import csv
+import netCDF4
+import numpy as np
+import os
+import shutil
+
+
+TEMPLATE_MEAS_ID = '20181017oh00'
+TEMPLATE_SIGNAL_PATH = 'data/ELPP_files'
+
+# products of the mwl product 598 of the template measurement {product id: emission wavelength}
+TEMPLATE_PRODUCTS = {
+    377: 355.,  # extinction
+    378: 355.,  # Raman backscatter
+    379: 355.,  # lidar ratio
+    383: 532.,  # Raman backscatter
+    637: 532.,  # VLDR
+    330: 1064.,  # elastic backscatter
+}
+
+ALL_WAVELENGTHS = sorted(set(TEMPLATE_PRODUCTS.values()))
+
+# db tables with rows of the template products
+PRODUCT_TABLES = ['mwlproduct_product', 'prepared_signal_files']
+
+SIGNAL = 'range_corrected_signal'
+SIGNAL_ERROR = 'range_corrected_signal_statistical_error'
+
+
+def resample_levels(values, num_levels, fill_value=None):
+    """interpolates values linearly along the last (level) axis onto num_levels equidistant levels
+
+    Integer values and values next to fill values are taken from the nearest level.
+    """
+    num_orig = values.shape[-1]
+    position = np.linspace(0, num_orig - 1, num_levels)
+    lower = np.floor(position).astype(int)
+    upper = np.minimum(lower + 1, num_orig - 1)
+    nearest = np.round(position).astype(int)
+
+    result = values[..., nearest]
+    if not np.issubdtype(values.dtype, np.floating):
+        return result
+
+    weight = position - lower
+    lower_values = values[..., lower]
+    upper_values = values[..., upper]
+    valid = np.isfinite(lower_values) & np.isfinite(upper_values)
+    if fill_value is not None:
+        valid &= (lower_values != fill_value) & (upper_values != fill_value)
+
+    interpolated = lower_values * (1 - weight) + upper_values * weight
+    return np.where(valid, interpolated, result)
+
+
+class SyntheticMeasurement(object):
+    """
+    ELPP files and test DB of a synthetic measurement
+
+    Args:
+        out_dir (str): directory in which the ELPP files (subdirectory ELPP_files)
+                and the DB (benchmarkDB.sqlite) are written
+
+    Keyword Args:
+        num_times (int): number of time slices. default = 2 (as template)
+        num_levels (int): number of levels. default = None (as template)
+        wavelengths (list): emission wavelengths of the products. default = all (355, 532, 1064 nm)
+        seed (int): seed of the random noise
+    """
+
+    meas_id = TEMPLATE_MEAS_ID
+
+    def __init__(self, out_dir, num_times=2, num_levels=None, wavelengths=None, seed=0):
+        self.out_dir = out_dir
+        self.num_times = num_times
+        self.num_levels = num_levels
+        self.wavelengths = [float(wl) for wl in (wavelengths or ALL_WAVELENGTHS)]
+        self.rng = np.random.default_rng(seed)
+        self.num_channels = 0
+
+    @property
+    def signal_path(self):
+        return os.path.join(self.out_dir, 'ELPP_files')
+
+    @property
+    def csv_source(self):
+        return os.path.join(self.out_dir, 'csv_sources')
+
+    @property
+    def db_filepath(self):
+        return os.path.join(self.out_dir, 'benchmarkDB.sqlite')
+
+    @property
+    def connect_string(self):
+        return 'sqlite+pysqlite:///' + self.db_filepath
+
+    @property
+    def product_ids(self):
+        return [prod_id for prod_id, wl in TEMPLATE_PRODUCTS.items() if wl in self.wavelengths]
+
+    def generate(self):
+        """writes ELPP files and DB"""
+        os.makedirs(self.signal_path, exist_ok=True)
+        os.makedirs(self.csv_source, exist_ok=True)
+
+        self.write_csv_sources()
+        for filename in self.elpp_filenames():
+            self.write_elpp_file(filename)
+
+        DBConstructor(db_filepath=self.db_filepath, csv_source=self.csv_source).run()
+
+    def keep_row(self, row):
+        """whether a row of the tables PRODUCT_TABLES belongs to the synthetic measurement"""
+        prod_id = int(row['_Product_ID'])
+        return (prod_id not in TEMPLATE_PRODUCTS) or (prod_id in self.product_ids)
+
+    def write_csv_sources(self):
+        for filename in os.listdir(CSV_DATA_SOURCE):
+            if not filename.endswith('.csv'):
+                continue
+            if filename[:-4] not in PRODUCT_TABLES:
+                shutil.copy(os.path.join(CSV_DATA_SOURCE, filename), self.csv_source)
+                continue
+
+            with open(os.path.join(CSV_DATA_SOURCE, filename)) as infile:
+                reader = csv.reader(infile, delimiter=',')
+                header = next(reader)
+                rows = [row for row in reader if self.keep_row(dict(zip(header, row)))]
+            with open(os.path.join(self.csv_source, filename), 'w', newline='') as outfile:
+                writer = csv.writer(outfile, delimiter=',', lineterminator='\n')
+                writer.writerow(header)
+                writer.writerows(rows)
+
+    def elpp_filenames(self):
+        """names of the existing template ELPP files of the selected products"""
+        template_path = abs_file_path(TEMPLATE_SIGNAL_PATH)
+        result = []
+        with open(os.path.join(self.csv_source, 'prepared_signal_files.csv')) as infile:
+            for row in csv.DictReader(infile, delimiter=','):
+                filename = row['filename']
+                if (row['__measurements__ID'] == self.meas_id) \
+                        and (int(row['_Product_ID']) in self.product_ids) \
+                        and os.path.exists(os.path.join(template_path, filename)) \
+                        and (filename not in result):
+                    result.append(filename)
+        return result
+
+    def resample(self, name, variable):
+        """the values of a template variable on the time and level grid of the synthetic measurement"""
+        values = variable[:]
+        fill_value = getattr(variable, '_FillValue', None)
+
+        if 'time' in variable.dimensions:
+            axis = variable.dimensions.index('time')
+            num_orig = values.shape[axis]
+            values = np.take(values, np.arange(self.num_times) % num_orig, axis=axis)
+
+        if ('level' in variable.dimensions) and (self.num_levels is not None):
+            values = resample_levels(values, self.num_levels, fill_value)
+
+        return values
+
+    def scale_in_time(self, data, template):
+        """time, shots, and signals of the shorter (or longer) time slices"""
+        time_bounds = template.variables['time_bounds'][:]
+        bounds = np.linspace(time_bounds[0, 0], time_bounds[-1, 1], self.num_times + 1)
+        data['time'] = bounds[:-1]
+        data['time_bounds'] = np.stack([bounds[:-1], bounds[1:]], axis=1)
+
+        factor = template.dimensions['time'].size / self.num_times
+        data['shots'] = np.maximum((data['shots'] * factor).astype(data['shots'].dtype), 1)
+
+        valid = np.isfinite(data[SIGNAL_ERROR]) & (np.abs(data[SIGNAL_ERROR]) < 1e30)
+        data[SIGNAL_ERROR] = np.where(valid, data[SIGNAL_ERROR] / np.sqrt(factor), data[SIGNAL_ERROR])
+        noise = self.rng.standard_normal(data[SIGNAL].shape) * data[SIGNAL_ERROR]
+        data[SIGNAL] = np.where(valid, data[SIGNAL] + noise, data[SIGNAL])
+
+    def write_elpp_file(self, filename):
+        template = netCDF4.Dataset(os.path.join(abs_file_path(TEMPLATE_SIGNAL_PATH), filename))
+        template.set_auto_maskandscale(False)
+
+        data = {name: self.resample(name, variable) for name, variable in template.variables.items()}
+        self.scale_in_time(data, template)
+        self.num_channels += template.dimensions['channel'].size
+
+        with netCDF4.Dataset(os.path.join(self.signal_path, filename), 'w') as nc_file:
+            nc_file.setncatts({attr: template.getncattr(attr) for attr in template.ncattrs()})
+            for name, dimension in template.dimensions.items():
+                if name == 'time':
+                    size = self.num_times
+                elif (name == 'level') and (self.num_levels is not None):
+                    size = self.num_levels
+                else:
+                    size = dimension.size
+                nc_file.createDimension(name, None if dimension.isunlimited() else size)
+
+            for name, variable in template.variables.items():
+                attrs = {attr: variable.getncattr(attr) for attr in variable.ncattrs() if attr != '_FillValue'}
+                new_var = nc_file.createVariable(name, variable.datatype, variable.dimensions,
+                                                 fill_value=getattr(variable, '_FillValue', None))
+                new_var.set_auto_maskandscale(False)
+                new_var.setncatts(attrs)
+                new_var[:] = data[name]
+
+        template.close()
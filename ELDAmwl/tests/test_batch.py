@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""Tests for the batch processing of many measurements"""
+from ELDAmwl.errors.error_codes import UNKNOWN_EXCEPTION
+from ELDAmwl.utils.constants import EXIT_CODE_NONE
+from ELDAmwl.utils.constants import EXIT_CODE_OK
+from ELDAmwl.utils.constants import MWL_PROD_ID_DEFAULT
+from unittest.mock import call
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+import pytest
+
+
+# the retrieval modules need the rayleigh_fit package (path dependency, see pyproject.toml)
+pytest.importorskip('rayleigh_fit')
+
+from ELDAmwl.batch import BatchMain  # noqa E402
+
+
+def test_run_serial():
+    events = []
+    logger = MagicMock()
+    logger.set_measurement_id.side_effect = lambda meas_id: events.append(('log', meas_id))
+    db_func = MagicMock()
+
+    def reset():
+        events.append(('reset', None))
+
+    def elda(arg_dict):
+        # the log messages of the measurement go into its own log file
+        assert logger.set_measurement_id.call_args == call(arg_dict.meas_id)
+        events.append(('elda', arg_dict.meas_id))
+        if arg_dict.meas_id == 'meas_1':
+            raise ValueError('broken measurement')
+        return EXIT_CODE_OK
+
+    main = BatchMain()
+    with patch.object(BatchMain, 'logger', logger), \
+            patch('ELDAmwl.batch.register_datastorage', side_effect=reset), \
+            patch('ELDAmwl.batch.register_params'), \
+            patch('ELDAmwl.batch.component.queryUtility', return_value=db_func), \
+            patch.object(main, 'elda', side_effect=elda):
+        results = list(main.run_serial(['meas_1', 'meas_2']))
+
+    assert results == [('meas_1', EXIT_CODE_NONE), ('meas_2', EXIT_CODE_OK)]
+    assert events == [('reset', None), ('log', 'meas_1'), ('elda', 'meas_1'),
+                      ('reset', None), ('log', 'meas_2'), ('elda', 'meas_2')]
+
+    # the status of the failed measurement is written into the db
+    db_func.write_product_status_in_db.assert_called_once_with(
+        'meas_1', MWL_PROD_ID_DEFAULT, None, UNKNOWN_EXCEPTION, 'broken measurement')
+    # the config cache of the first measurement is not used for the second one
+    assert db_func.config_cache is None
+    assert db_func.session.rollback.call_count >= 2
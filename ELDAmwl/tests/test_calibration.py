@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""Tests for the search of backscatter calibration windows with Rayleigh fits"""
+from addict import Dict
+from ELDAmwl.utils.numerical import km_to_m
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+import pytest
+import time
+
+
+# the calibration module needs the rayleigh_fit package (path dependency, see pyproject.toml)
+pytest.importorskip('rayleigh_fit')
+
+from ELDAmwl.backscatter.common.calibration.operation import FindBscCalibrWindowWithRaylFit  # noqa E402
+
+
+RANGES = np.arange(3., 8., 0.25)
+
+
+def fit_result(rng, bins):
+    """valid fit results (like the output of rayleigh_fit_time_slice) at the range bins bins"""
+    return pd.DataFrame({'range': RANGES[bins], 'Comb': rng.random(len(bins))}, index=bins)
+
+
+def example_window_search():
+    """2 channels, 3 time slices, 2 window widths (the default one is 1 km)
+
+    time slice 0: common valid ranges for the default window width
+    time slice 1: common valid ranges only for the window width 0.5 km
+    time slice 2: no common valid ranges
+    """
+    rng = np.random.default_rng(3)
+    op = FindBscCalibrWindowWithRaylFit()
+    op.channels = ['ch_a', 'ch_b']
+    op.bad_channels = []
+    op.window_widths = [0.5, 1.]
+    op.window_width_default = 1.
+    op.time_dim = 3
+
+    valid_bins = {
+        1.: {'ch_a': [[2, 3, 4, 5, 6, 7], [1, 2], [0, 1]],
+             'ch_b': [[4, 5, 6, 7, 8, 9], [5, 6], [2]]},
+        0.5: {'ch_a': [[3, 4, 5], [2, 3, 4, 5, 6], [3]],
+              'ch_b': [[1, 2], [4, 5, 6, 7], [4]]},
+    }
+    op.all_results = Dict()
+    for w, channels in valid_bins.items():
+        for channel, bins in channels.items():
+            for t in range(op.time_dim):
+                op.all_results[w][channel][t] = fit_result(rng, np.array(bins[t]))
+    return op
+
+
+def old_find_best_compromise(op):
+    """the former loop over time slices (reference for the vectorized version)"""
+    win_center_ranges = np.ones(op.time_dim) * np.nan
+    win_widths = np.ones(op.time_dim) * np.nan
+
+    use_channels = op.channels
+    first_chan = use_channels[0]
+
+    for t in range(op.time_dim):
+        wwidth = op.window_width_default
+        valid_heights = set(op.all_results[wwidth][first_chan][t].range)
+        for channel in use_channels[1:]:
+            valid_heights.intersection_update(set(op.all_results[wwidth][channel][t].range))
+
+        w = 0
+        while (len(valid_heights) == 0) and w < len(op.window_widths):
+            wwidth = op.window_widths[w]
+            valid_heights = set(op.all_results[wwidth][first_chan][t].range)
+            for channel in use_channels[1:]:
+                valid_heights.intersection_update(set(op.all_results[wwidth][channel][t].range))
+            w += 1
+
+        if len(valid_heights) > 0:
+            valid_data = []
+            for channel in op.channels:
+                df = op.all_results[wwidth][channel][t]
+                valid_data.append(df[df['range'].isin(list(valid_heights))]['Comb'])
+
+            best_idx = pd.concat(valid_data, axis=1, keys=op.channels).mean(axis=1).idxmin()
+            win_center_ranges[t] = km_to_m(float(df[df.index == best_idx]['range'].iloc[0]))
+            win_widths[t] = km_to_m(wwidth)
+
+    return win_center_ranges, win_widths
+
+
+def test_find_best_compromise():
+    op = example_window_search()
+
+    with patch.object(FindBscCalibrWindowWithRaylFit, 'logger', MagicMock()):
+        win_center_ranges, win_widths = op.find_best_compromise()
+
+    old_center_ranges, old_widths = old_find_best_compromise(op)
+
+    np.testing.assert_array_equal(win_center_ranges, old_center_ranges)
+    np.testing.assert_array_equal(win_widths, old_widths)
+    np.testing.assert_array_equal(win_widths, [1000., 500., np.nan])
+
+
+def fake_rayleigh_fit(task):
+    # the first tasks are finished last
+    time.sleep(0.02 * (5 - task.input_data.t))
+    return {w: task.input_data.t * 10 + w for w in task.window_widths}
+
+
+@pytest.mark.parametrize('parallel', [True, False])
+def test_run_rayl_fits_order(parallel):
+    tasks = [Dict({'input_data': {'t': t}, 'window_widths': [1, 2]}) for t in range(5)]
+    cfg = Dict({'PARALLEL': parallel, 'NUM_CPU': 3})
+
+    with patch('ELDAmwl.backscatter.common.calibration.operation.rayleigh_fit_time_slice', fake_rayleigh_fit), \
+            patch.object(FindBscCalibrWindowWithRaylFit, 'cfg', cfg):
+        results = FindBscCalibrWindowWithRaylFit().run_rayl_fits(tasks)
+
+    assert results == [{1: t * 10 + 1, 2: t * 10 + 2} for t in range(5)]
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+"""Tests for the compilation of the mwl product matrices"""
+from addict import Dict
+from ELDAmwl.elda_mwl.compile_mwl_product import GetProductMatrixDefault
+from ELDAmwl.utils.constants import EXT
+from ELDAmwl.utils.constants import HIGHRES
+from ELDAmwl.utils.constants import LOWRES
+from ELDAmwl.utils.constants import RBSC
+from unittest.mock import MagicMock
+
+import numpy as np
+
+
+def example_param(resolutions):
+    param = MagicMock()
+    param.calc_with_res.side_effect = lambda res: res in resolutions
+    return param
+
+
+def test_qc():
+    ext = example_param([LOWRES])
+    bsc = example_param([LOWRES, HIGHRES])
+    product_params = MagicMock()
+    product_params.all_products_of_type.side_effect = lambda ptype, res: {EXT: [ext], RBSC: [bsc]}[ptype]
+
+    op = GetProductMatrixDefault(product_params=product_params)
+    op.product_params = product_params
+    op.p_types = Dict({LOWRES: [RBSC, EXT], HIGHRES: [RBSC]})
+    # the extinction matrix is empty, the backscatter matrix only in high resolution
+    op.empty_entries = Dict({
+        LOWRES: Dict({'products': np.array([False, True]), 'wavelengths': np.array([False, True])}),
+        HIGHRES: Dict({'products': np.array([True]), 'wavelengths': np.array([True])}),
+    })
+
+    op.qc()
+
+    assert op.empty_products == {LOWRES: [EXT], HIGHRES: [RBSC]}
+    assert op.failed_products == {LOWRES: [ext], HIGHRES: [bsc]}
+    np.testing.assert_array_equal(op.empty_wavelengths[LOWRES], [False, True])
+    ext.mark_as_failed.assert_called_once_with(product_params)
+    bsc.mark_as_failed.assert_not_called()
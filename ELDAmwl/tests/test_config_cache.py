@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""Tests for the snapshot of the configuration tables"""
+from addict import Dict
+from ELDAmwl.database.db_functions import DBFunc
+from ELDAmwl.database.tables.lidar_ratio import ExtBscOption
+from ELDAmwl.tests.database.create_test_db import DBConstructor
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+import os
+import pytest
+
+
+MWL_PRODUCT_ID = 598
+
+# lookups of the products of the mwl product MWL_PRODUCT_ID
+LOOKUPS = [
+    ('read_ext_method_id', 377),
+    ('read_extinction_algorithm', 377),
+    ('read_ext_effbin_algorithm', 377),
+    ('read_ext_usedbin_algorithm', 377),
+    ('read_raman_bsc_method_id', 378),
+    ('read_raman_bsc_smooth_method_id', 378),
+    ('read_raman_bsc_algorithm', 383),
+    ('read_raman_bsc_effbin_algorithm', 383),
+    ('read_raman_bsc_usedbin_algorithm', 378),
+    ('read_raman_bsc_params', 378),
+    ('read_lidar_ratio_params', 379),
+    ('read_vldr_smooth_method_id', 637),
+    ('read_vldr_algorithm', 637),
+    ('read_vldr_effbin_algorithm', 637),
+    ('read_vldr_usedbin_algorithm', 637),
+    ('read_vldr_params', 637),
+    ('read_elast_bsc_method_id', 330),
+    ('read_elast_bsc_smooth_method_id', 330),
+    ('read_elast_bsc_algorithm', 330),
+    ('read_elast_bsc_effbin_algorithm', 330),
+    ('read_elast_bsc_usedbin_algorithm', 330),
+    ('read_elast_bsc_params', 330),
+]
+
+
+@pytest.fixture(scope='module')
+def db_func(tmp_path_factory):
+    db_filepath = os.path.join(str(tmp_path_factory.mktemp('db')), 'testDB.sqlite')
+    constructor = DBConstructor(db_filepath=db_filepath)
+    constructor.logger = MagicMock()
+    constructor.run()
+
+    with patch.object(DBFunc, 'logger', MagicMock()):
+        yield DBFunc('sqlite+pysqlite:///' + db_filepath)
+
+
+def test_cached_lookups_match_db(db_func):
+    db_func.config_cache = None
+    direct = [getattr(db_func, func)(prod_id) for func, prod_id in LOOKUPS]
+
+    db_func.preload_config(MWL_PRODUCT_ID)
+    try:
+        cached = [getattr(db_func, func)(prod_id) for func, prod_id in LOOKUPS]
+    finally:
+        db_func.config_cache = None
+
+    assert None not in direct
+    for (func, prod_id), direct_result, cached_result in zip(LOOKUPS, direct, cached):
+        assert cached_result == direct_result, func
+
+
+def test_lidar_ratio_params_type(db_func):
+    db_func.config_cache = None
+    direct = db_func.read_lidar_ratio_params(379)
+
+    db_func.preload_config(MWL_PRODUCT_ID)
+    try:
+        assert db_func.config_cache.option_rows(ExtBscOption, 379) is not None
+        cached = db_func.read_lidar_ratio_params(379)
+    finally:
+        db_func.config_cache = None
+
+    assert isinstance(direct, Dict) and isinstance(cached, Dict)
+    assert cached.extinction_options_product_id == 377
+    assert cached.raman_backscatter_options_product_id == 378
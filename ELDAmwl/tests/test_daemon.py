@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""Tests for the ELDAmwl service"""
+from addict import Dict
+from ELDAmwl.utils.constants import EXIT_CODE_NONE
+from ELDAmwl.utils.constants import EXIT_CODE_OK
+from ELDAmwl.utils.job_queue import DirectoryJobQueue
+from unittest.mock import call
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+import os
+import pytest
+import threading
+
+
+# the retrieval modules need the rayleigh_fit package (path dependency, see pyproject.toml)
+pytest.importorskip('rayleigh_fit')
+
+from ELDAmwl.daemon import WorkerDaemon  # noqa E402
+
+
+def test_worker_daemon_work(tmp_path):
+    queue = DirectoryJobQueue(str(tmp_path))
+    for meas_id in ['meas_ok', 'meas_failing', 'meas_broken']:
+        queue.submit(meas_id)
+
+    def elda(arg_dict):
+        # the job is claimed by this process while it is processed
+        assert queue.read_owner(arg_dict.meas_id) == queue.owner()
+        if arg_dict.meas_id == 'meas_broken':
+            raise ValueError('broken measurement')
+        if arg_dict.meas_id == 'meas_failing':
+            return EXIT_CODE_NONE
+        return EXIT_CODE_OK
+
+    logger = MagicMock()
+    daemon = WorkerDaemon()
+    daemon.stop_event = threading.Event()
+    with patch.object(WorkerDaemon, 'logger', logger), \
+            patch('ELDAmwl.batch.register_datastorage'), \
+            patch('ELDAmwl.batch.register_params'), \
+            patch('ELDAmwl.batch.component.queryUtility', return_value=MagicMock()), \
+            patch.object(daemon, 'elda', side_effect=elda):
+        daemon.work(queue, Dict({'exit_when_empty': True, 'poll_interval': 0.}))
+
+    assert queue.pending() == []
+    assert os.listdir(queue.path(queue.PROCESSING)) == []
+    assert os.listdir(queue.path(queue.DONE)) == ['meas_ok']
+    assert sorted(os.listdir(queue.path(queue.FAILED))) == ['meas_broken', 'meas_failing']
+    for sub_dir, meas_id, return_code in [(queue.DONE, 'meas_ok', EXIT_CODE_OK),
+                                          (queue.FAILED, 'meas_failing', EXIT_CODE_NONE),
+                                          (queue.FAILED, 'meas_broken', EXIT_CODE_NONE)]:
+        with open(queue.path(sub_dir, meas_id)) as job_file:
+            assert job_file.read().strip() == str(return_code)
+        logger.info.assert_any_call('measurement {} finished with return code {}'.format(meas_id, return_code))
+
+    assert call('meas_broken') in logger.set_measurement_id.call_args_list
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""Tests for DataStorage"""
+from addict import Dict
+from ELDAmwl.bases.base import Params
+from ELDAmwl.signals import Signals
+from ELDAmwl.storage.data_storage import DataStorage
+
+import numpy as np
+import os
+import pytest
+import xarray as xr
+
+
+# Where are the python files for testing
+TEST_FILE_PATH = os.path.split(__file__)[0]
+
+# test file 1 for intermediate nc file
+TEST_INTERMEDIATE_FILE_1 = os.path.join(
+    TEST_FILE_PATH,
+    'data',
+    'hpb_000_0000378_201810172100_201810172300_20181017oh00_elpp_v5.1.2.nc',
+)
+
+
+@pytest.fixture
+def storage_with_signal():
+    sig = Signals.from_nc_file(xr.open_dataset(TEST_INTERMEDIATE_FILE_1), 0)
+    sig.ds.load()
+    storage = DataStorage()
+    storage.set_prepared_signal('378', sig)
+    return storage, sig
+
+
+def test_getters_return_deepcopies_by_default(storage_with_signal):
+    storage, sig = storage_with_signal
+    copy = storage.prepared_signal('378', sig.channel_id_str)
+
+    copy.ds['data'][:] = 0
+    assert not np.shares_memory(copy.ds.data.values, sig.ds.data.values)
+    assert not np.all(sig.ds.data.values == 0)
+
+
+def test_borrow_returns_read_only_views(storage_with_signal):
+    storage, sig = storage_with_signal
+    orig_data = sig.ds.data.values.copy()
+
+    with storage.borrow():
+        view = storage.prepared_signal('378', sig.channel_id_str)
+    assert np.shares_memory(view.ds.data.values, sig.ds.data.values)
+
+    # writing into the shared memory is not allowed
+    with pytest.raises(ValueError):
+        view.ds['data'][0, 0] = 0
+
+    # copy-on-write: assigning new variables does not change the storage
+    view.ds['data'] = view.ds.data * 2
+    np.testing.assert_array_equal(sig.ds.data.values, orig_data)
+
+    # a checked out copy is writeable again
+    writeable = storage.checkout(view)
+    writeable.ds['err'][:] = 0
+    assert not np.all(sig.ds.err.values == 0)
+
+    # outside of the borrow context, the getters return deepcopies again
+    copy = storage.prepared_signal('378', sig.channel_id_str)
+    assert not np.shares_memory(copy.ds.data.values, sig.ds.data.values)
+
+
+def test_borrowed_nested_attributes(storage_with_signal):
+    storage, sig = storage_with_signal
+    sig.params = Params()
+    sig.params.vert_res = Dict(lowres=Dict(min=100., max=500.))
+    sig.meta_data = Dict(source='elpp', channels=[1, 2])
+    g_value = sig.g.value
+
+    with storage.borrow():
+        view = storage.prepared_signal('378', sig.channel_id_str)
+
+    # assigning nested attributes of the view does not change the storage
+    view.params.vert_res.lowres.min = 0.
+    view.params.vert_res.highres = 10.
+    view.meta_data.source = 'view'
+    view.meta_data.channels.append(3)
+    view.g.data['value'] = view.g.data.value * 2
+
+    assert sig.params.vert_res == Dict(lowres=Dict(min=100., max=500.))
+    assert sig.meta_data == Dict(source='elpp', channels=[1, 2])
+    assert sig.g.value == g_value
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""Tests for the Klett-Fernald retrieval of elastic backscatter profiles"""
+from addict import Dict
+from copy import deepcopy
+from ELDAmwl.backscatter.elastic.tools.operation import CalcBscProfileKF
+from ELDAmwl.bases.base import DataPoint
+from ELDAmwl.utils.constants import ABOVE_KLETT_REF
+from ELDAmwl.utils.constants import NC_FILL_INT
+from ELDAmwl.utils.constants import RAYL_LR
+from ELDAmwl.utils.numerical import closest_bin
+from ELDAmwl.utils.numerical import integral_profile
+from numpy.testing import assert_allclose
+from numpy.testing import assert_array_equal
+
+import numpy as np
+import xarray as xr
+
+
+NUM_LEVELS = 60
+
+
+def example_elast_signal():
+    """synthetic elastic signals of 5 time slices with aerosol below level 30
+
+    Returns:
+        elast_sig (xr.Dataset), range_axis (xr.DataArray), calibration (addict.Dict)
+    """
+    rng = np.random.default_rng(3)
+    num_times = 5
+    ranges = np.tile(np.arange(NUM_LEVELS) * 15. + 7.5, (num_times, 1))
+    dr = 15.
+
+    mol_bsc = 1.5e-6 * np.exp(-ranges / 8000.)
+    part_bsc = np.where(np.arange(NUM_LEVELS) < 30, 2e-6, 0.) * np.linspace(0.5, 1.5, num_times)[:, np.newaxis]
+    lidar_ratio = np.full(ranges.shape, 50.)
+    extinction = lidar_ratio * part_bsc + RAYL_LR * mol_bsc
+    transmission = np.exp(-2 * np.cumsum(extinction, axis=1) * dr)
+    data = 1e10 * (mol_bsc + part_bsc) * transmission
+    data *= 1 + rng.normal(scale=0.002, size=data.shape)
+
+    # nan within the calibration window (the first nan bin is taken as calibration bin)
+    data[1, 47] = np.nan
+    # nan within the backward and the forward integration ranges
+    data[3, 10:13] = np.nan
+    data[3, 55] = np.nan
+
+    dims = ['time', 'level']
+    elast_sig = xr.Dataset(
+        data_vars=dict(
+            data=(dims, data),
+            err=(dims, data * 0.002),
+            qf=(dims, np.zeros(data.shape, dtype=int)),
+            binres=(dims, np.ones(data.shape, dtype=int)),
+            mol_backscatter=(dims, mol_bsc),
+            assumed_particle_lidar_ratio=(dims, lidar_ratio),
+            altitude=(dims, ranges),
+        ),
+        coords=dict(time=np.arange(num_times)))
+    elast_sig['emission_wavelength'] = 532.
+
+    calibration = Dict({'cal_first_lev': np.array([45, 45, NC_FILL_INT, 40, 20]),
+                        'cal_last_lev': np.array([55, 55, NC_FILL_INT, 50, 28]),
+                        'calibr_value': DataPoint.from_data(1.2, 0.06, 0)})
+
+    return elast_sig, elast_sig.altitude, calibration
+
+
+def old_calc_bsc_profile_kf(elast_sig, range_axis, error_params, calibration):
+    """the former loop over time slices (reference for the vectorized version)"""
+    rayl_bsc = elast_sig.mol_backscatter
+    num_times = elast_sig.dims['time']
+    lidar_ratio = elast_sig.assumed_particle_lidar_ratio
+    lr_diff = lidar_ratio - RAYL_LR
+
+    calibr_factor = np.ones(num_times) * np.nan
+    calibr_bin = np.ones(num_times, dtype=int) * NC_FILL_INT
+    calibr_factor_err = np.ones(num_times) * np.nan
+    M = np.full(rayl_bsc.shape, np.nan)
+    A = np.full(rayl_bsc.shape, np.nan)
+    A_int = np.full(rayl_bsc.shape, np.nan)
+    B = np.full(rayl_bsc.shape, np.nan)
+    B_err = np.full(rayl_bsc.shape, np.nan)
+
+    for t in range(num_times):
+        if calibration['cal_first_lev'][t] == NC_FILL_INT:
+            continue
+
+        window = {'level': range(calibration['cal_first_lev'][t], calibration['cal_last_lev'][t] + 1),
+                  'time': t}
+        df_sig = elast_sig.data.isel(window).to_dataframe()
+        mean_sig = df_sig.data.mean()
+        rel_sem_sig = df_sig.data.sem() / mean_sig
+        mean_rayl_bsc = rayl_bsc.isel(window).to_dataframe().mol_backscatter.mean()
+        assert rel_sem_sig <= error_params.err_threshold.highrange
+
+        calibr_factor[t] = mean_sig / mean_rayl_bsc / calibration.calibr_value.value
+        calibr_factor_err[t] = calibr_factor[t] * \
+            np.sqrt(np.square(rel_sem_sig) + np.square(calibration.calibr_value.rel_error))
+
+        cb = closest_bin(elast_sig.data[t].values,
+                         first_bin=calibration['cal_first_lev'][t],
+                         last_bin=calibration['cal_last_lev'][t] + 1)
+        calibr_bin[t] = cb
+
+        M[t, cb:] = integral_profile(rayl_bsc[t].values, range_axis=range_axis[t].values, first_bin=cb)
+        M[t, :cb + 1] = integral_profile(rayl_bsc[t].values, range_axis=range_axis[t].values,
+                                         first_bin=cb, last_bin=0)
+        M[t, cb] = 0
+
+        A[t] = elast_sig.data[t] * np.exp(-2 * lr_diff[t] * M[t])
+        A_int[t, cb:] = integral_profile(A[t], range_axis=range_axis[t].values, first_bin=cb)
+        A_int[t, :cb + 1] = integral_profile(A[t], range_axis=range_axis[t].values, extrapolate_ovl_factor=1,
+                                             first_bin=cb, last_bin=0)
+        A_int[t, cb] = 0
+
+        B[t, :] = calibr_factor[t]
+        B_err[t, :] = calibr_factor_err[t]
+
+    denominator = B - 2 * lidar_ratio * A_int
+    bsc = xr.Dataset()
+    bsc['data'] = A / denominator - rayl_bsc
+    bsc['err'] = np.abs((A * denominator - np.square(A)) / np.power(denominator, 3) * B_err)
+    bsc['qf'] = elast_sig.qf
+    bsc['calibration_bin'] = xr.DataArray(calibr_bin, coords=[bsc.time], dims=['time'])
+    for t in range(num_times):
+        bsc['qf'][t][calibr_bin[t]:-1] = bsc['qf'][t][calibr_bin[t]:-1] | ABOVE_KLETT_REF
+    return bsc
+
+
+def test_calc_bsc_profile_kf_equals_loop():
+    elast_sig, range_axis, calibration = example_elast_signal()
+    error_params = Dict({'err_threshold': Dict({'lowrange': 0.1, 'highrange': 0.1})})
+
+    bsc = CalcBscProfileKF().run(elast_sig=deepcopy(elast_sig),
+                                 range_axis=range_axis,
+                                 error_params=error_params,
+                                 calibration=calibration)
+    old_bsc = old_calc_bsc_profile_kf(deepcopy(elast_sig), range_axis, error_params, calibration)
+
+    assert_array_equal(bsc.calibration_bin.values, old_bsc.calibration_bin.values)
+    assert bsc.calibration_bin.values[1] == 47
+    assert bsc.calibration_bin.values[2] == NC_FILL_INT
+
+    assert_allclose(bsc.data.values, old_bsc.data.values, rtol=1e-10, atol=1e-16)
+    assert_allclose(bsc.err.values, old_bsc.err.values, rtol=1e-10, atol=1e-16)
+    assert_array_equal(bsc.qf.values, old_bsc.qf.values)
+
+    # the uncalibrated time slice stays empty, the other ones have valid data
+    # below and above the calibration bin
+    assert np.all(np.isnan(bsc.data.values[2]))
+    for t in [0, 4]:
+        cb = bsc.calibration_bin.values[t]
+        assert not np.any(np.isnan(bsc.data.values[t, :cb]))
+        assert not np.any(np.isnan(bsc.data.values[t, cb + 1:]))
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""Tests for the job queue of the ELDAmwl service"""
+from ELDAmwl.utils.constants import EXIT_CODE_NONE
+from ELDAmwl.utils.constants import EXIT_CODE_OK
+from ELDAmwl.utils.job_queue import DirectoryJobQueue
+
+import os
+import socket
+import subprocess
+import sys
+
+
+def dead_pid():
+    """pid of a finished process"""
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
+
+
+def test_directory_job_queue(tmp_path):
+    queue = DirectoryJobQueue(str(tmp_path))
+    queue.submit('20181017oh00')
+    os.utime(queue.path(queue.NEW, '20181017oh00'), (1, 1))
+    queue.submit('20181017oh01')
+
+    # the oldest job first
+    assert queue.pending() == ['20181017oh00', '20181017oh01']
+    assert queue.claim() == '20181017oh00'
+    assert queue.pending() == ['20181017oh01']
+
+    # the claimed job belongs to this (running) process and keeps its submission time
+    assert os.stat(queue.path(queue.PROCESSING, '20181017oh00')).st_mtime == 1
+    assert queue.read_owner('20181017oh00') == queue.owner()
+    assert queue.requeue_unfinished() == []
+
+    # unfinished jobs of crashed owners are put back into the queue
+    with open(queue.path(queue.PROCESSING, '20181017oh00'), 'w') as job_file:
+        job_file.write('{} {}\n'.format(socket.gethostname(), dead_pid()))
+    os.utime(queue.path(queue.PROCESSING, '20181017oh00'), (1, 1))
+    assert queue.requeue_unfinished() == ['20181017oh00']
+    assert queue.claim() == '20181017oh00'
+    assert queue.claim() == '20181017oh01'
+    assert queue.claim() is None
+
+    queue.finish('20181017oh00', EXIT_CODE_OK)
+    queue.finish('20181017oh01', EXIT_CODE_NONE)
+    assert os.listdir(queue.path(queue.DONE)) == ['20181017oh00']
+    assert os.listdir(queue.path(queue.FAILED)) == ['20181017oh01']
+    with open(queue.path(queue.FAILED, '20181017oh01')) as job_file:
+        assert job_file.read().strip() == str(EXIT_CODE_NONE)
+
+
+def test_requeue_owners(tmp_path):
+    queue = DirectoryJobQueue(str(tmp_path))
+    owners = {'meas_alive': queue.owner(),
+              'meas_dead': '{} {}'.format(socket.gethostname(), dead_pid()),
+              'meas_other_host': 'other.host 1',
+              'meas_unknown': ''}
+    for meas_id, owner in owners.items():
+        with open(queue.path(queue.PROCESSING, meas_id), 'w') as job_file:
+            job_file.write(owner)
+
+    assert queue.requeue_unfinished() == ['meas_dead', 'meas_unknown']
+    assert sorted(os.listdir(queue.path(queue.PROCESSING))) == ['meas_alive', 'meas_other_host']
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""Tests for the buffered db logger"""
+from ELDAmwl.log.log import BufferedDBLogWriter
+from ELDAmwl.log.log import SYSLOG_INFO
+
+import datetime
+import logging
+import time
+
+
+def test_buffered_db_log_writer():
+    batches = []
+    writer = BufferedDBLogWriter(batches.append, logging.getLogger('test'),
+                                 buffer_size=3, flush_interval=60)
+
+    now = datetime.datetime.now()
+    for n in range(7):
+        writer(SYSLOG_INFO, now, '20181017oh00', None, '1.0', 'message {}'.format(n))
+
+    # the size threshold is reached twice, the last message waits for the flush interval
+    for _ in range(500):
+        if sum(len(b) for b in batches) >= 6:
+            break
+        time.sleep(0.01)
+    assert [len(b) for b in batches] == [3, 3]
+
+    writer.close()
+    assert [len(b) for b in batches] == [3, 3, 1]
+    assert batches[2][0]['message'] == 'message 6'
+    assert batches[0][0]['measurements_id'] == '20181017oh00'
+
+    # messages after closing are not written
+    writer(SYSLOG_INFO, now, '20181017oh00', None, '1.0', 'late message')
+    assert sum(len(b) for b in batches) == 7
+
+
+def test_buffered_db_log_writer_flush_interval():
+    batches = []
+    writer = BufferedDBLogWriter(batches.append, logging.getLogger('test'),
+                                 buffer_size=100, flush_interval=0.01)
+
+    writer(SYSLOG_INFO, datetime.datetime.now(), '20181017oh00', None, '1.0', 'message')
+    writer.flush()
+    assert [len(b) for b in batches] == [1]
+
+    writer.close()
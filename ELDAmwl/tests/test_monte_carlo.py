@@ -0,0 +1,288 @@
+# -*- coding: utf-8 -*-
+"""Tests for Monte-Carlo sample generation"""
+from addict import Dict
+from ELDAmwl.backscatter.raman.operation import CalcRamanBackscatterDefault
+from ELDAmwl.backscatter.raman.tools.operation import CalcRamanBscProfileViaBR
+from ELDAmwl.bases.columns import Columns
+from ELDAmwl.errors.exceptions import NotEnoughMCSamples
+from ELDAmwl.extinction.operation import CalcExtinctionDefault
+from ELDAmwl.extinction.tools.operation import LinFit
+from ELDAmwl.extinction.tools.operation import SlopeToExtinctionDefault
+from ELDAmwl.monte_carlo.operation import CreateMCCopiesDefault
+from ELDAmwl.monte_carlo.operation import MonteCarlo
+from ELDAmwl.monte_carlo.operation import MonteCarloExtAdapter
+from ELDAmwl.monte_carlo.operation import MonteCarloRamanBscAdapter
+from ELDAmwl.monte_carlo.operation import register_monte_carlo
+from ELDAmwl.monte_carlo.parallel_funcs import dumps_to_shared_memory
+from ELDAmwl.monte_carlo.parallel_funcs import from_shared_memory
+from ELDAmwl.monte_carlo.parallel_funcs import loads_from_shared_memory
+from ELDAmwl.monte_carlo.parallel_funcs import run_mc_chunk
+from ELDAmwl.monte_carlo.parallel_funcs import to_shared_memory
+from ELDAmwl.products import Products
+from ELDAmwl.storage.data_storage import DataStorage
+from ELDAmwl.utils.constants import RAYL_LR
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+import numpy as np
+import pickle
+import pytest
+import xarray as xr
+
+
+def example_columns():
+    col = Columns()
+    data = np.linspace(1., 2., 20).reshape(2, 10)
+    err = np.full((2, 10), 0.1)
+    data[0, :3] = np.nan
+    err[1, 9] = np.nan
+    col.ds = xr.Dataset(
+        data_vars=dict(
+            data=(['time', 'level'], data),
+            err=(['time', 'level'], err),
+        ))
+    return col
+
+
+def test_create_mc_copies():
+    col = example_columns()
+
+    samples = CreateMCCopiesDefault(original=col, n=500,
+                                    rng=np.random.default_rng(1)).run()
+
+    assert samples.shape == (500, 2, 10)
+    invalid = np.isnan(col.data.values) | np.isnan(col.err.values)
+    assert np.all(np.isnan(samples[:, invalid]))
+    assert not np.any(np.isnan(samples[:, ~invalid]))
+    np.testing.assert_allclose(samples[:, ~invalid].std(axis=0), 0.1, rtol=0.15)
+
+
+def test_create_mc_copies_seeded():
+    col = example_columns()
+
+    first = CreateMCCopiesDefault(original=col, n=5, rng=np.random.default_rng(7)).run()
+    second = CreateMCCopiesDefault(original=col, n=5, rng=np.random.default_rng(7)).run()
+
+    np.testing.assert_array_equal(first, second)
+
+
+def test_shared_memory_roundtrip():
+    samples = np.random.default_rng(3).normal(size=(4, 2, 10))
+    shm, spec = to_shared_memory(samples)
+    try:
+        attached, shared = from_shared_memory(spec)
+        np.testing.assert_array_equal(shared, samples)
+        shared[0, 0, 0] = 42.
+        del shared
+        attached.close()
+
+        attached, shared = from_shared_memory(spec)
+        assert shared[0, 0, 0] == 42.
+        del shared
+        attached.close()
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+class ExampleSignal(Columns):
+    """minimal signal with the attributes used by the extinction and Raman backscatter retrievals"""
+
+    detection_wavelength = 387.
+    emission_wavelength = 355.
+    profile_qf = 0
+
+    @property
+    def range(self):
+        return self.height
+
+    def heights_to_levels(self, heights):
+        return abs(self.height - heights).argmin(dim='level')
+
+
+def example_signal(data, err):
+    sig = ExampleSignal()
+    times, levels = data.shape
+    height = np.tile(np.arange(levels) * 60. + 500., (times, 1))
+    sig.ds = xr.Dataset(
+        data_vars=dict(
+            data=(['time', 'level'], data),
+            err=(['time', 'level'], err),
+            qf=(['time', 'level'], np.zeros(data.shape, dtype=np.int8)),
+            binres=(['time', 'level'], np.full(data.shape, 7)),
+            height=(['time', 'level'], height),
+            mol_extinction=(['time', 'level'], np.full(data.shape, 1.e-5)),
+            mol_backscatter=(['time', 'level'], np.full(data.shape, 1.e-5 / RAYL_LR)),
+        ))
+    return sig
+
+
+def empty_result(sig):
+    result = Products()
+    result.ds = xr.Dataset(
+        data_vars=dict(
+            data=(['time', 'level'], np.full(sig.data.shape, np.nan)),
+            err=(['time', 'level'], np.full(sig.data.shape, np.nan)),
+            qf=(['time', 'level'], np.zeros(sig.data.shape, dtype=np.int8)),
+            binres=(['time', 'level'], np.zeros(sig.data.shape, dtype=int)),
+        ))
+    return result
+
+
+def example_extinction_op():
+    height = np.arange(40) * 60. + 500.
+    data = np.tile(3. - 2.e-4 * height, (2, 1))
+    sig = example_signal(data, np.full(data.shape, 0.02))
+
+    return CalcExtinctionDefault(
+        raman_signal=sig,
+        ext_params=Dict({'ang_exp_asDataArray': 1.}),
+        slope_routine=LinFit(weight=True),
+        slope_to_ext_routine=SlopeToExtinctionDefault,
+        empty_ext=empty_result(sig),
+    )
+
+
+def example_raman_bsc_op(calibr_err=0.01):
+    data = np.tile(np.linspace(2., 1., 40), (2, 1))
+    err = np.full(data.shape, 0.01)
+    data[:, 30:] = 1.
+    err[:, 30:] = calibr_err
+    sig = example_signal(data, err)
+
+    return CalcRamanBackscatterDefault(
+        signal_ratio=sig,
+        calibr_window=xr.DataArray([[2300., 2840.], [2300., 2840.]], dims=['time', 'nv']),
+        calc_routine=CalcRamanBscProfileViaBR(),
+        bsc_params=Dict({'calibration_params': {'cal_value': 1.},
+                         'quality_params': {'error_threshold': {'highrange': 0.05}},
+                         }),
+        empty_bsc=empty_result(sig),
+    )
+
+
+def mc_samples(adapter, vectorized):
+    """runs the Monte-Carlo retrieval of adapter with a fixed seed
+
+    Returns:
+        tuple (np.array (sample, time, level) with the sample results,
+        np.array (time, level) with the Monte-Carlo error)
+    """
+    register_monte_carlo()
+    cfg = MagicMock(PARALLEL=False)
+    cfg.get.side_effect = {'MC_SEED': 11, 'MC_VECTORIZED': vectorized}.get
+    with patch.object(MonteCarlo, 'cfg', cfg), \
+            patch.object(MonteCarlo, 'logger', MagicMock()):
+        mc_error = adapter(Dict({'nb_of_iterations': 30}))
+    return np.array(adapter.sample_results), mc_error
+
+
+@pytest.mark.parametrize('make_op, adapter_class', [
+    (example_extinction_op, MonteCarloExtAdapter),
+    (example_raman_bsc_op, MonteCarloRamanBscAdapter),
+])
+def test_mc_vectorized_equals_per_sample(make_op, adapter_class):
+    op = make_op()
+    op.run()
+
+    vect_samples, vect_error = mc_samples(adapter_class(op), vectorized=True)
+    single_samples, single_error = mc_samples(adapter_class(op), vectorized=False)
+
+    assert vect_samples.shape == (30, 2, 40)
+    assert not np.all(np.isnan(vect_error))
+    np.testing.assert_allclose(np.nanmean(vect_samples, axis=0),
+                               np.nanmean(single_samples, axis=0),
+                               rtol=1.e-10)
+    np.testing.assert_allclose(vect_error, single_error, rtol=1.e-10)
+
+
+def test_extinction_samples_in_chunks():
+    op = example_extinction_op()
+    op.run()
+    samples = CreateMCCopiesDefault(original=op.signal, n=25, rng=np.random.default_rng(5)).run()
+
+    all_at_once = op.run_samples(samples)
+    in_chunks = op.run_samples(samples, samples_per_call=7)
+
+    assert in_chunks.shape == samples.shape
+    assert not np.all(np.isnan(in_chunks))
+    np.testing.assert_array_equal(in_chunks, all_at_once)
+
+
+@pytest.mark.parametrize('vectorized', [True, False])
+def test_mc_raman_bsc_noisy_calibration(vectorized):
+    # the calibration window of all samples is too noisy
+    op = example_raman_bsc_op(calibr_err=1.)
+    op.run()
+
+    with pytest.raises(NotEnoughMCSamples):
+        mc_samples(MonteCarloRamanBscAdapter(op), vectorized=vectorized)
+
+
+def test_run_mc_chunk():
+    register_monte_carlo()
+    op = example_extinction_op()
+    op.run()
+    adapter = MonteCarloExtAdapter(op)
+    adapter.rng = np.random.default_rng(5)
+    adapter.get_sample_inputs(adapter.get_data(), 3)
+
+    state = adapter.__getstate__()
+    assert 'op' not in state and 'work_copies' not in state
+
+    samples, spec = to_shared_memory(adapter.sample_inputs.raman_sig.data)
+    results, result_spec = to_shared_memory(np.full((3,) + op.result.data.shape, np.nan))
+    blocks = [samples, results]
+    try:
+        pickled_op, op_arrays_spec = dumps_to_shared_memory(op, blocks, min_nbytes=0)
+        # the arrays of the signal are not pickled
+        assert len(pickled_op) < op.signal.ds.nbytes
+
+        errors = run_mc_chunk(Dict({'adapter': pickle.dumps(adapter),
+                                    'op': pickled_op,
+                                    'op_arrays': op_arrays_spec,
+                                    'inputs': [('raman_sig', 'data', spec)],
+                                    'results': result_spec,
+                                    'samples': [0, 2]}))
+        assert errors == {}
+
+        shared = np.ndarray(result_spec.shape, dtype=np.float64, buffer=results.buf)
+        adapter.create_work_copies(adapter.get_data())
+        for n in [0, 2]:
+            np.testing.assert_array_equal(shared[n], adapter.run_sample(n).data.values)
+        assert np.all(np.isnan(shared[1]))
+        del shared
+    finally:
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+
+
+def test_shared_memory_pickle():
+    col = example_columns()
+    col.same_data = col.ds.data.values
+    col.data_storage = DataStorage()
+    worker_storage = DataStorage()
+
+    blocks = []
+    try:
+        pickled, spec = dumps_to_shared_memory(col, blocks, min_nbytes=0)
+        # data and err are in one shared memory block, same_data is not copied twice
+        assert len(blocks) == 1
+        assert blocks[0].size >= col.ds.data.nbytes + col.ds.err.nbytes
+        assert col.ds.err.values.tobytes() not in pickled
+        with patch('ELDAmwl.monte_carlo.parallel_funcs.component.queryUtility', return_value=worker_storage):
+            rebuilt = loads_from_shared_memory(pickled, spec)
+    finally:
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+
+    np.testing.assert_array_equal(rebuilt.ds.data.values, col.ds.data.values)
+    np.testing.assert_array_equal(rebuilt.ds.err.values, col.ds.err.values)
+    assert rebuilt.same_data is rebuilt.ds.data.values
+    # the data storage is replaced by the one of the worker
+    assert rebuilt.data_storage is worker_storage
+    # the rebuilt arrays are writeable copies
+    rebuilt.ds.data.values[1, 0] = 0
+    assert col.ds.data.values[1, 0] != 0
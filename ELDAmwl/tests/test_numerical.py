@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""Tests for numerical utilities"""
+from ELDAmwl.utils.numerical import bitwise_or_in_windows
+from ELDAmwl.utils.numerical import count_valid_in_windows
+from ELDAmwl.utils.numerical import integral_profile
+from ELDAmwl.utils.numerical import integral_profiles
+from ELDAmwl.utils.numerical import linear_transition
+from ELDAmwl.utils.numerical import rolling_means_sems
+from ELDAmwl.utils.numerical import sliding_bitwise_or
+from ELDAmwl.utils.numerical import sliding_filter
+from ELDAmwl.utils.numerical import sliding_linear_fits
+from numpy.testing import assert_allclose
+from scipy.signal import savgol_coeffs
+from scipy.stats import sem
+
+import numpy as np
+import xarray as xr
+
+
+def example_profiles(num_times=3, num_levels=60):
+    rng = np.random.default_rng(42)
+    x = np.tile(np.arange(num_levels) * 15. + 7.5, (num_times, 1))
+    yerr = rng.uniform(0.01, 0.1, size=(num_times, num_levels))
+    y = -1e-4 * x + rng.normal(scale=yerr)
+    binres = np.tile(np.where(np.arange(num_levels) < num_levels // 2, 5, 9), (num_times, 1))
+    binres[1, :] = 7
+    return x, y, yerr, binres
+
+
+def test_sliding_linear_fits_equals_polyfit():
+    x, y, yerr, binres = example_profiles()
+
+    for weighted in [True, False]:
+        slope, slope_err = sliding_linear_fits(x, y, binres, yerr_data=yerr if weighted else None)
+
+        for t in range(y.shape[0]):
+            for lev in range(y.shape[1]):
+                hw = binres[t, lev] // 2
+                if (lev - hw < 0) or (lev + hw >= y.shape[1]):
+                    assert np.isnan(slope[t, lev])
+                    continue
+                win = slice(lev - hw, lev + hw + 1)
+                w = 1 / yerr[t, win] if weighted else None
+                fit = np.polyfit(x[t, win], y[t, win], 1, w=w, cov='unscaled')
+                assert_allclose(slope[t, lev], fit[0][0], rtol=1e-8)
+                assert_allclose(slope_err[t, lev], np.sqrt(fit[1][0, 0]), rtol=1e-8)
+
+
+def test_sliding_linear_fits_mask():
+    x, y, yerr, binres = example_profiles()
+    mask = np.zeros(y.shape, dtype=bool)
+    mask[0, 20:30] = True
+
+    slope, _ = sliding_linear_fits(x, y, binres, yerr_data=yerr, mask=mask)
+
+    assert np.all(~np.isnan(slope[mask]))
+    assert np.all(np.isnan(slope[~mask]))
+
+
+def test_sliding_bitwise_or():
+    flags = np.zeros((2, 20), dtype=np.int16)
+    flags[0, 10] = 4
+    flags[1, 3] = 1
+    binres = np.full(flags.shape, 3)
+
+    result = sliding_bitwise_or(flags, binres)
+
+    assert np.all(result[0, 9:12] == 4)
+    assert result[0, 8] == 0
+    assert np.all(result[1, 2:5] == 1)
+    assert result[1, 5] == 0
+
+
+def test_bitwise_or_in_windows():
+    rng = np.random.default_rng(1)
+    flags = rng.choice([0, 1, 2, 8, 64], size=(3, 50))
+    first_bins = rng.integers(0, 50, size=flags.shape)
+    last_bins = np.minimum(first_bins + rng.integers(-1, 8, size=flags.shape), 50)
+
+    result = bitwise_or_in_windows(flags, first_bins, last_bins)
+
+    for t in range(flags.shape[0]):
+        for lev in range(flags.shape[1]):
+            assert result[t, lev] == np.bitwise_or.reduce(flags[t, first_bins[t, lev]:last_bins[t, lev]])
+
+
+def test_count_valid_in_windows_equals_rolling_count():
+    rng = np.random.default_rng(2)
+    valid = rng.random((3, 40)) > 0.4
+    widths = rng.integers(1, 12, size=valid.shape)
+    data = xr.DataArray(np.where(valid, 1., np.nan), dims=['time', 'level'])
+
+    result = count_valid_in_windows(valid, widths)
+
+    for width in np.unique(widths):
+        expected = data.rolling(level=width, min_periods=1, center=True).count().fillna(0).values
+        assert np.all(result[widths == width] == expected[widths == width])
+
+
+def test_sliding_filter_equals_window_sums():
+    _, y, yerr, binres = example_profiles()
+    y[2, 40] = np.nan
+
+    data_f, err_f = sliding_filter(y, binres, lambda win: savgol_coeffs(win, 2), err=yerr)
+
+    for t in range(y.shape[0]):
+        for lev in range(y.shape[1]):
+            hw = binres[t, lev] // 2
+            if (lev - hw < 0) or (lev + hw >= y.shape[1]):
+                assert np.isnan(data_f[t, lev])
+                continue
+            win = slice(lev - hw, lev + hw + 1)
+            sgc = savgol_coeffs(binres[t, lev], 2)
+            assert_allclose(data_f[t, lev], np.sum(y[t, win] * sgc), rtol=1e-10)
+            assert_allclose(err_f[t, lev], np.sqrt(np.sum(np.square(yerr[t, win] * sgc))), rtol=1e-10)
+
+
+def test_integral_profiles_equals_integral_profile():
+    x, y, _, _ = example_profiles(num_times=4)
+    y = np.abs(y)
+    y[1, :10] = np.nan
+    y[2, 25:30] = np.nan
+    y[3, ::4] = np.nan
+    cal_bins = np.array([30, 40, 20, 35])
+
+    for factor in [None, 1]:
+        up = integral_profiles(y, x, extrapolate_ovl_factor=factor, first_bins=cal_bins)
+        down = integral_profiles(y, x, extrapolate_ovl_factor=factor, first_bins=cal_bins, last_bins=0)
+
+        for t in range(y.shape[0]):
+            cb = cal_bins[t]
+            assert np.all(np.isnan(up[t, :cb]))
+            assert np.all(np.isnan(down[t, cb + 1:]))
+            assert_allclose(up[t, cb:],
+                            integral_profile(y[t], range_axis=x[t], extrapolate_ovl_factor=factor, first_bin=cb),
+                            rtol=1e-10)
+            assert_allclose(down[t, :cb + 1],
+                            integral_profile(y[t], range_axis=x[t], extrapolate_ovl_factor=factor,
+                                             first_bin=cb, last_bin=0),
+                            rtol=1e-10)
+
+
+def test_integral_profiles_stack_of_bounds():
+    x, y, yerr, _ = example_profiles()
+    y = np.abs(y)
+    y[:, :5] = np.nan
+    factors = np.array([[1.], [0.8], [1.2]])
+
+    integrals = integral_profiles(np.stack([y, y - yerr, y + yerr]), x, extrapolate_ovl_factor=factors)
+
+    assert integrals.shape == (3,) + y.shape
+    for variant, data in enumerate([y, y - yerr, y + yerr]):
+        for t in range(y.shape[0]):
+            assert_allclose(integrals[variant, t],
+                            integral_profile(data[t], range_axis=x[t],
+                                             extrapolate_ovl_factor=factors[variant, 0]),
+                            rtol=1e-10)
+
+
+def test_rolling_means_sems():
+    x, y, _, _ = example_profiles()
+    y = y + 1
+    y[2, 30] = np.nan
+    widths = np.array([5, 11, 8])
+
+    means, sems, rel_sems = rolling_means_sems(y, widths)
+
+    for t in range(y.shape[0]):
+        for lev in range(y.shape[1]):
+            window = y[t, lev + 1 - widths[t]:lev + 1]
+            if (lev + 1 < widths[t]) or np.any(np.isnan(window)):
+                assert np.isnan(means[t, lev]) and np.isnan(sems[t, lev])
+                continue
+            assert_allclose(means[t, lev], np.mean(window), rtol=1e-10)
+            assert_allclose(sems[t, lev], sem(window), rtol=1e-8)
+    assert_allclose(rel_sems, sems / means)
+
+
+def test_linear_transition():
+    bottom_bins = np.array([10, 20, 15, 30])
+    top_bins = np.array([40, 21, 15, 25])
+
+    profiles = linear_transition(50, bottom_bins, top_bins, 60., 300.)
+
+    for t in range(4):
+        expected = np.where(np.arange(50) <= bottom_bins[t], 60., np.nan)
+        delta_res = (300. - 60.) / (top_bins[t] - bottom_bins[t])
+        for idx in range(bottom_bins[t], top_bins[t]):
+            expected[idx] = 60. + delta_res * (idx - bottom_bins[t])
+        expected[top_bins[t]:] = 300.
+        assert_allclose(profiles[t], expected, rtol=1e-12)
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""Tests for writing the mwl output file"""
+from addict import Dict
+from ELDAmwl.output.write_mwl_output import WriteMWLOutputDefault
+from unittest.mock import patch
+
+import netCDF4
+import numpy as np
+import xarray as xr
+
+
+def group_data(name, value):
+    return Dict({'attrs': Dict({'title': name}),
+                 'data_vars': Dict({name: xr.DataArray(np.array([value, np.nan]), dims=['level'])})})
+
+
+def test_write_groups(tmp_path):
+    with patch.object(WriteMWLOutputDefault, '__init__', return_value=None):
+        writer = WriteMWLOutputDefault()
+    writer.out_filename = str(tmp_path / 'mwl.nc')
+    writer.data = Dict({0: group_data('latitude', 1.), 3: group_data('extinction', 2.)})
+    writer.meta_data = Dict({'ext_1': group_data('error_method', 3.),
+                             'bsc_2': group_data('error_method', 4.)})
+
+    writer.write_groups()
+
+    with xr.open_dataset(writer.out_filename) as ds:
+        assert ds.attrs['title'] == 'latitude'
+        np.testing.assert_array_equal(ds.latitude.values, [1., np.nan])
+    with xr.open_dataset(writer.out_filename, group='highres_products') as ds:
+        np.testing.assert_array_equal(ds.extinction.values, [2., np.nan])
+    with xr.open_dataset(writer.out_filename, group='meta_data/bsc_2') as ds:
+        assert ds.attrs['title'] == 'error_method'
+        assert ds.error_method.values[0] == 4.
+
+
+def test_encoding_profile(tmp_path):
+    with patch.object(WriteMWLOutputDefault, '__init__', return_value=None):
+        writer = WriteMWLOutputDefault()
+    writer.out_filename = str(tmp_path / 'mwl.nc')
+    writer.encoding_profile = Dict({'zlib': True, 'complevel': 5, 'chunks': {'wavelength': 1}, 'float32': True})
+    products = Dict({'attrs': Dict(), 'data_vars': Dict({
+        'backscatter': xr.DataArray(np.ones((3, 2, 10)), dims=['wavelength', 'time', 'level']),
+        'backscatter_meta_data': xr.DataArray(np.array(['a', 'b', 'c'], dtype=object), dims=['wavelength']),
+        'vertical_res': xr.DataArray(np.ones((2, 10)), dims=['time', 'level']),
+    })})
+    writer.data = Dict({3: products})
+    writer.meta_data = Dict()
+
+    writer.write_groups()
+
+    with netCDF4.Dataset(writer.out_filename) as nc_file:
+        group = nc_file['highres_products']
+        assert group['backscatter'].dtype == np.float32
+        assert group['backscatter'].chunking() == [1, 2, 10]
+        assert group['backscatter'].filters()['complevel'] == 5
+        assert group['vertical_res'].dtype == np.float64
+        assert group['vertical_res'].filters()['zlib']
+        assert not group['backscatter_meta_data'].filters()['zlib']
+    # the variables of the data storage keep their encoding
+    assert products.data_vars.backscatter.encoding == {}
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+"""Tests for the product index"""
+from ELDAmwl.elda_mwl.product_index import ProductIndex
+from ELDAmwl.utils.constants import EBSC
+from ELDAmwl.utils.constants import EXT
+from ELDAmwl.utils.constants import HIGHRES
+from ELDAmwl.utils.constants import LOWRES
+from ELDAmwl.utils.constants import LR
+from ELDAmwl.utils.constants import RBSC
+
+
+def example_index():
+    index = ProductIndex()
+    index.add('330', 1064., EBSC, True, False, [HIGHRES])
+    index.add('377', 355., EXT, True, False, [LOWRES])
+    index.add('378', 355., RBSC, True, False, [LOWRES])
+    index.add('379', 355., LR, False, True, [LOWRES])
+    # the same product again with another resolution
+    index.add('378', 355., RBSC, True, False, [HIGHRES])
+    return index
+
+
+def test_product_index():
+    index = example_index()
+
+    assert len(index) == 4
+    assert index.find() == ['330', '377', '378', '379']
+    assert index.find(res=LOWRES) == ['377', '378', '379']
+    assert index.find(res=HIGHRES) == ['330', '378']
+    assert index.find(basic=False) == ['379']
+    assert index.find(wl=355, prod_types=[RBSC, EXT]) == ['377', '378']
+    assert index.find(wl=532.) == []
+    assert index.wavelengths(basic=True) == [355., 1064.]
+    assert index.prod_types(res=HIGHRES) == [RBSC, EBSC]
+    assert index.count(res=LOWRES) == 3
+
+    index.mark_as_failed('378')
+
+    assert index.has_failed('378') and not index.has_failed('377')
+    assert index.failed_ids() == ['378']
+    assert index.find(res=HIGHRES) == ['330']
+    assert index.find(res=HIGHRES, include_failed=True) == ['330', '378']
+    assert index.count(res=LOWRES, include_failed=True) == 3
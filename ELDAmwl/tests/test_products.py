@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""Tests for the quality control of products"""
+from addict import Dict
+from ELDAmwl.products import Products
+from ELDAmwl.utils.constants import ALL_OK
+from ELDAmwl.utils.constants import CALC_WINDOW_OUTSIDE_PROFILE
+from ELDAmwl.utils.constants import NEG_DATA
+from ELDAmwl.utils.constants import P_ALL_OK
+from ELDAmwl.utils.constants import SINGLE_POINT
+from ELDAmwl.utils.constants import UNCERTAINTY_TOO_LARGE
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+import numpy as np
+import xarray as xr
+
+
+NUM_TIMES = 3
+NUM_LEVELS = 40
+RAW_HEIGHTRES = 7.5
+# the common vertical resolution corresponds to 5 bins
+VERTICAL_RESOLUTION = 5 * RAW_HEIGHTRES
+
+
+def example_product(negative, too_large_error, single):
+    """product with data = 1 +- 0.1, except for negative points, points with too large errors
+    and single points (surrounded by flagged data)
+
+    Args:
+        negative, too_large_error, single (list of (time, level)): points of the 3 kinds
+    """
+    data = np.ones((NUM_TIMES, NUM_LEVELS))
+    err = np.full((NUM_TIMES, NUM_LEVELS), 0.1)
+    for t, lev in negative:
+        data[t, lev] = -1.
+    for t, lev in too_large_error:
+        err[t, lev] = 10.
+
+    product = Products()
+    product.ds = xr.Dataset(
+        data_vars=dict(
+            data=(['time', 'level'], data),
+            err=(['time', 'level'], err),
+            qf=(['time', 'level'], gap_flags(single)),
+            binres=(['time', 'level'], np.ones((NUM_TIMES, NUM_LEVELS), dtype=int)),
+            height=(['time', 'level'], np.tile(np.arange(NUM_LEVELS) * RAW_HEIGHTRES, (NUM_TIMES, 1))),
+        ))
+    product.raw_heightres = RAW_HEIGHTRES
+    product.profile_qf = np.full(NUM_TIMES, P_ALL_OK)
+    product.params = Dict(product_type=0)
+    product.params.general_params.is_derived_product = False
+    return product
+
+
+def exact_flags(points, qf_flag):
+    flags = np.full((NUM_TIMES, NUM_LEVELS), ALL_OK)
+    for t, lev in points:
+        flags[t, lev] |= qf_flag
+    return flags
+
+
+def gap_flags(single):
+    """flags of the (already flagged) data around the single points"""
+    flags = np.full((NUM_TIMES, NUM_LEVELS), ALL_OK)
+    for t, lev in single:
+        flags[t, lev - 5:lev + 6] = CALC_WINDOW_OUTSIDE_PROFILE
+        flags[t, lev] = ALL_OK
+    return flags
+
+
+def add_qf_orthogonal(self, mask, qf_flag):
+    """the previous flagging: all points are flagged whose time slice and whose level contain a point of mask"""
+    mask = np.asarray(mask, dtype=bool)
+    outer = np.logical_and.outer(mask.any(axis=1), mask.any(axis=0))
+    self.ds.qf.values[outer] |= qf_flag
+
+
+def quality_flags(product, orthogonal=False):
+    cfg = Dict(NEG_VALUES_ERR_FACTOR=2,
+               MAX_ALLOWED_REL_ERROR={0: 0.5},
+               MAX_ALLOWED_ABS_ERROR={0: 1.},
+               MAX_ALLOWED_PERCENTAGE_OF_NEG_DATA={},
+               VALID_DATA_RANGE={},
+               MIN_LAYER_DEPTH=RAW_HEIGHTRES,
+               MAX_INTEGRAL={},
+               CRITICAL_FLAGS=[])
+    data_storage = MagicMock()
+    data_storage.common_vertical_resolution.return_value = xr.DataArray(
+        np.full((NUM_TIMES, NUM_LEVELS), VERTICAL_RESOLUTION),
+        dims=['time', 'level'], name='vertical_resolution')
+
+    with patch.object(Products, 'cfg', cfg), \
+            patch.object(Products, 'data_storage', data_storage):
+        if orthogonal:
+            with patch.object(Products, 'add_qf', add_qf_orthogonal):
+                product.quality_control()
+        else:
+            product.quality_control()
+
+    return product.ds.qf.values
+
+
+def expected_flags(negative, too_large_error, single):
+    neg_flags = exact_flags(negative, NEG_DATA)
+    too_large_error_flags = exact_flags(too_large_error, UNCERTAINTY_TOO_LARGE)
+    single_point_flags = exact_flags(single, SINGLE_POINT)
+    return gap_flags(single) | neg_flags | too_large_error_flags | single_point_flags
+
+
+def test_quality_control_flags_as_before():
+    # the bad points of each kind are in one time slice -> the previous (orthogonal) flags are exact
+    points = dict(negative=[(0, 10)], too_large_error=[(1, 15)], single=[(2, 30)])
+
+    qf = quality_flags(example_product(**points))
+    previous_qf = quality_flags(example_product(**points), orthogonal=True)
+
+    np.testing.assert_array_equal(qf, expected_flags(**points))
+    np.testing.assert_array_equal(qf, previous_qf)
+
+
+def test_quality_control_flags_exactly():
+    # the bad points of each kind are in different time slices and levels
+    points = dict(negative=[(0, 10), (1, 20)], too_large_error=[(1, 15), (2, 5)], single=[(0, 25), (2, 30)])
+
+    qf = quality_flags(example_product(**points))
+    previous_qf = quality_flags(example_product(**points), orthogonal=True)
+
+    np.testing.assert_array_equal(qf, expected_flags(**points))
+    # the previous flagging set additional flags at the crossings of the bad points, but kept all flags
+    assert np.all(previous_qf & qf == qf)
+    assert previous_qf[0, 20] & NEG_DATA
+    assert previous_qf[1, 5] & UNCERTAINTY_TOO_LARGE
+    assert previous_qf[2, 25] & SINGLE_POINT
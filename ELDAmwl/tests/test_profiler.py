@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""Tests for the timing and memory profile of a run"""
+from addict import Dict
+from ELDAmwl.bases.factory import BaseOperation
+from ELDAmwl.log.profiler import OPERATION
+from ELDAmwl.log.profiler import peak_rss_mb
+from ELDAmwl.log.profiler import RunProfiler
+from ELDAmwl.log.profiler import STAGE
+from ELDAmwl.utils.constants import HIGHRES
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+import json
+import numpy as np
+import pytest
+
+
+class ProfiledOperation(BaseOperation):
+
+    def run(self):
+        return 42
+
+
+def test_run_profiler(tmp_path):
+    cfg = MagicMock()
+    cfg.get.side_effect = lambda key, default=None: {'PROFILE': True, 'PROFILE_ALLOCATIONS': True}.get(key, default)
+    cfg.LOG_PATH = str(tmp_path)
+    profiler = RunProfiler()
+
+    with patch('ELDAmwl.log.profiler.component.queryUtility', return_value=profiler), \
+            patch.object(RunProfiler, 'cfg', cfg), \
+            patch.object(RunProfiler, 'logger', MagicMock()):
+        profiler.start('20181017oh00')
+        with profiler.measure(STAGE, 'get_products'):
+            prod_param = Dict({'prod_id_str': '378'})
+            operation = ProfiledOperation(prod_param=prod_param, resolution=HIGHRES)
+            operation.factory_name = 'ProfiledOperationFactory'
+            assert operation.run() == 42
+        profiler.write()
+
+    with open(tmp_path / '20181017oh00.profile.json') as infile:
+        profile = json.load(infile)
+
+    operation, stage = profile['records']
+    assert stage['kind'] == STAGE
+    assert stage['name'] == 'get_products'
+    assert operation['kind'] == OPERATION
+    assert operation['name'] == 'ProfiledOperation'
+    assert operation['factory'] == 'ProfiledOperationFactory'
+    assert operation['product_id'] == '378'
+    assert operation['resolution'] == 'highres'
+    assert 'alloc_delta_mb' in operation
+    assert profile['summary']['operation:ProfiledOperation']['count'] == 1
+
+    # nothing is recorded if the profile was not started
+    assert not profiler.enabled
+
+
+@pytest.mark.skipif(peak_rss_mb() is None, reason='peak RSS is not available on this platform')
+def test_peak_rss_increase_of_stages():
+    cfg = MagicMock()
+    cfg.get.side_effect = lambda key, default=None: {'PROFILE': True}.get(key, default)
+    profiler = RunProfiler()
+    large_mb = 50
+
+    with patch.object(RunProfiler, 'cfg', cfg):
+        profiler.start('20181017oh00')
+        # raise the peak RSS of the process by more than large_mb
+        with profiler.measure(STAGE, 'large_stage'):
+            data = np.ones(int((peak_rss_mb() + large_mb) * 1024 ** 2 / 8))
+            assert data.sum() == data.size
+            del data
+        with profiler.measure(STAGE, 'small_stage'):
+            # a small allocation does not raise the peak RSS
+            assert np.ones(1000).sum() == 1000
+
+    large_stage, small_stage = profiler.records
+    assert large_stage['peak_rss_increase_mb'] > large_mb
+    assert small_stage['peak_rss_increase_mb'] < 1
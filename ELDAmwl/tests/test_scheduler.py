@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""Tests for the dependency graph of the retrievals"""
+from ELDAmwl.elda_mwl.scheduler import TaskGraph
+from ELDAmwl.errors.exceptions import DependencyCycle
+from ELDAmwl.errors.exceptions import ELDAmwlException
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+import pytest
+import threading
+
+
+def build_graph(log):
+    graph = TaskGraph()
+    graph.add('qc', lambda: log.append('qc'), depends_on=['smooth'])
+    graph.add('raw', lambda: log.append('raw'), depends_on=['not_in_graph'])
+    graph.add('smooth', lambda: log.append('smooth'), depends_on=['raw'])
+    graph.add('other', lambda: log.append('other'))
+    return graph
+
+
+def test_task_graph_order():
+    graph = build_graph([])
+    assert graph.order() == ['raw', 'smooth', 'qc', 'other']
+
+    graph.add('raw', None, depends_on=['qc'])
+    with pytest.raises(DependencyCycle):
+        graph.order()
+
+
+def test_task_graph_run():
+    log = []
+    build_graph(log).run(num_threads=1)
+    assert log == ['raw', 'smooth', 'qc', 'other']
+
+    log = []
+    cfg = MagicMock()
+    cfg.get.return_value = False
+    with patch('ELDAmwl.elda_mwl.scheduler.component.queryUtility', return_value=cfg):
+        build_graph(log).run(num_threads=3)
+    assert sorted(log) == ['other', 'qc', 'raw', 'smooth']
+    assert log.index('raw') < log.index('smooth') < log.index('qc')
+
+
+def test_task_graph_concurrent_run_raises_errors():
+    log = []
+    started = threading.Event()
+
+    def fail():
+        started.wait(5)
+        raise ELDAmwlException(None)
+
+    graph = TaskGraph()
+    graph.add('slow', lambda: (started.set(), log.append('slow')))
+    graph.add('fail', fail)
+    graph.add('next', lambda: log.append('next'), depends_on=['fail'])
+
+    cfg = MagicMock()
+    cfg.get.return_value = False
+    with patch('ELDAmwl.elda_mwl.scheduler.component.queryUtility', return_value=cfg), \
+            pytest.raises(ELDAmwlException):
+        graph.run(num_threads=2)
+    # the running node is finished, the dependent node is not started
+    assert log == ['slow']
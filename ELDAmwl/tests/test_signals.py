@@ -1,10 +1,19 @@
 # -*- coding: utf-8 -*-
 """Tests for Signals"""
+from ELDAmwl.component.interface import ICfg
+from ELDAmwl.component.interface import IDataStorage
 from ELDAmwl.products import GeneralProductParams
 from ELDAmwl.products import ProductParams
+from copy import deepcopy
+from ELDAmwl.signals import ElppFileCache
 from ELDAmwl.signals import Signals
+from ELDAmwl.storage.data_storage import DataStorage
+from ELDAmwl.utils.constants import BELOW_OVL
+from ELDAmwl.utils.constants import NC_FILL_BYTE
+from unittest.mock import MagicMock
 from unittest.mock import patch
 
+import numpy as np
 import os
 import unittest
 import xarray as xr
@@ -29,6 +38,59 @@ def test_Signals_from_nc_file():
         Signals.from_nc_file(nc_ds, channelidx)
 
 
+def test_set_invalid_mask_equals_set_invalid_point():
+    sig = Signals.from_nc_file(xr.open_dataset(TEST_INTERMEDIATE_FILE_1), 0)
+    sig.ds.load()
+    sig.ds['qf'][:, ::3] = NC_FILL_BYTE
+
+    mask = np.zeros(sig.data.shape, dtype=bool)
+    mask[:, :50] = True
+    mask[0, 100:120] = True
+
+    by_point = deepcopy(sig)
+    for t, lev in zip(*np.where(mask)):
+        by_point.set_invalid_point(t, lev, BELOW_OVL)
+
+    sig.set_invalid_mask(mask, BELOW_OVL)
+
+    for var in ['data', 'err', 'qf', 'binres']:
+        assert sig.ds[var].equals(by_point.ds[var])
+
+
+def test_elpp_file_cache_reads_each_file_once():
+    storage = DataStorage()
+    # eager reading -> the signals are loaded into memory once
+    utilities = {IDataStorage: storage,
+                 ICfg: MagicMock(get=MagicMock(return_value=False))}
+
+    def query_utility(interface):
+        return utilities.get(interface, MagicMock())
+
+    products = []
+    for prod_id in [378, 379]:
+        params = ProductParams()
+        params.general_params = GeneralProductParams()
+        params.general_params.prod_id = prod_id
+        params.general_params.elpp_file = TEST_INTERMEDIATE_FILE_1
+        products.append(params)
+
+    with patch('ELDAmwl.signals.component.queryUtility', side_effect=query_utility), \
+            patch('ELDAmwl.signals.abs_file_path', side_effect=lambda path, filename: filename), \
+            patch('ELDAmwl.signals.Header.from_nc_file') as from_nc_file:
+        elpp_files = ElppFileCache()
+        elpp_data = [elpp_files.read(params) for params in products]
+
+    assert elpp_data[0] is elpp_data[1]
+    assert from_nc_file.call_count == 1
+    assert len(elpp_data[0].signals) == 2
+    for ch_id_str in elpp_data[0].signals:
+        with storage.borrow():
+            sig_378 = storage.elpp_signal('378', ch_id_str)
+            sig_379 = storage.elpp_signal('379', ch_id_str)
+        assert np.shares_memory(sig_378.ds.data.values, sig_379.ds.data.values)
+        assert ch_id_str in products[1].general_params.signals
+
+
 class Test(unittest.TestCase):
 
     @patch('ELDAmwl.products.ProductParams.prod_id_str')
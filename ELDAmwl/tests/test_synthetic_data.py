@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""Tests for the synthetic measurements of the benchmarks"""
+from ELDAmwl.tests.synthetic_data import resample_levels
+from ELDAmwl.tests.synthetic_data import SyntheticMeasurement
+from ELDAmwl.tests.synthetic_data import TEMPLATE_SIGNAL_PATH
+from ELDAmwl.utils.path_utils import abs_file_path
+
+import numpy as np
+import os
+import xarray as xr
+
+
+def test_resample_levels():
+    # values next to invalid values are taken from the nearest level
+    values = np.array([[0., 1., 2., np.nan, 4.]])
+    np.testing.assert_allclose(resample_levels(values, 9),
+                               [[0., 0.5, 1., 1.5, 2., 2., np.nan, 4., 4.]])
+    np.testing.assert_array_equal(resample_levels(np.array([1, 2, 3]), 5), [1, 1, 2, 3, 3])
+
+
+def test_synthetic_measurement(tmp_path):
+    measurement = SyntheticMeasurement(str(tmp_path), num_times=5, num_levels=300, wavelengths=[1064])
+    os.makedirs(measurement.signal_path)
+    os.makedirs(measurement.csv_source)
+
+    measurement.write_csv_sources()
+    filenames = measurement.elpp_filenames()
+    assert filenames == ['hpb_003_0000330_201810172100_201810172300_20181017oh00_elpp_v5.3.0.nc']
+
+    measurement.write_elpp_file(filenames[0])
+    template = xr.open_dataset(os.path.join(abs_file_path(TEMPLATE_SIGNAL_PATH), filenames[0]))
+    synthetic = xr.open_dataset(os.path.join(measurement.signal_path, filenames[0]))
+
+    assert synthetic.sizes['time'] == 5
+    assert synthetic.sizes['level'] == 300
+    assert synthetic.sizes['channel'] == template.sizes['channel']
+    assert synthetic.time_bounds[0, 0] == template.time_bounds[0, 0]
+    assert synthetic.time_bounds[-1, 1] == template.time_bounds[-1, 1]
+    np.testing.assert_allclose(synthetic.range[[0, -1]], template.range[[0, -1]])
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""job queue of the ELDAmwl service"""
+from ELDAmwl.utils.constants import EXIT_CODE_NONE
+
+import os
+import socket
+
+
+class DirectoryJobQueue(object):
+    """
+    Job queue in a spool directory which can be shared by many worker processes
+
+    Each job is an (empty) file which is named by the measurement id.
+    New jobs are put into the sub-directory 'new', e.g. by
+    `touch <queue_dir>/new/20181017oh00`. A worker claims a job by moving its file
+    (atomically) into 'processing' and writes its owner (host and pid) into the file.
+    Finished jobs are moved into 'done' or 'failed' (if no product could be derived),
+    the return code is written into the file.
+
+    Args:
+        queue_dir (str): the spool directory
+    """
+
+    NEW = 'new'
+    PROCESSING = 'processing'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    def __init__(self, queue_dir):
+        self.queue_dir = queue_dir
+        for sub_dir in [self.NEW, self.PROCESSING, self.DONE, self.FAILED]:
+            os.makedirs(self.path(sub_dir), exist_ok=True)
+
+    def path(self, sub_dir, meas_id=''):
+        return os.path.join(self.queue_dir, sub_dir, meas_id)
+
+    @staticmethod
+    def owner():
+        """owner of the jobs which are claimed by this process
+
+        Returns:
+            str: '<host> <pid>'
+        """
+        return '{} {}'.format(socket.gethostname(), os.getpid())
+
+    @staticmethod
+    def owner_is_alive(owner):
+        """whether the process which claimed a job is still running
+
+        Processes on other hosts cannot be checked, they are assumed to be alive.
+
+        Args:
+            owner (str): '<host> <pid>' as written by :meth:`claim`, empty if unknown
+
+        Returns:
+            bool
+        """
+        try:
+            host, pid = owner.split()
+            pid = int(pid)
+        except ValueError:
+            # no valid owner (e.g. claimed by an older version)
+            return False
+
+        if host != socket.gethostname():
+            return True
+
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            # the process exists but belongs to another user
+            return True
+        return True
+
+    def read_owner(self, meas_id):
+        """owner of a claimed job ('<host> <pid>' or '' if unknown)"""
+        try:
+            with open(self.path(self.PROCESSING, meas_id)) as job_file:
+                return job_file.read().strip()
+        except FileNotFoundError:
+            return ''
+
+    def submit(self, meas_id):
+        """puts a new job into the queue"""
+        tmp_file = self.path(self.NEW, '.{}.tmp'.format(meas_id))
+        with open(tmp_file, 'w'):
+            pass
+        os.replace(tmp_file, self.path(self.NEW, meas_id))
+
+    def pending(self):
+        """ids of all waiting jobs, the oldest first"""
+        jobs = []
+        with os.scandir(self.path(self.NEW)) as entries:
+            for entry in entries:
+                if entry.is_file() and not entry.name.startswith('.'):
+                    jobs.append((entry.stat().st_mtime, entry.name))
+        return [meas_id for _, meas_id in sorted(jobs)]
+
+    def claim(self):
+        """takes the oldest waiting job out of the queue
+
+        Returns:
+            measurement id (str) or None if the queue is empty
+        """
+        for meas_id in self.pending():
+            try:
+                os.rename(self.path(self.NEW, meas_id), self.path(self.PROCESSING, meas_id))
+            except FileNotFoundError:
+                # the job was claimed by another worker
+                continue
+
+            # the job keeps its submission time (its position in the queue if it is requeued)
+            submitted = os.stat(self.path(self.PROCESSING, meas_id))
+            tmp_file = self.path(self.PROCESSING, '.{}.{}.tmp'.format(meas_id, os.getpid()))
+            with open(tmp_file, 'w') as job_file:
+                job_file.write('{}\n'.format(self.owner()))
+            os.utime(tmp_file, ns=(submitted.st_atime_ns, submitted.st_mtime_ns))
+            os.replace(tmp_file, self.path(self.PROCESSING, meas_id))
+            return meas_id
+        return None
+
+    def finish(self, meas_id, return_code):
+        """moves a claimed job into 'done' or 'failed' and writes the return code into its file"""
+        target = self.FAILED if return_code == EXIT_CODE_NONE else self.DONE
+        with open(self.path(self.PROCESSING, meas_id), 'w') as job_file:
+            job_file.write('{}\n'.format(return_code))
+        os.replace(self.path(self.PROCESSING, meas_id), self.path(target, meas_id))
+
+    def requeue_unfinished(self):
+        """puts jobs which were claimed but not finished (because their owner crashed)
+        back into the queue.
+
+        Jobs whose owner is still running (e.g. another daemon on the same spool directory)
+        are not touched.
+
+        Returns:
+            list of the requeued measurement ids
+        """
+        requeued = []
+        for meas_id in sorted(os.listdir(self.path(self.PROCESSING))):
+            if meas_id.startswith('.'):
+                continue
+            if self.owner_is_alive(self.read_owner(meas_id)):
+                continue
+            os.replace(self.path(self.PROCESSING, meas_id), self.path(self.NEW, meas_id))
+            requeued.append(meas_id)
+        return requeued
@@ -1,62 +1,87 @@
 from copy import deepcopy
 from ELDAmwl.errors.exceptions import IntegrationFailed
 from ELDAmwl.utils.constants import NEG_TEST_STD_FACTOR
-from ELDAmwl.utils.wrapper import scipy_reduce_wrapper
 from scipy.integrate import cumulative_trapezoid
-from scipy.stats import sem
+from scipy.ndimage import correlate1d
 
 import numpy as np
-import xarray as xr
 
 
 def np_datetime64_to_datetime(np_datetme_64):
     return np_datetme_64.astype('M8[ms]').astype('O')
 
 
-def rolling_mean_sem(data, level):
-    """calculate rolling mean and stderror of mean"""
-    means = data.rolling(level=level).reduce(np.mean)
-    # the use of scipy_reduce_wrapper is needed to deal with incompatible axis types
-    sems = data.rolling(level=level).reduce(scipy_reduce_wrapper(sem))
-    return means, sems
+def rolling_means_sems(data, window_widths):
+    """rolling means and standard errors of the means of all profiles
 
+    uses cumulative sums of the data and of their squares, therefore, the costs
+    do not depend on the window widths (O(time x level)). Each profile (time slice)
+    can have its own window width. As with xarray's rolling(level=width), the results
+    are assigned to the last bin of each window, and windows which are not
+    completely inside the profile or which contain nan values give nan.
 
-def calc_rolling_means_sems(ds, w_width):
-    ww0 = w_width[0, 0]
-    # calculate rolling means, std errs of mean, and rel sem
-    # if window_width are equal for all time slices,
-    # get means and sems at once
-    if np.all(w_width == ww0):
-        means, sems = rolling_mean_sem(ds.data, ww0)
+    Args:
+        data (ndarray (time, level)): the profiles
+        window_widths (int or ndarray (time)): window width [bins] of each profile
 
-    # else do it for each time slice separately
-    else:
-        m_list = []
-        s_list = []
-        for t in range(ds.dims.time):
-            mean, sems = rolling_mean_sem(ds.data[t], w_width[t, 0])
-            m_list.append(mean)
-            s_list.append(sems)
+    Returns:
+        means, sems, rel_sems (ndarray (time, level)): rolling means,
+            standard errors of the means (ddof=1), and relative standard errors of the means
+    """
+    data = np.asarray(data, dtype=float)
+    num_times, num_levels = data.shape
+    widths = np.broadcast_to(np.asarray(window_widths, dtype=int), (num_times,))[:, np.newaxis]
+
+    # the sums of squares are calculated relative to an offset per profile
+    # to avoid loss of precision
+    valid = ~np.isnan(data)
+    offset = np.zeros((num_times, 1))
+    has_data = np.any(valid, axis=1)
+    offset[has_data, 0] = np.nanmean(data[has_data], axis=1)
+    shifted = np.where(valid, data - offset, 0)
+
+    def window_sums(values):
+        cum = np.concatenate([np.zeros((num_times, 1)), np.cumsum(values, axis=1)], axis=1)
+        first = np.arange(num_levels) + 1 - widths
+        return cum[:, 1:] - np.take_along_axis(cum, np.maximum(first, 0), axis=1), first >= 0
+
+    sums, complete = window_sums(shifted)
+    sqr_sums, _ = window_sums(np.square(shifted))
+    counts, _ = window_sums(valid.astype(float))
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        means = sums / widths
+        variances = np.maximum(sqr_sums - sums * means, 0) / (widths - 1)
+        sems = np.sqrt(variances / widths)
+        means = means + offset
 
-        means = xr.concat(m_list, 'time')
-        sems = xr.concat(s_list, 'time')
+        full_windows = complete & (counts == widths)
+        means = np.where(full_windows, means, np.nan)
+        sems = np.where(full_windows, sems, np.nan)
+        rel_sems = sems / means
 
-    return means, sems
+    return means, sems, rel_sems
 
 
-def find_minimum_window(means, sems, w_width, error_threshold):
-    rel_sem = sems / means
+def find_minimum_window(means, rel_sems, w_width, error_threshold):
+    """finds the window with the minimum mean of all windows with relative error below the threshold
+
+    Args:
+        means, rel_sems (ndarray (time, level)): rolling means and relative standard errors of the means
+        w_width (ndarray): window widths [bins]
+        error_threshold (float): maximum relative standard error of the mean
+
+    Returns:
+        win_first_idx, win_last_idx (ndarray (time)): first and last bin of the windows
+    """
+    means = np.asarray(means)
+    rel_sems = np.asarray(rel_sems)
 
-    # find all means with rel_sem < error threshold:
-    # rel_sem.where(rel_sem.data < error_threshold)
-    #           => rel_sem values and nans
-    # rel_sem.where(rel_sem.data < error_threshold) / rel_sem
-    #           => ones and nans
     # valid_means = means and nans
-    valid_means = (rel_sem.where((rel_sem.data < error_threshold) & (means.data > 0)) / rel_sem * means)
+    valid_means = np.where((rel_sems < error_threshold) & (rel_sems != 0) & (means > 0), means, np.nan)
 
     # min_idx is the last bin of rolling window with smallest mean
-    win_last_idx = np.nanargmin(valid_means.data, axis=1)
+    win_last_idx = np.nanargmin(valid_means, axis=1)
     win_first_idx = (win_last_idx[:] - w_width[:, 0])
 
     return win_first_idx, win_last_idx
@@ -251,6 +276,431 @@ def integral_profile(data,
     return result
 
 
+def integral_profiles(data,
+                      range_axis,
+                      extrapolate_ovl_factor=None,
+                      first_bins=None,
+                      last_bins=None):
+    """
+    calculates the vertical integrals of all profiles of a (time, level) array at once
+
+    gives the same results as :func:`integral_profile` applied to each profile
+    (time slice) separately: nan values are skipped by the trapezoids and the cumulative
+    integral is linearly interpolated at their positions, the half first bin is added, and
+    the overlap region can be extrapolated. All profiles are processed together,
+    without loops over time slices.
+
+    The data may have additional leading dimensions, e.g., a stack of variants
+    (variant, time, level) of the same profiles, like the profile and its lower
+    and upper error bounds. All arguments are broadcast against the profiles.
+
+    Args:
+        data (ndarray (..., time, level)): the ydata to be integrated
+        range_axis (ndarray (level) or (..., time, level)): the xdata. monotonically increasing with level
+        first_bins (int or ndarray (..., time), optional): (default = 0) the first bin of the integration
+        last_bins (int or ndarray (..., time), optional): (default = number of levels) the last bin
+                    of the integration. if last_bin < first_bin, the integration direction
+                    of this profile is reversed
+        extrapolate_ovl_factor (float or ndarray (..., time), optional): (default = None)
+                    if not None, the profiles are extrapolated towards the ground by a data point
+                    with values range_new = 0, data_new = data[first valid bin] * extrapolate_ovl_factor
+
+    Returns:
+        ndarray (..., time, level) with the cumulative integrals. Bins outside the integration
+        range of a profile, and profiles which are nan in all bins, are nan.
+
+    Raises:
+        IntegrationFailed: if the integration range of a profile has no valid data point
+    """
+    ydata = np.array(data, dtype=float)
+    data_shape = ydata.shape
+    profiles_shape = data_shape[:-1]
+    num_levels = data_shape[-1]
+    ydata = ydata.reshape(-1, num_levels)
+    num_profiles = ydata.shape[0]
+    xdata = np.broadcast_to(np.asarray(range_axis, dtype=float), data_shape).reshape(-1, num_levels).copy()
+    levels = np.arange(num_levels)
+
+    fb = np.broadcast_to(0 if first_bins is None else np.asarray(first_bins), profiles_shape).reshape(-1)
+    lb = np.broadcast_to(num_levels if last_bins is None else np.asarray(last_bins), profiles_shape).reshape(-1)
+
+    extrapolate = extrapolate_ovl_factor is not None
+    if extrapolate:
+        factor = np.broadcast_to(np.asarray(extrapolate_ovl_factor, dtype=float),
+                                 profiles_shape).reshape(-1, 1)
+
+    # if integration direction is downward -> flip profiles and exchange fb, lb
+    # all following calculations are done in integration direction
+    reverse = lb < fb
+    ydata[reverse] = ydata[reverse, ::-1]
+    xdata[reverse] = xdata[reverse, ::-1]
+    fb, lb = np.where(reverse, num_levels - fb - 1, fb), np.where(reverse, num_levels - lb, lb)
+
+    in_range = (levels >= fb[:, np.newaxis]) & (levels < lb[:, np.newaxis])
+    valid = in_range & ~np.isnan(ydata)
+    all_nan = np.all(np.isnan(ydata), axis=1)
+    num_valid = np.sum(valid, axis=1)
+
+    if np.any((num_valid == 0) & ~all_nan):
+        raise IntegrationFailed(None)
+
+    # index of the last valid bin before each bin (-1 if there is none)
+    valid_idx = np.where(valid, levels, -1)
+    prev_idx = np.maximum.accumulate(valid_idx, axis=1)
+    prev_idx = np.concatenate([np.full((num_profiles, 1), -1), prev_idx[:, :-1]], axis=1)
+    # index of the next valid bin after each bin (num_levels if there is none)
+    next_idx = np.where(valid, levels, num_levels)
+    next_idx = np.minimum.accumulate(next_idx[:, ::-1], axis=1)[:, ::-1]
+
+    # cumulative trapezoids between the valid data points
+    prev_x = np.take_along_axis(xdata, np.maximum(prev_idx, 0), axis=1)
+    prev_y = np.take_along_axis(ydata, np.maximum(prev_idx, 0), axis=1)
+    trapz = (xdata - prev_x) * (ydata + prev_y) / 2
+    integral = np.cumsum(np.where(valid & (prev_idx >= 0), trapz, 0), axis=1)
+
+    first_valid = np.argmax(valid, axis=1)[:, np.newaxis]
+    last_valid = num_levels - 1 - np.argmax(valid[:, ::-1], axis=1)[:, np.newaxis]
+    x_first = np.take_along_axis(xdata, first_valid, axis=1)
+    y_first = np.take_along_axis(ydata, first_valid, axis=1)
+    x_last = np.take_along_axis(xdata, last_valid, axis=1)
+    y_last = np.take_along_axis(ydata, last_valid, axis=1)
+    ascending = x_first < x_last
+
+    # add half first bin (covers the integral between x=0 and x[0])
+    # or, if the overlap region is extrapolated towards the ground (at the
+    # beginning of the integration if ascending range axis), the trapezoid between x=0 and x[0]
+    if extrapolate:
+        offset = np.where(ascending,
+                          x_first * (y_first * factor + y_first) / 2,
+                          y_first * x_first / 2)
+    else:
+        offset = y_first * x_first / 2
+    integral = integral + offset
+
+    # interpolate the integral at the positions of the nan values
+    prev_int = np.take_along_axis(integral, np.maximum(prev_idx, 0), axis=1)
+    next_int = np.take_along_axis(integral, np.minimum(next_idx, num_levels - 1), axis=1)
+    next_x = np.take_along_axis(xdata, np.minimum(next_idx, num_levels - 1), axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        result = np.where(valid,
+                          integral,
+                          prev_int + (xdata - prev_x) * (next_int - prev_int) / (next_x - prev_x))
+
+        # before the first and after the last valid bin, the integral is constant,
+        # except towards the extrapolated data point at x=0
+        int_first = np.take_along_axis(integral, first_valid, axis=1)
+        int_last = np.take_along_axis(integral, last_valid, axis=1)
+        if extrapolate:
+            before_first = np.where(ascending, int_first * xdata / x_first, int_first)
+            after_last = np.where(ascending,
+                                  int_last,
+                                  int_last + (xdata - x_last) * (y_last * factor + y_last) / 2)
+        else:
+            before_first = int_first
+            after_last = int_last
+    result = np.where(prev_idx < 0, before_first, result)
+    result = np.where(next_idx >= num_levels, after_last, result)
+
+    # profiles with less than 2 data points cannot be integrated
+    num_points = num_valid + extrapolate
+    result[~in_range | (num_points < 2)[:, np.newaxis] | all_nan[:, np.newaxis]] = np.nan
+
+    result[reverse] = result[reverse, ::-1]
+    return result.reshape(data_shape)
+
+
+def window_gather_indexes(levels, half_win):
+    """column indexes of all bins of windows with the same half width
+
+    Args:
+        levels (ndarray, 1 dimensional): center bins of the windows
+        half_win (int): half width of the windows (the window has 2 * half_win + 1 bins)
+
+    Returns:
+        ndarray (levels.size, 2 * half_win + 1) with the bin indexes of each window
+    """
+    return levels[:, np.newaxis] + np.arange(-half_win, half_win + 1)
+
+
+def sliding_linear_fits(x_data, y_data, window_widths, yerr_data=None, mask=None, block_size=64):
+    """least-squares slopes of sliding windows for complete (time, level) arrays
+
+    For each bin (t, lev), a straight line is fitted to the data within
+    the window [lev - window_widths[t, lev] // 2, lev + window_widths[t, lev] // 2].
+    The window widths may vary from bin to bin. The sums of the normal equations
+    (of w, w*x, w*y, w*x*x, and w*x*y) of all windows are obtained as differences
+    of cumulative sums, therefore, the costs do not depend on the window widths.
+
+    The results are identical to np.polyfit(x, y, 1, w=1/yerr, cov='unscaled')
+    (or w=None if yerr_data is None) applied to each window separately, which corresponds
+    to the equations from numerical recipes which are implemented in the old ELDA.
+    In order to avoid numerical cancellation, the cumulative sums are calculated
+    in blocks of block_size bins (plus the margins of their windows), and x and y
+    are centered within each block.
+
+    The data may have additional leading dimensions, e.g., a stack of Monte-Carlo samples
+    (sample, time, level). All arguments are broadcast against y_data without copying them.
+
+    Args:
+        x_data (ndarray (level) or (..., time, level)): x data (e.g. range axis)
+        y_data (ndarray (..., time, level)): y data
+        window_widths (ndarray of int (..., time, level)): the (odd) number of bins of the fit window of each bin
+        yerr_data (ndarray (..., time, level), optional): absolute errors of y_data.
+                If provided, a weighted fit with weights 1/yerr_data is performed.
+                Default = None => non-weighted fit
+        mask (ndarray of bool (..., time, level), optional): only bins where mask is True are fitted.
+                Bins whose window exceeds the profile are never fitted.
+                Default = None => all bins are fitted
+        block_size (int, optional): number of bins whose windows are summed up together. Default = 64
+
+    Returns:
+        slope, slope_err (ndarray (..., time, level)): slopes and their standard deviations.
+                Bins which are not fitted and windows with nan values are nan
+    """
+    y_data = np.asarray(y_data, dtype=float)
+    shape = y_data.shape
+    x_data = np.broadcast_to(np.asarray(x_data, dtype=float), shape)
+    if yerr_data is not None:
+        yerr_data = np.broadcast_to(np.asarray(yerr_data, dtype=float), shape)
+
+    num_levels = shape[-1]
+    half_win = np.broadcast_to(np.asarray(window_widths).astype(np.int64) // 2, shape)
+    levels = np.arange(num_levels)
+
+    valid = (levels - half_win >= 0) & (levels + half_win < num_levels)
+    if mask is not None:
+        valid = valid & mask
+
+    slope = np.full(shape, np.nan)
+    slope_err = np.full(shape, np.nan)
+    if not np.any(valid):
+        return slope, slope_err
+    max_hw = int(np.max(half_win[valid]))
+
+    def centered(values):
+        # values relative to the mean of their finite values in the block
+        finite = np.isfinite(values)
+        num_finite = np.maximum(np.sum(finite, axis=-1, keepdims=True), 1)
+        return values - np.sum(np.where(finite, values, 0), axis=-1, keepdims=True) / num_finite
+
+    for first in range(0, num_levels, block_size):
+        last = min(first + block_size, num_levels)
+        # all bins of the windows of the bins [first, last)
+        seg_first = max(first - max_hw, 0)
+        seg = slice(seg_first, min(last + max_hw, num_levels))
+
+        dx = centered(x_data[..., seg])
+        dy = centered(y_data[..., seg])
+        if yerr_data is not None:
+            w2 = np.power(yerr_data[..., seg], -2)
+        else:
+            w2 = np.ones(dy.shape)
+        is_nan = ~(np.isfinite(w2) & np.isfinite(dx) & np.isfinite(dy))
+        w2 = np.where(is_nan, 0, w2)
+        dx = np.where(is_nan, 0, dx)
+        dy = np.where(is_nan, 0, dy)
+
+        # the window of bin lev covers the cumulative sums [lev - hw, lev + hw + 1)
+        hw = half_win[..., first:last]
+        lo = np.clip(levels[first:last] - hw - seg_first, 0, dy.shape[-1])
+        hi = np.clip(levels[first:last] + hw + 1 - seg_first, 0, dy.shape[-1])
+
+        def window_sums(values):
+            cum = np.zeros(values.shape[:-1] + (values.shape[-1] + 1,))
+            np.cumsum(values, axis=-1, out=cum[..., 1:])
+            return np.take_along_axis(cum, hi, axis=-1) - np.take_along_axis(cum, lo, axis=-1)
+
+        sw = window_sums(w2)
+        swx = window_sums(w2 * dx)
+        swy = window_sums(w2 * dy)
+        swxx = window_sums(w2 * dx * dx)
+        swxy = window_sums(w2 * dx * dy)
+        fitted = valid[..., first:last] & (window_sums(is_nan) == 0)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            sxx = swxx - swx * swx / sw
+            sxy = swxy - swx * swy / sw
+            slope[..., first:last] = np.where(fitted, sxy / sxx, np.nan)
+            slope_err[..., first:last] = np.where(fitted, np.sqrt(1. / sxx), np.nan)
+
+    return slope, slope_err
+
+
+def sliding_bitwise_or(flags, window_widths, mask=None):
+    """bitwise or of the flags within sliding windows with variable widths
+
+    Args:
+        flags (ndarray of int (time, level)): e.g. quality flags
+        window_widths (ndarray of int (time, level)): the (odd) number of bins of the window of each bin
+        mask (ndarray of bool (time, level), optional): only bins where mask is True are calculated.
+                Default = None => all bins with windows inside the profile are calculated
+
+    Returns:
+        ndarray (time, level): flags combined over the windows. Bins which are not calculated
+                keep their original flag
+    """
+    flags = np.asarray(flags)
+    num_levels = flags.shape[-1]
+    half_win = np.asarray(window_widths).astype(np.int64) // 2
+    levels = np.arange(num_levels)
+
+    valid = (levels - half_win >= 0) & (levels + half_win < num_levels)
+    if mask is not None:
+        valid = valid & mask
+
+    result = flags.copy()
+    for hw in np.unique(half_win[valid]):
+        t_idx, l_idx = np.where(valid & (half_win == hw))
+        cols = window_gather_indexes(l_idx, hw)
+        result[t_idx, l_idx] = np.bitwise_or.reduce(flags[t_idx[:, np.newaxis], cols], axis=1)
+
+    return result
+
+
+def bitwise_or_in_windows(flags, first_bins, last_bins):
+    """bitwise or of the flags within the windows [first_bins, last_bins) of all bins
+
+    All windows with the same width are gathered into one 2-dimensional array
+    and combined at once.
+
+    Args:
+        flags (ndarray of int (time, level)): e.g. cloud mask
+        first_bins (ndarray of int (time, level)): first bin of the window of each bin
+        last_bins (ndarray of int (time, level)): last bin (exclusive) of the window of each bin
+
+    Returns:
+        ndarray (time, level): flags combined over the windows. Empty windows result in 0
+    """
+    flags = np.asarray(flags)
+    first_bins = np.asarray(first_bins).astype(np.int64)
+    widths = np.asarray(last_bins).astype(np.int64) - first_bins
+
+    result = np.zeros_like(flags)
+    for width in np.unique(widths[widths > 0]):
+        t_idx, l_idx = np.where(widths == width)
+        cols = first_bins[t_idx, l_idx][:, np.newaxis] + np.arange(width)
+        result[t_idx, l_idx] = np.bitwise_or.reduce(flags[t_idx[:, np.newaxis], cols], axis=1)
+
+    return result
+
+
+def count_valid_in_windows(valid, window_widths):
+    """number of valid bins within sliding windows with variable widths
+
+    The windows are placed like in xr.DataArray.rolling(level=width, center=True),
+    i.e. the window of bin lev covers [lev - width // 2, lev - width // 2 + width - 1]
+    and is truncated at the ends of the profile.
+    The counts of all window widths are obtained from one cumulative sum of valid.
+
+    Args:
+        valid (ndarray of bool (time, level)): True for valid bins
+        window_widths (ndarray of int (time, level)): the number of bins of the window of each bin
+
+    Returns:
+        ndarray of int (time, level): number of valid bins in the window of each bin
+    """
+    valid = np.asarray(valid, dtype=bool)
+    num_levels = valid.shape[-1]
+    widths = np.asarray(window_widths).astype(np.int64)
+
+    cum_valid = np.zeros(valid.shape[:-1] + (num_levels + 1,), dtype=np.int64)
+    np.cumsum(valid, axis=-1, out=cum_valid[..., 1:])
+
+    first = np.arange(num_levels) - widths // 2
+    behind_last = np.clip(first + widths, 0, num_levels)
+    first = np.clip(first, 0, num_levels)
+
+    return np.take_along_axis(cum_valid, behind_last, axis=-1) - np.take_along_axis(cum_valid, first, axis=-1)
+
+
+def linear_transition(num_levels, bottom_bins, top_bins, low_value, high_value):
+    """profiles which change linearly from low_value to high_value within a transition zone
+
+    The profiles are low_value up to bottom_bins, high_value from top_bins on, and
+    low_value + (high_value - low_value) / (top_bins - bottom_bins) * (level - bottom_bins)
+    in between. If the transition zone is empty, high_value wins.
+
+    Args:
+        num_levels (int): number of levels of the profiles
+        bottom_bins (ndarray of int (time)): first bin of the transition zone of each profile
+        top_bins (ndarray of int (time)): first bin above the transition zone of each profile
+        low_value (float): value below the transition zone
+        high_value (float): value above the transition zone
+
+    Returns:
+        ndarray of float (time, level)
+    """
+    bottom_bins = np.asarray(bottom_bins)[:, np.newaxis]
+    top_bins = np.asarray(top_bins)[:, np.newaxis]
+    levels = np.arange(num_levels)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        delta = (high_value - low_value) / (top_bins - bottom_bins)
+        result = low_value + delta * (levels - bottom_bins)
+    result = np.where(levels <= bottom_bins, low_value, result)
+    result = np.where(levels >= top_bins, high_value, result)
+
+    return result
+
+
+def sliding_filter(data, window_widths, coeffs, err=None, mask=None):
+    """applies filter kernels with variable widths to complete (time, level) arrays
+
+    For each bin (t, lev), the result is sum(data[t, lev - hw:lev + hw + 1] * coeffs(2 * hw + 1))
+    with hw = window_widths[t, lev] // 2. All bins with the same window width are
+    filtered with one call of scipy.ndimage.correlate1d over the range of levels which
+    contains these bins. The errors are propagated as sqrt(sum((err * coeffs)**2)),
+    i.e. the squared errors are correlated with the squared coefficients.
+
+    Args:
+        data (ndarray (time, level)): data to be filtered
+        window_widths (ndarray of int (time, level)): the (odd) number of bins of the window of each bin
+        coeffs (callable): returns the filter coefficients (ndarray (window)) for a window width
+        err (ndarray (time, level), optional): absolute errors of data.
+                Default = None => no error propagation
+        mask (ndarray of bool (time, level), optional): only bins where mask is True are calculated.
+                Bins whose window exceeds the profile are never calculated.
+                Default = None => all bins are calculated
+
+    Returns:
+        data_f, err_f (ndarray (time, level)): filtered data and their errors (None if err is None).
+                Bins which are not calculated are nan
+    """
+    data = np.asarray(data, dtype=float)
+    num_levels = data.shape[-1]
+    half_win = np.asarray(window_widths).astype(np.int64) // 2
+    levels = np.arange(num_levels)
+
+    valid = (levels - half_win >= 0) & (levels + half_win < num_levels)
+    if mask is not None:
+        valid = valid & mask
+
+    data_f = np.full(data.shape, np.nan)
+    if err is not None:
+        sqr_err = np.square(np.asarray(err, dtype=float))
+        err_f = np.full(data.shape, np.nan)
+    else:
+        err_f = None
+
+    for hw in np.unique(half_win[valid]):
+        t_idx, l_idx = np.where(valid & (half_win == hw))
+        kernel = np.asarray(coeffs(2 * hw + 1), dtype=float)
+
+        # only the levels which are needed for these bins are filtered
+        first = l_idx.min() - hw
+        last = l_idx.max() + hw + 1
+        cols = l_idx - first
+
+        filtered = correlate1d(data[:, first:last], kernel, axis=-1, mode='nearest')
+        data_f[t_idx, l_idx] = filtered[t_idx, cols]
+
+        if err is not None:
+            filtered = correlate1d(sqr_err[:, first:last], np.square(kernel), axis=-1, mode='nearest')
+            err_f[t_idx, l_idx] = np.sqrt(filtered[t_idx, cols])
+
+    return data_f, err_f
+
+
 def m_to_km(height):
     return height * 0.001
 